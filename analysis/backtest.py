@@ -0,0 +1,107 @@
+"""
+    @file backtest.py
+    @brief back-testing harness for projection models
+    @author Graham Riches
+    @details
+    For each historical season the engine is cut down to only the seasons before it, the season is projected through
+    StatsEngine.project_stats (or project_stats_batch for batch models), and the projections are compared against the
+    actual results. The projected and actual rows of every season are stacked so the error metrics are computed in one
+    vectorized pass per position.
+"""
+import numpy as np
+import pandas as pd
+from analysis.stats_engine import StatsEngine
+from analysis.metrics import mean_absolute_error, root_mean_squared_error, rank_correlation
+
+
+def collect_projections(engine: StatsEngine, model: callable, seasons: list, categories: list,
+                        batch: bool = False) -> tuple:
+    """
+    project each season from only the prior seasons and pair the projections with the actual results
+    :param engine: stats engine with all the historical data loaded
+    :param model: the projection model
+    :param seasons: the seasons to back-test
+    :param categories: the stat categories to compare
+    :param batch: the model is a batch model for project_stats_batch
+    :return: tuple of (projected, actual, positions, seasons) arrays. Projected and actual are (rows x categories)
+    """
+    projected = list()
+    actual = list()
+    positions = list()
+    season_labels = list()
+    for season in seasons:
+        history = engine.seasons_before(season)
+        if batch:
+            history.project_stats_batch(season, model)
+        else:
+            history.project_stats(season, model)
+        projected_df = history.get_stats_by_year(season)
+        actual_df = engine.get_stats_by_year(season)
+        players = projected_df.index.intersection(actual_df.index)
+        projected.append(projected_df.loc[players, categories].to_numpy(dtype=np.float64))
+        actual.append(actual_df.loc[players, categories].to_numpy(dtype=np.float64))
+        positions.append(actual_df.loc[players, 'position'].to_numpy(dtype=str))
+        season_labels.append(np.full(len(players), season))
+    return np.concatenate(projected), np.concatenate(actual), np.concatenate(positions), np.concatenate(season_labels)
+
+
+def score_projections(projected: np.ndarray, actual: np.ndarray, positions: np.ndarray, categories: list,
+                      per_game: bool = False) -> pd.DataFrame:
+    """
+    compute error metrics per category, overall and per position
+    :param projected: (rows x categories) projected values
+    :param actual: (rows x categories) actual values
+    :param positions: position of each row
+    :param categories: the category names
+    :param per_game: compare per-game rates instead of season totals. Requires games_played in the categories
+    :return: dataframe indexed by (position, category) with mae, rmse, rank_correlation and count columns
+    """
+    if per_game:
+        games = categories.index('games_played')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            projected = projected / projected[:, games, None]
+            actual = actual / actual[:, games, None]
+    groups = [('all', np.ones(len(positions), dtype=bool))]
+    groups += [(position, positions == position) for position in np.unique(positions).tolist()]
+    frames = list()
+    for position, mask in groups:
+        frame = pd.DataFrame({'mae': mean_absolute_error(projected[mask], actual[mask]),
+                              'rmse': root_mean_squared_error(projected[mask], actual[mask]),
+                              'rank_correlation': rank_correlation(projected[mask], actual[mask]),
+                              'count': np.full(len(categories), mask.sum())},
+                             index=pd.MultiIndex.from_product([[position], categories], names=['position', 'category']))
+        frames.append(frame)
+    return pd.concat(frames)
+
+
+def backtest(engine: StatsEngine, model: callable, seasons: list, categories: list, batch: bool = False,
+             per_game: bool = False) -> pd.DataFrame:
+    """
+    back-test a projection model over a set of historical seasons
+    :param engine: stats engine with all the historical data loaded
+    :param model: the projection model
+    :param seasons: the seasons to back-test. Each season is projected from only the seasons before it
+    :param categories: the stat categories to compare
+    :param batch: the model is a batch model for project_stats_batch
+    :param per_game: compare per-game rates instead of season totals
+    :return: dataframe indexed by (position, category) with mae, rmse, rank_correlation and count columns
+    """
+    projected, actual, positions, _ = collect_projections(engine, model, seasons, categories, batch)
+    return score_projections(projected, actual, positions, categories, per_game)
+
+
+if __name__ == '__main__':
+    import json
+    from functools import partial
+    from analysis.projections import batch_weighted_average_with_experience_adjustment
+    with open('config/config.json') as json_file:
+        config = json.loads(str(json_file.read()))
+    engine = StatsEngine(columnar=True, cache_dir='data/.cache')
+    engine.add_skaters_from_csv([2015, 2016, 2017, 2018, 2019], 'data/skaters/basic/{}.csv',
+                                'data/skaters/advanced/{}.csv')
+    engine.drop_by_games_played(25)
+    projection = partial(batch_weighted_average_with_experience_adjustment, 82,
+                         [4.0, 3.0, 2.0, 1.0, 1.0, 1.0],
+                         [1.0, 1.10, 1.15, 1.0, 1.0, 1.0, 1.0])
+    pd.set_option('display.max_rows', None)
+    print(backtest(engine, projection, [2016, 2017, 2018, 2019], config['fantasy_categories'], batch=True))
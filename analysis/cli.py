@@ -0,0 +1,378 @@
+"""
+    @file cli.py
+    @brief command line entry point for the skater and goalie stats pipeline
+    @author Graham Riches
+    @details
+    Subcommands:
+        python -m analysis.cli load                          parse every season into the binary season cache
+        python -m analysis.cli project [--limit N] [--output FILE]
+                                                             project the next season from the loaded seasons
+        python -m analysis.cli rank [--show N] [--snapshot ID]
+                                                             rank every season plus the projection and export them
+        python -m analysis.cli top [--season S] [-n N] [--position P] [--team T]
+                                                             show the best ranked players of a season
+
+    The seasons are discovered from the skater data directory. rank appends a snapshot of the projected season's
+    rankings and projection to the partitioned export directory (see analysis.rankings_export), along with the
+    rankings of any historical season whose data or config changed since it was last exported, and shows the
+    projected top N straight from the ranked frame. Heavy imports (pandas and the stats engine) are deferred until a
+    subcommand needs them: top only memory maps the columns and position partitions it shows from the latest
+    snapshot, and only falls back to running the rank pipeline when the season is missing or was built from different
+    data or config. Parsed seasons are reused from the season cache between runs, and the projection is a memoized
+    registry model (see analysis.models).
+
+    Goalies are loaded from the goalie files of the same seasons, projected with the same model and ranked on the
+    config's goalie categories into the goalie_rankings and goalie_projections datasets, which top reads for
+    --position G. Goalie files that are not goalie stats are skipped with a warning.
+"""
+import argparse
+import os
+import sys
+from analysis.data_files import discover_years, fingerprint, read_config, season_files
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+average_weights = [4.0, 3.0, 2.0, 1.0, 1.0, 1.0]
+progression_weights = [1.0, 1.10, 1.15, 1.0, 1.0, 1.0, 1.0]
+drop_games_played = 25
+export_version = 2  # bump when the ranked or projected columns change, so every season is exported again
+goalie_position = 'G'
+goalie_dataset = 'goalie_rankings'
+
+
+def load_engine(args: argparse.Namespace, years: list):
+    """
+    create a columnar stats engine with every skater season loaded
+    :param args: parsed command line arguments
+    :param years: the seasons to load
+    :return: StatsEngine
+    """
+    from analysis.stats_engine import StatsEngine
+    if not years:
+        raise SystemExit('no skater data found in {}'.format(os.path.join(args.data_dir, 'skaters')))
+    engine = StatsEngine(columnar=True, cache_dir=args.cache_dir)
+    engine.add_skaters_from_csv(years, os.path.join(args.data_dir, 'skaters', 'basic', '{}.csv'),
+                                os.path.join(args.data_dir, 'skaters', 'advanced', '{}.csv'), workers=args.workers)
+    return engine
+
+
+def projection_model():
+    from analysis.models import create_model
+    return create_model('experience_adjusted', games_played=82, average_weights=average_weights,
+                        progression_weights=progression_weights)
+
+
+def projected_engine(args: argparse.Namespace) -> tuple:
+    """
+    load every season, project the next one and drop players that are not in the last season
+    :param args: parsed command line arguments
+    :return: tuple of (StatsEngine, list of seasons including the projected season)
+    """
+    years = discover_years(args.data_dir)
+    engine = load_engine(args, years)
+    engine.drop_by_games_played(drop_games_played)
+    engine.project_stats_batch(years[-1] + 1, projection_model())
+    engine.constrain_by_year(years[-1])
+    return engine, years + [years[-1] + 1]
+
+
+def goalie_years(args: argparse.Namespace, projected: int) -> list:
+    """
+    find the goalie seasons the projected season is built from
+    :param args: parsed command line arguments
+    :param projected: the projected season
+    :return: sorted list of seasons
+    """
+    return sorted(year for year in season_files(os.path.join(args.data_dir, 'goalies')) if year < projected)
+
+
+def project_goalies(args: argparse.Namespace, engine, projected: int) -> list:
+    """
+    load the goalie seasons into an engine and project the goalies for a season. Files that are not goalie stats are
+    skipped with a warning
+    :param args: parsed command line arguments
+    :param engine: the stats engine
+    :param projected: the season to project. Goalies without data from the previous season are not projected
+    :return: list of goalie seasons including the projected season, or an empty list if there is no goalie data
+    """
+    years = goalie_years(args, projected)
+    for year in years:
+        try:
+            engine.add_goalie_from_csv(os.path.join(args.data_dir, 'goalies', '{}.csv'.format(year)), year)
+        except ValueError as error:
+            print('skipping goalie season {}: {}'.format(year, error), file=sys.stderr)
+    if not engine.goalies.size:
+        return list()
+    engine.drop_goalies_by_games_played(drop_games_played)
+    engine.project_goalie_stats(projected, projection_model())
+    return years + [projected]
+
+
+def rank_goalies(engine, season: int, config: dict):
+    """
+    rank the goalies of a season for the export
+    :param engine: the stats engine
+    :param season: the season to rank
+    :param config: the analysis config
+    :return: dataframe with a G position column, sorted from best to worst. Empty if the season has no goalies
+    """
+    if engine.goalies.row_mask(season=season).any():
+        ranking = engine.rank_goalies(season, config['goalie_categories'], config['goalie_inverted_categories'])
+    else:
+        ranking = engine.get_goalie_stats_by_year(season)
+    ranking = ranking.drop(columns='player_name')
+    ranking.insert(0, 'position', goalie_position)
+    return ranking
+
+
+def load_command(args: argparse.Namespace) -> int:
+    years = discover_years(args.data_dir)
+    engine = load_engine(args, years)
+    print('loaded {} player seasons for seasons {}'.format(int(engine.store.any_valid().sum()),
+                                                          ', '.join(str(year) for year in years)))
+    return 0
+
+
+def project_command(args: argparse.Namespace) -> int:
+    config = read_config(args.config)
+    engine, seasons = projected_engine(args)
+    season = seasons[-1]
+    if args.output is not None:
+        engine.get_stats_by_year(season).to_csv(args.output)
+    projected = engine.query(season).select('position', 'team', *config['fantasy_categories']) \
+        .sort('pts').collect()
+    header = ['player_name'] + list(projected.columns)
+    rows = [[name] + [str(value) for value in values] for name, values in
+            zip(projected.index[:args.limit], projected.to_numpy()[:args.limit].tolist())]
+    print('projected {} season for {} players'.format(season, len(projected)))
+    print_table(header, rows)
+    return 0
+
+
+def rank_command(args: argparse.Namespace) -> int:
+    from analysis.rankings_export import write_partitions, snapshot_id
+    config = read_config(args.config)
+    engine, seasons = projected_engine(args)
+    goalie_seasons = project_goalies(args, engine, seasons[-1])
+    inputs = {(dataset, season): ranking_inputs(args, dataset, season, years[:-1])
+              for dataset, years in (('rankings', seasons), (goalie_dataset, goalie_seasons)) for season in years}
+    # historical seasons are only exported again when their inputs change, the projection is always exported
+    changed = {dataset: [season for season in years[:-1] if exported_inputs(args, dataset, season) !=
+                         inputs[(dataset, season)]] + years[-1:]
+               for dataset, years in (('rankings', seasons), (goalie_dataset, goalie_seasons))}
+    display = list(config['display_categories'])
+    if 'team' not in display:
+        display.append('team')
+    rankings = engine.rank_seasons(changed['rankings'], config['stats_categories'], display,
+                                   config['fantasy_categories'], config['positional_adjustments'], workers=args.workers)
+    snapshot = args.snapshot or snapshot_id()
+    for season, ranking in rankings.items():
+        write_partitions(ranking, args.export_dir, 'rankings', season, snapshot, inputs[('rankings', season)])
+    write_partitions(engine.get_stats_by_year(seasons[-1]), args.export_dir, 'projections', seasons[-1], snapshot,
+                     inputs[('rankings', seasons[-1])])
+    for season in changed[goalie_dataset]:
+        write_partitions(rank_goalies(engine, season, config), args.export_dir, goalie_dataset, season, snapshot,
+                         inputs[(goalie_dataset, season)])
+    if goalie_seasons:
+        projected = engine.get_goalie_stats_by_year(seasons[-1]).drop(columns='player_name')
+        projected.insert(0, 'position', goalie_position)
+        write_partitions(projected, args.export_dir, 'goalie_projections', seasons[-1], snapshot,
+                         inputs[(goalie_dataset, seasons[-1])])
+    for dataset in ('rankings', goalie_dataset):
+        if changed[dataset]:
+            print('exported snapshot {} of {} seasons {} to {}'.format(
+                snapshot, dataset, ', '.join(str(season) for season in changed[dataset]), args.export_dir))
+    if args.show:
+        from analysis.colors import TerminalColors
+        print('\n\n' + TerminalColors.BLUE + 'Projected {}/{} stats ...\n'.format(seasons[-1], seasons[-1] + 1) +
+              TerminalColors.END)
+        ranking = rankings[seasons[-1]]
+        data = {column: ranking[column].to_numpy() for column in ranking.columns}
+        data['player_name'] = ranking.index.to_numpy()
+        show_top(args, data, args.show)
+    return 0
+
+
+def ranking_inputs(args: argparse.Namespace, dataset: str, season: int, years: list) -> str:
+    """
+    fingerprint the files the rankings of a season are built from. Skater rankings of a historical season are built
+    from the config, the season's skater files and the last season's skater files, which decide the players that are
+    kept. Goalie rankings of a historical season are built from the config and the season's goalie file. A projected
+    season is built from every season
+    :param args: parsed command line arguments
+    :param dataset: 'rankings' or 'goalie_rankings'
+    :param season: the ranked season
+    :param years: the loaded seasons
+    :return: hex digest
+    """
+    projected = season > years[-1]
+    if dataset == goalie_dataset:
+        files = [os.path.join(args.data_dir, 'goalies', '{}.csv'.format(year)) for year in
+                 (years if projected else [season])]
+    else:
+        files = [os.path.join(args.data_dir, 'skaters', kind, '{}.csv'.format(year)) for year in
+                 (years if projected else sorted({season, years[-1]})) for kind in ('basic', 'advanced')]
+    return fingerprint([args.config] + files, export_version)
+
+
+def exported_inputs(args: argparse.Namespace, dataset: str, season: int) -> str:
+    """
+    get the input fingerprint of the latest exported rankings of a season
+    :param args: parsed command line arguments
+    :param dataset: 'rankings' or 'goalie_rankings'
+    :param season: the ranked season
+    :return: hex digest, or None if the season has not been exported
+    """
+    from analysis.rankings_export import latest_manifest
+    manifest = latest_manifest(args.export_dir, dataset, season)
+    return None if manifest is None else manifest.get('inputs')
+
+
+def stale(args: argparse.Namespace, dataset: str, season: int) -> bool:
+    """
+    check if the exported rankings of a season are missing or were built from different data or config
+    :param args: parsed command line arguments
+    :param dataset: 'rankings' or 'goalie_rankings'
+    :param season: the ranked season
+    :return: True if the rankings need to be rebuilt
+    """
+    years = discover_years(args.data_dir)
+    if years and dataset == goalie_dataset:
+        years = goalie_years(args, years[-1] + 1)
+    exported = exported_inputs(args, dataset, season)
+    if not years:
+        return exported is None
+    return exported is None or exported != ranking_inputs(args, dataset, season, years)
+
+
+def top_command(args: argparse.Namespace) -> int:
+    from analysis.rankings_export import exported_seasons, partitions, read_columns
+    season = args.season
+    if season is None:
+        years = discover_years(args.data_dir)
+        season = years[-1] + 1 if years else max(exported_seasons(args.export_dir, 'rankings'), default=None)
+    if season is None:
+        raise SystemExit('no rankings or skater data found')
+    dataset = goalie_dataset if args.position == goalie_position else 'rankings'
+    if stale(args, dataset, season):
+        args.show = 0
+        args.snapshot = None
+        rank_command(args)
+    columns = display_columns(args)
+    filters = [column for column, value in (('position', args.position), ('team', args.team)) if value is not None]
+    if args.position is not None and not partitions(args.export_dir, dataset, [season], [args.position]):
+        print('no {} rankings for season {}'.format(args.position, season))
+        return 0
+    try:
+        data = read_columns(args.export_dir, dataset, [season], None if args.position is None else [args.position],
+                            list(dict.fromkeys(columns + filters)))
+    except KeyError as error:
+        raise SystemExit(error.args[0])
+    if not len(data['player_name']):
+        raise SystemExit('no rankings for season {}'.format(season))
+    show_top(args, data, args.n)
+    return 0
+
+
+def display_columns(args: argparse.Namespace) -> list:
+    if args.columns:
+        return args.columns
+    config = read_config(args.config)
+    if getattr(args, 'position', None) == goalie_position:
+        return ['team'] + config['goalie_categories'] + ['fantasy_points_z']
+    return ['position'] + config['fantasy_categories'] + ['fantasy_points_z']
+
+
+def show_top(args: argparse.Namespace, data: dict, n: int) -> None:
+    """
+    print the first n players of a ranking that match the position and team filters
+    :param args: parsed command line arguments
+    :param data: dictionary of column -> array with a player_name column. Rows are stored from best to worst
+    :param n: the number of players to show
+    :return: None
+    """
+    columns = display_columns(args)
+    position = getattr(args, 'position', None)
+    team = getattr(args, 'team', None)
+    missing = [column for column in columns if column not in data]
+    missing += [column for column, value in (('position', position), ('team', team))
+                if value is not None and column not in data]
+    if missing:
+        raise SystemExit('unknown columns {}'.format(', '.join(missing)))
+    rows = list()
+    for idx, name in enumerate(data['player_name']):
+        if position is not None and position not in str(data['position'][idx]).split('/'):
+            continue
+        if team is not None and str(data['team'][idx]) != team:
+            continue
+        rows.append([str(name)] + [format_value(str(data[column][idx])) for column in columns])
+        if len(rows) >= n:
+            break
+    print_table(['player_name'] + columns, rows)
+
+
+def format_value(value: str) -> str:
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    return str(int(number)) if number.is_integer() else '{:.3f}'.format(number)
+
+
+def print_table(header: list, rows: list) -> None:
+    widths = [max([len(str(column))] + [len(str(row[idx])) for row in rows]) for idx, column in enumerate(header)]
+    line = '{:>4}  ' + '  '.join('{{:<{}}}'.format(width) if idx == 0 else '{{:>{}}}'.format(width)
+                                 for idx, width in enumerate(widths))
+    print(line.format('', *header))
+    for rank, row in enumerate(rows, start=1):
+        print(line.format(rank, *row))
+
+
+def parser() -> argparse.ArgumentParser:
+    """
+    build the command line parser
+    :return: argument parser
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', default=os.path.join(repo_root, 'config', 'config.json'))
+    common.add_argument('--data-dir', default=os.path.join(repo_root, 'data'))
+    common.add_argument('--cache-dir', default=os.path.join(repo_root, 'data', '.cache'),
+                        help='binary cache of parsed season files')
+    common.add_argument('--export-dir', default=os.path.join(repo_root, 'data', 'exports'),
+                        help='partitioned rankings and projections snapshots')
+    common.add_argument('--workers', type=int, default=None, help='number of parser processes and writer threads')
+
+    arguments = argparse.ArgumentParser(prog='python -m analysis.cli', description='NHL fantasy stats pipeline')
+    commands = arguments.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('load', parents=[common], help='parse every season into the season cache')
+    load.set_defaults(run=load_command)
+    project = commands.add_parser('project', parents=[common], help='project the next season')
+    project.add_argument('--limit', type=int, default=25, help='number of projected players to show')
+    project.add_argument('--output', default=None, help='csv file for the full projected season')
+    project.set_defaults(run=project_command)
+    rank = commands.add_parser('rank', parents=[common], help='rank every season and write the rankings')
+    rank.add_argument('--show', type=int, default=0, help='show the top N of the projected season')
+    rank.add_argument('--columns', nargs='*', default=None, help='columns to show')
+    rank.add_argument('--snapshot', default=None, help='snapshot identifier. Defaults to the current UTC time')
+    rank.set_defaults(run=rank_command)
+    top = commands.add_parser('top', parents=[common], help='show the best ranked players of a season')
+    top.add_argument('--season', type=int, default=None, help='defaults to the projected season')
+    top.add_argument('-n', type=int, default=100, help='number of players to show')
+    top.add_argument('--position', default=None)
+    top.add_argument('--team', default=None)
+    top.add_argument('--columns', nargs='*', default=None, help='columns to show')
+    top.set_defaults(run=top_command)
+    return arguments
+
+
+def main(argv: list = None) -> int:
+    """
+    run a subcommand
+    :param argv: command line arguments. Defaults to sys.argv
+    :return: exit code
+    """
+    args = parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
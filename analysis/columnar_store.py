@@ -0,0 +1,330 @@
+"""
+    @file columnar_store.py
+    @brief columnar, numpy backed storage for per season player stats
+    @author Graham Riches
+    @details
+    Player seasons are stored as rows in a set of contiguous typed arrays (one array per stat field) instead of
+    per-player dictionaries of stats objects. Each row is keyed by (player_id, season) and player names are interned
+    into a shared string table. String stat fields (team, position, etc.) are stored as integer codes into their own
+    interned tables so every column stays a flat numeric array.
+"""
+import numpy as np
+import pandas as pd
+
+
+class StringTable:
+    """
+    Interned table of strings. Each unique string is assigned a stable integer code in order of first appearance.
+    """
+    def __init__(self, values: list = None):
+        """
+        create a new string table
+        :param values: optional initial values (assumed to be unique)
+        """
+        self.values = list(values) if values is not None else list()
+        self.index = {value: code for code, value in enumerate(self.values)}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def intern(self, value: str) -> int:
+        """
+        get the code for a string, adding it to the table if it does not exist
+        :param value: the string to intern
+        :return: integer code
+        """
+        code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.index[value] = code
+            self.values.append(value)
+        return code
+
+    def intern_many(self, values) -> np.ndarray:
+        """
+        intern a collection of strings
+        :param values: sequence of strings
+        :return: array of integer codes
+        """
+        values = np.asarray(values, dtype=str)
+        if len(values) == 0:
+            return np.zeros(0, dtype=np.int32)
+        unique, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+        # intern in order of first appearance so codes stay stable regardless of sort order
+        codes = np.zeros(len(unique), dtype=np.int32)
+        for idx in np.argsort(first):
+            codes[idx] = self.intern(str(unique[idx]))
+        return codes[inverse.ravel()]
+
+    def lookup(self, codes: np.ndarray) -> np.ndarray:
+        """
+        decode an array of codes back into strings
+        :param codes: integer codes
+        :return: object array of strings
+        """
+        return np.asarray(self.values, dtype=object)[codes]
+
+
+class ColumnarStore:
+    """
+    Columnar player season storage. Rows are (player_id, season) pairs and each stats kind (i.e. basic, advanced) has
+    a validity mask marking which rows contain data for that kind.
+    """
+    dtypes = {int: np.int64, float: np.float64, str: np.int32}
+
+    def __init__(self, schemas: dict, capacity: int = 1024):
+        """
+        create a new columnar store
+        :param schemas: dictionary of stats kind -> stats type. Each stats type must declare class level fields and types
+        :param capacity: initial row capacity. The arrays grow geometrically as rows are added
+        """
+        self.schemas = schemas
+        self.field_types = dict()
+        for kind, schema in schemas.items():
+            for field, field_type in zip(schema.fields, schema.types):
+                if field in self.field_types:
+                    raise ValueError('field {} is declared by more than one stats kind'.format(field))
+                self.field_types[field] = field_type
+        self.names = StringTable()
+        self.strings = {field: StringTable() for field, field_type in self.field_types.items() if field_type is str}
+        self.size = 0
+        self.player_id = np.zeros(capacity, dtype=np.int32)
+        self.season = np.zeros(capacity, dtype=np.int32)
+        self.valid = {kind: np.zeros(capacity, dtype=bool) for kind in schemas}
+        self.columns = {field: np.zeros(capacity, dtype=self.dtypes[field_type])
+                        for field, field_type in self.field_types.items()}
+
+    @property
+    def capacity(self) -> int:
+        return len(self.player_id)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        total number of bytes used by the row arrays
+        :return: byte count
+        """
+        arrays = [self.player_id, self.season, *self.valid.values(), *self.columns.values()]
+        return sum(array.nbytes for array in arrays)
+
+    def _arrays(self) -> dict:
+        """
+        get all row-aligned arrays keyed by a unique name
+        :return: dictionary of arrays
+        """
+        arrays = {'player_id': self.player_id, 'season': self.season}
+        arrays.update({'valid_{}'.format(kind): mask for kind, mask in self.valid.items()})
+        arrays.update(self.columns)
+        return arrays
+
+    def _set_arrays(self, arrays: dict) -> None:
+        """
+        replace the row-aligned arrays from a dictionary produced by _arrays
+        :param arrays: dictionary of arrays
+        :return: None
+        """
+        self.player_id = arrays['player_id']
+        self.season = arrays['season']
+        self.valid = {kind: arrays['valid_{}'.format(kind)] for kind in self.schemas}
+        self.columns = {field: arrays[field] for field in self.field_types}
+
+    def _reserve(self, rows: int) -> None:
+        """
+        make sure the store has room for a number of rows and that its arrays can be written. Read-only arrays (i.e.
+        mapped from a shared snapshot) are copied on the first write, so the snapshot itself is never modified
+        :param rows: the total number of rows required
+        :return: None
+        """
+        writeable = all(array.flags.writeable for array in self._arrays().values())
+        if rows <= self.capacity and writeable:
+            return
+        capacity = max(rows, 2 * self.capacity) if rows > self.capacity else self.capacity
+        grown = dict()
+        for key, array in self._arrays().items():
+            new_array = np.zeros(capacity, dtype=array.dtype)
+            new_array[:self.size] = array[:self.size]
+            grown[key] = new_array
+        self._set_arrays(grown)
+
+    def _rows_for(self, season: int, player_ids: np.ndarray) -> np.ndarray:
+        """
+        get the row index for each player in a season, allocating new rows for players without one
+        :param season: the season
+        :param player_ids: array of player ids
+        :return: array of row indices aligned with player_ids
+        """
+        lookup = np.full(len(self.names), -1, dtype=np.int64)
+        existing = np.flatnonzero(self.season[:self.size] == season)
+        lookup[self.player_id[existing]] = existing
+        rows = lookup[player_ids]
+        missing = player_ids[rows < 0]
+        _, first = np.unique(missing, return_index=True)
+        new_players = missing[np.sort(first)]
+        self._reserve(self.size + len(new_players))
+        if len(new_players):
+            new_rows = np.arange(self.size, self.size + len(new_players))
+            self.player_id[new_rows] = new_players
+            self.season[new_rows] = season
+            self.size += len(new_players)
+            lookup[new_players] = new_rows
+            rows = lookup[player_ids]
+        return rows
+
+    def add_records(self, kind: str, season: int, names: list, values: dict) -> None:
+        """
+        add a batch of player records for one stats kind and season. Existing (player, season) rows are updated in place
+        and when a player appears more than once the last record wins.
+        :param kind: the stats kind (key into the schemas)
+        :param season: the season of the data
+        :param names: list of player names
+        :param values: dictionary of field -> sequence of typed values aligned with names
+        :return: None
+        """
+        columns = dict()
+        for field in self.schemas[kind].fields:
+            if field in self.strings:
+                columns[field] = self.strings[field].intern_many(values[field])
+            else:
+                columns[field] = values[field]
+        self.set_rows(kind, season, self.names.intern_many(names), columns)
+
+    def set_rows(self, kind: str, season: int, player_ids: np.ndarray, columns: dict) -> None:
+        """
+        write encoded column data for a set of players in one season
+        :param kind: the stats kind (key into the schemas)
+        :param season: the season of the data
+        :param player_ids: array of player ids
+        :param columns: dictionary of field -> array aligned with player_ids. String fields must already be encoded
+        :return: None
+        """
+        rows = self._rows_for(season, player_ids)
+        for field in self.schemas[kind].fields:
+            self.columns[field][rows] = columns[field]
+        self.valid[kind][rows] = True
+
+    def games_kind(self) -> str:
+        """
+        get the stats kind that holds the games_played field
+        :return: the stats kind
+        """
+        return next(kind for kind, schema in self.schemas.items() if 'games_played' in schema.fields)
+
+    def history_tensor(self, kind: str, fields: list, players_in: int = None, before: int = None) -> tuple:
+        """
+        gather every player's seasons for a stats kind into a dense (players x seasons x fields) tensor of per-game
+        values. Seasons are sorted from newest to oldest and packed to the front of the seasons axis. Only seasons with
+        games played data are gathered.
+        :param kind: the stats kind to gather
+        :param fields: numeric fields to gather
+        :param players_in: optional season that players must have data in to be included
+        :param before: optional season to cut the history at. Only seasons before it are gathered
+        :return: tuple of (player_ids, tensor, mask, rows) where mask flags the valid (player, season) entries and rows
+                 holds the store row of each entry (-1 where invalid)
+        """
+        valid = self.valid[kind][:self.size] & self.valid[self.games_kind()][:self.size]
+        if before is not None:
+            valid = valid & (self.season[:self.size] < before)
+        valid = np.flatnonzero(valid)
+        valid = valid[np.lexsort((-self.season[valid], self.player_id[valid]))]
+        player_ids = self.player_id[valid]
+        if players_in is not None:
+            eligible = np.zeros(len(self.names), dtype=bool)
+            eligible[player_ids[self.season[valid] == players_in]] = True
+            valid = valid[eligible[player_ids]]
+            player_ids = player_ids[eligible[player_ids]]
+        new_player = np.ones(len(valid), dtype=bool)
+        new_player[1:] = player_ids[1:] != player_ids[:-1]
+        starts = np.flatnonzero(new_player)
+        group = np.cumsum(new_player) - 1
+        depth = np.arange(len(valid)) - starts[group]
+        n_seasons = depth.max() + 1 if len(valid) else 0
+        rows = np.full((len(starts), n_seasons), -1, dtype=np.int64)
+        rows[group, depth] = valid
+        mask = rows >= 0
+        tensor = np.zeros((len(starts), n_seasons, len(fields)), dtype=np.float64)
+        games = self.columns['games_played'][valid].astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for idx, field in enumerate(fields):
+                tensor[group, depth, idx] = self.columns[field][valid] / games
+        return player_ids[starts], tensor, mask, rows
+
+    def row_mask(self, season: int = None, kinds: tuple = None) -> np.ndarray:
+        """
+        get a boolean mask of rows that contain data for all requested kinds
+        :param season: optional season to restrict to
+        :param kinds: stats kinds that must be present. Defaults to all kinds
+        :return: boolean mask over the used rows
+        """
+        kinds = self.schemas.keys() if kinds is None else kinds
+        mask = np.ones(self.size, dtype=bool)
+        for kind in kinds:
+            mask &= self.valid[kind][:self.size]
+        if season is not None:
+            mask &= self.season[:self.size] == season
+        return mask
+
+    def any_valid(self) -> np.ndarray:
+        """
+        get a mask of rows that contain data for at least one kind
+        :return: boolean mask over the used rows
+        """
+        mask = np.zeros(self.size, dtype=bool)
+        for valid in self.valid.values():
+            mask |= valid[:self.size]
+        return mask
+
+    def seasons(self) -> list:
+        """
+        get all the seasons contained in the store
+        :return: sorted list of seasons
+        """
+        return np.unique(self.season[:self.size]).tolist()
+
+    def drop_rows(self, mask: np.ndarray) -> None:
+        """
+        remove a set of rows from the store
+        :param mask: boolean mask over the used rows. True rows are removed
+        :return: None
+        """
+        keep = np.flatnonzero(~mask)
+        self._set_arrays({key: array[keep] for key, array in self._arrays().items()})
+        self.size = len(keep)
+
+    def copy(self, mask: np.ndarray = None) -> 'ColumnarStore':
+        """
+        copy the store, optionally keeping only a subset of rows. Player ids and string codes are preserved.
+        :param mask: optional boolean mask over the used rows. True rows are kept
+        :return: new columnar store
+        """
+        keep = np.arange(self.size) if mask is None else np.flatnonzero(mask)
+        store = ColumnarStore(self.schemas, capacity=0)
+        store.names = StringTable(self.names.values)
+        store.strings = {field: StringTable(table.values) for field, table in self.strings.items()}
+        store._set_arrays({key: array[keep] for key, array in self._arrays().items()})
+        store.size = len(keep)
+        return store
+
+    def decode(self, field: str, rows: np.ndarray) -> np.ndarray:
+        """
+        get the values of a field for a set of rows, decoding interned strings
+        :param field: the field name
+        :param rows: row indices
+        :return: array of values
+        """
+        if field in self.strings:
+            return self.strings[field].lookup(self.columns[field][rows])
+        return self.columns[field][rows]
+
+    def frame(self, rows: np.ndarray, fields: list) -> pd.DataFrame:
+        """
+        build a dataframe from a set of rows indexed by player name
+        :param rows: row indices
+        :param fields: fields to include as columns
+        :return: dataframe with a player_name column followed by the requested fields
+        """
+        names = self.names.lookup(self.player_id[rows])
+        data = {'player_name': names}
+        data.update({field: self.decode(field, rows) for field in fields})
+        record = pd.DataFrame(data)
+        record.index = record['player_name']
+        return record
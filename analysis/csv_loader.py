@@ -0,0 +1,160 @@
+"""
+    @file csv_loader.py
+    @brief bulk csv loader that parses whole season files into typed columns
+    @author Graham Riches
+    @details
+    Each season file is parsed once with the csv module (so quoted fields and thousands separators are handled) and
+    the rows are transposed into one numpy array per stat field. Leading byte order marks and grouped multi-row headers
+    are skipped. Many season files can be loaded concurrently with load_seasons.
+"""
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from analysis.stats_types import BasicSkaterStats, AdvancedSkaterStats, GoalieStats
+
+
+class SeasonLayout:
+    """
+    Describes where the player name and each stat field live in the columns of a season file
+    """
+    def __init__(self, stats_type: type, name_column: int, field_columns: list, name_separator: str = None,
+                 header: list = None):
+        """
+        create a new season file layout
+        :param stats_type: the stats type with class level fields and types
+        :param name_column: column index of the player name
+        :param field_columns: column index of each field in stats_type.fields
+        :param name_separator: optional separator to strip player ids from names (i.e. 'Player\\playerid')
+        :param header: optional expected header row. Files with a different header are rejected
+        """
+        self.stats_type = stats_type
+        self.name_column = name_column
+        self.field_columns = field_columns
+        self.name_separator = name_separator
+        self.header = header
+
+
+layouts = {
+    'basic': SeasonLayout(BasicSkaterStats, 0, list(range(1, 1 + len(BasicSkaterStats.fields)))),
+    'advanced': SeasonLayout(AdvancedSkaterStats, 1, [2] + list(range(6, 6 + len(AdvancedSkaterStats.fields) - 1)),
+                             name_separator='\\'),
+    'goalie': SeasonLayout(GoalieStats, 0, list(range(1, 1 + len(GoalieStats.fields))),
+                           header=['Player Name', 'Team', 'Games', 'W', 'L', 'OTL', 'GAA', 'GA', 'SA', 'SV', 'SV%',
+                                   'SO', 'MIN']),
+}
+
+
+class ParsedSeason:
+    """
+    A single parsed season file: a list of player names and a dictionary of typed column arrays
+    """
+    def __init__(self, names: list, columns: dict):
+        """
+        :param names: list of player names
+        :param columns: dictionary of field -> numpy array aligned with names
+        """
+        self.names = names
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def records(self, fields: list) -> list:
+        """
+        get the season as row records
+        :param fields: the fields to include in each record
+        :return: list of (player_name, [values]) tuples with native python values
+        """
+        values = [self.columns[field].tolist() for field in fields]
+        return list(zip(self.names, map(list, zip(*values))))
+
+
+def read_rows(filename: str) -> tuple:
+    """
+    read all the rows of a csv file, skipping any byte order mark and grouped header rows. The header is taken as the
+    first row with a non-empty first cell, and blank or repeated header rows in the body are dropped.
+    :param filename: the file to read
+    :return: tuple of (header, rows)
+    """
+    with open(filename, 'r', encoding='utf-8-sig', newline='') as file:
+        reader = csv.reader(file)
+        header = None
+        for row in reader:
+            if row and row[0].strip():
+                header = row
+                break
+        if header is None:
+            return list(), list()
+        rows = [row for row in reader if any(row) and row != header]
+    return header, rows
+
+
+def convert_column(values: list, field_type: type) -> np.ndarray:
+    """
+    convert a column of strings into a typed array. Values that fail to convert take the default value of the type
+    (0, 0.0, '') to match the stats types.
+    :param values: sequence of strings
+    :param field_type: the python type of the column
+    :return: numpy array
+    """
+    if field_type is str:
+        return np.asarray(values, dtype=str)
+    dtype = np.int64 if field_type is int else np.float64
+    try:
+        return np.array(values, dtype=dtype)
+    except ValueError:
+        converted = list()
+        for value in values:
+            try:
+                converted.append(field_type(value.replace(',', '')))
+            except ValueError:
+                converted.append(field_type())
+        return np.array(converted, dtype=dtype)
+
+
+def load_season(filename: str, kind: str) -> ParsedSeason:
+    """
+    parse a whole season file into typed columns
+    :param filename: the csv file to read
+    :param kind: the layout of the file (key into layouts)
+    :return: parsed season
+    """
+    layout = layouts[kind]
+    header, rows = read_rows(filename)
+    if layout.header is not None and header[:len(layout.header)] != layout.header:
+        raise ValueError('{} does not look like a {} stats file. Header: {}'.format(filename, kind, ','.join(header)))
+    width = max([layout.name_column] + layout.field_columns) + 1
+    rows = [row + [''] * (width - len(row)) if len(row) < width else row for row in rows]
+    cells = list(zip(*rows)) if rows else [()] * width
+    names = list(cells[layout.name_column])
+    if layout.name_separator is not None:
+        names = [name.split(layout.name_separator)[0] for name in names]
+    columns = dict()
+    for field, field_type, column in zip(layout.stats_type.fields, layout.stats_type.types, layout.field_columns):
+        columns[field] = convert_column(cells[column], field_type)
+    return ParsedSeason(names, columns)
+
+
+def _load_job(job: tuple) -> ParsedSeason:
+    kind, year, filename = job
+    return load_season(filename, kind)
+
+
+def load_seasons(jobs: list, workers: int = None, processes: bool = True) -> list:
+    """
+    load many season files concurrently
+    :param jobs: list of (kind, year, filename) tuples
+    :param workers: number of workers. Defaults to one per job up to the cpu count
+    :param processes: use a process pool (parsing is interpreter bound) instead of a thread pool
+    :return: list of (kind, year, ParsedSeason) tuples in the same order as the jobs
+    """
+    if not jobs:
+        return list()
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    if workers == 1:
+        return [(kind, year, load_season(filename, kind)) for kind, year, filename in jobs]
+    executor_type = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_type(max_workers=workers) as executor:
+        seasons = list(executor.map(_load_job, jobs))
+    return [(kind, year, season) for (kind, year, filename), season in zip(jobs, seasons)]
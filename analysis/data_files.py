@@ -0,0 +1,64 @@
+"""
+    @file data_files.py
+    @brief discovery of the per-season data files and the analysis config
+    @author Graham Riches
+    @details
+    The data directory holds one csv per season: skaters/basic/{year}.csv, skaters/advanced/{year}.csv and
+    goalies/{year}.csv. These helpers only use the standard library so the command line entry point can import them
+    without loading numpy or pandas.
+"""
+import hashlib
+import json
+import os
+
+
+def season_files(directory: str) -> dict:
+    """
+    find the per-season csv files in a directory
+    :param directory: the directory to search
+    :return: dictionary of season -> file path
+    """
+    if not os.path.isdir(directory):
+        return dict()
+    files = dict()
+    for file in os.listdir(directory):
+        name, extension = os.path.splitext(file)
+        if extension == '.csv' and name.isdigit():
+            files[int(name)] = os.path.join(directory, file)
+    return files
+
+
+def discover_years(data_dir: str) -> list:
+    """
+    find the seasons that have both basic and advanced skater data
+    :param data_dir: the data directory
+    :return: sorted list of seasons
+    """
+    basic = season_files(os.path.join(data_dir, 'skaters', 'basic'))
+    advanced = season_files(os.path.join(data_dir, 'skaters', 'advanced'))
+    return sorted(set(basic) & set(advanced))
+
+
+def read_config(path: str) -> dict:
+    with open(path) as json_file:
+        return json.loads(str(json_file.read()))
+
+
+def fingerprint(files: list, version: int = 1) -> str:
+    """
+    hash the contents of a set of input files, i.e. to check if an output built from them is out of date
+    :param files: the input files, in a fixed order. Missing files are hashed as missing
+    :param version: version of the output format, so a change to how the output is built also changes the fingerprint
+    :return: hex digest
+    """
+    digest = hashlib.blake2b(str(version).encode(), digest_size=16)
+    for filename in files:
+        if not os.path.exists(filename):
+            digest.update(b'missing')
+            continue
+        content = hashlib.blake2b(digest_size=16)
+        with open(filename, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                content.update(block)
+        digest.update(content.digest())
+    return digest.hexdigest()
@@ -0,0 +1,329 @@
+"""
+    @file draft.py
+    @brief live draft tracking and Monte Carlo mock drafts
+    @author Graham Riches
+    @details
+    The DraftEngine tracks the taken players and each team's open roster slots, and after every pick re-values the
+    remaining pool. Values are z-scores over the players still available (the calculate_z_score_rankings definition,
+    (value - mean) / games_played / std) weighted by the positional adjustments, less the replacement level of the
+    player's position: the value of the last player at that position who would still be drafted into the open slots.
+
+    The pool moments are kept as running sums (SeasonMoments), so a pick only subtracts one row. The per-player terms
+    that do not depend on the pool are precomputed, so re-valuing the pool is two (players x categories) products:
+        value = (weights * stats / games) @ (1 / std) - (weights / games) @ (mean / std)
+    A pick plus a full re-value and best pick search takes around 0.1ms for a few hundred players.
+"""
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from analysis.stats_engine import StatsEngine
+from analysis.incremental_rankings import SeasonMoments
+
+# roster slots that any skater can fill
+flex_slots = ('UTIL', 'BN')
+
+
+class DraftEngine:
+    def __init__(self, rankings: pd.DataFrame, categories: list, adjustments: dict, roster_slots: dict, teams: int):
+        """
+        create a new draft
+        :param rankings: dataframe indexed by player name with position, games_played and the category columns, i.e.
+               from StatsEngine.rank_by_year
+        :param categories: the fantasy categories
+        :param adjustments: dictionary of position -> list of category weights (see config/config.json)
+        :param roster_slots: dictionary of slot -> count per team, i.e. {"C": 2, "D": 4, "UTIL": 1, "BN": 4}.
+               Position slots take players eligible at that position and flex slots (UTIL, BN) take anyone
+        :param teams: the number of teams. Picks follow a snake order
+        """
+        self.players = rankings.index.to_numpy()
+        self.categories = list(categories)
+        self.teams = teams
+        self.slots = list(roster_slots.keys())
+        self.slot_counts = np.array([roster_slots[slot] for slot in self.slots], dtype=np.int64)
+        self.rounds = int(self.slot_counts.sum())
+        positions = rankings['position'].to_numpy(dtype=str)
+        self.positions = positions
+        # (players x slots) eligibility
+        self.eligible = np.zeros((len(positions), len(self.slots)), dtype=bool)
+        for idx, slot in enumerate(self.slots):
+            self.eligible[:, idx] = True if slot in flex_slots else [slot in position.split('/')
+                                                                      for position in positions.tolist()]
+        self.position_slots = [idx for idx, slot in enumerate(self.slots) if slot not in flex_slots]
+        # picks fill position slots before flex slots
+        self.slot_order = np.array(self.position_slots + [idx for idx, slot in enumerate(self.slots)
+                                                          if slot in flex_slots], dtype=np.int64)
+
+        self.stats = rankings.loc[:, self.categories].to_numpy(dtype=np.float64)
+        games = rankings['games_played'].to_numpy(dtype=np.float64)
+        weights = StatsEngine.positional_weights(positions, adjustments)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.scaled_stats = np.nan_to_num(weights * self.stats / games[:, None])
+            self.scaled_weights = np.nan_to_num(weights / games[:, None])
+        self.initial = SeasonMoments(len(self.categories), capacity=1)
+        for row in self.stats:
+            self.initial.add(row)
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        start the draft over with every player available
+        :return: None
+        """
+        self.moments = self.copy_moments(self.initial)
+        self.available = np.ones(len(self.players), dtype=bool)
+        self.open_slots = np.tile(self.slot_counts, (self.teams, 1))
+        self.picks = list()  # (team, player row, slot) in pick order
+
+    @staticmethod
+    def copy_moments(moments: SeasonMoments) -> SeasonMoments:
+        copy = SeasonMoments(len(moments.mean), capacity=1)
+        copy.count = moments.count
+        copy.mean = moments.mean.copy()
+        copy.m2 = moments.m2.copy()
+        return copy
+
+    def state(self) -> tuple:
+        """
+        capture the current draft so it can be restored later (see mock_draft)
+        :return: tuple of (pool moments, available mask, open slots, picks)
+        """
+        return self.copy_moments(self.moments), self.available.copy(), self.open_slots.copy(), list(self.picks)
+
+    def restore(self, state: tuple) -> None:
+        """
+        return the draft to a state captured with state()
+        :param state: the captured state
+        :return: None
+        """
+        moments, available, open_slots, picks = state
+        self.moments = self.copy_moments(moments)
+        self.available = available.copy()
+        self.open_slots = open_slots.copy()
+        self.picks = list(picks)
+
+    def on_the_clock(self) -> int:
+        """
+        get the team making the next pick (snake order)
+        :return: team number, or -1 when the draft is over
+        """
+        pick = len(self.picks)
+        if pick >= self.teams * self.rounds:
+            return -1
+        draft_round, position = divmod(pick, self.teams)
+        return position if draft_round % 2 == 0 else self.teams - 1 - position
+
+    def row(self, player) -> int:
+        if isinstance(player, (int, np.integer)):
+            return int(player)
+        rows = np.flatnonzero(self.players == player)
+        if not len(rows):
+            raise KeyError('unknown player {}'.format(player))
+        return int(rows[0])
+
+    def pick(self, player, team: int = None) -> str:
+        """
+        draft a player
+        :param player: the player name or row number
+        :param team: the drafting team. Defaults to the team on the clock
+        :return: the roster slot the player was placed in
+        """
+        if len(self.picks) >= self.teams * self.rounds:
+            raise ValueError('the draft is complete')
+        row = self.row(player)
+        team = self.on_the_clock() if team is None else team
+        if not self.available[row]:
+            raise ValueError('{} has already been drafted'.format(self.players[row]))
+        open_slots = self.slot_order[(self.eligible[row] & (self.open_slots[team] > 0))[self.slot_order]]
+        if not len(open_slots):
+            raise ValueError('team {} has no open slot for {} ({})'.format(team, self.players[row],
+                                                                         self.positions[row]))
+        slot = int(open_slots[0])
+        self.open_slots[team, slot] -= 1
+        self.available[row] = False
+        self.moments.subtract(self.stats[row])
+        self.picks.append((team, row, slot))
+        return self.slots[slot]
+
+    def z_values(self) -> np.ndarray:
+        """
+        positionally weighted z-score value of every player against the remaining pool
+        :return: value per player (drafted players included)
+        """
+        std = self.moments.std()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse = np.where(std > 0, 1.0 / std, 0.0)
+        return self.scaled_stats @ inverse - self.scaled_weights @ (self.moments.mean * inverse)
+
+    def values(self) -> np.ndarray:
+        """
+        value over replacement of every player against the remaining pool. The replacement level of a position is the
+        value of the n-th best available player eligible there, where n is the number of open slots league wide
+        for that position. Multi-position players use their most favourable (lowest) replacement level
+        :return: value per player, -inf for drafted players
+        """
+        values = self.z_values()
+        demand = self.open_slots.sum(axis=0)
+        replacement = np.full(len(self.players), np.inf)
+        for slot in self.position_slots:
+            pool = values[self.available & self.eligible[:, slot]]
+            if not len(pool):
+                continue
+            n = min(max(int(demand[slot]), 1), len(pool))
+            level = -np.partition(-pool, n - 1)[n - 1]
+            replacement[self.eligible[:, slot]] = np.minimum(replacement[self.eligible[:, slot]], level)
+        replacement[np.isinf(replacement)] = 0.0
+        return np.where(self.available, values - replacement, -np.inf)
+
+    def draftable(self, team: int) -> np.ndarray:
+        """
+        :param team: the team number
+        :return: mask of available players the team has an open slot for
+        """
+        return self.available & np.any(self.eligible & (self.open_slots[team] > 0), axis=1)
+
+    def best_pick(self, team: int = None, noise: np.ndarray = None) -> int:
+        """
+        get the best available player for a team
+        :param team: the team number. Defaults to the team on the clock
+        :param noise: optional per-player noise added to the values (used to simulate other drafters)
+        :return: player row number, or -1 if the team cannot draft anyone
+        """
+        team = self.on_the_clock() if team is None else team
+        values = self.values() if noise is None else self.values() + noise
+        values = np.where(self.draftable(team), values, -np.inf)
+        best = int(np.argmax(values))
+        return best if np.isfinite(values[best]) else -1
+
+    def best_available(self, n: int = 10, team: int = None) -> pd.DataFrame:
+        """
+        get the best available players
+        :param n: the number of players
+        :param team: only include players this team has an open slot for
+        :return: dataframe indexed by player name with position, value and z_value columns, best first
+        """
+        values = self.values()
+        if team is not None:
+            values = np.where(self.draftable(team), values, -np.inf)
+        rows = np.argsort(-values, kind='stable')[:n]
+        rows = rows[np.isfinite(values[rows])]
+        df = pd.DataFrame({'position': self.positions[rows], 'value': values[rows], 'z_value': self.z_values()[rows]},
+                          index=pd.Index(self.players[rows], name='player_name'))
+        return df
+
+    def rosters(self) -> pd.DataFrame:
+        """
+        :return: dataframe of every pick with pick, team, player_name, position and slot columns
+        """
+        records = [[pick + 1, team, self.players[row], self.positions[row], self.slots[slot]]
+                   for pick, (team, row, slot) in enumerate(self.picks)]
+        return pd.DataFrame.from_records(records, columns=['pick', 'team', 'player_name', 'position', 'slot'])
+
+    def mock_draft(self, rng: np.random.Generator, noise: float = 0.25) -> np.ndarray:
+        """
+        run the rest of the draft where every team takes the best available player by a noisy value. The noise
+        models differences between drafters and is redrawn for every pick. The mock draft continues from the picks
+        already made, and the draft is restored to its current state afterwards
+        :param rng: numpy random generator
+        :param noise: standard deviation of the value noise, relative to the spread (std) of the current values of
+               the top (remaining picks) available players
+        :return: pick number (1 based) of every player, 0 for undrafted players
+        """
+        state = self.state()
+        try:
+            values = self.values()
+            top = -np.sort(-values[np.isfinite(values)])[:self.teams * self.rounds - len(self.picks)]
+            scale = noise * np.std(top) if len(top) else 0.0
+            drafted = np.zeros(len(self.players), dtype=np.int64)
+            for pick, (_, row, _) in enumerate(self.picks):
+                drafted[row] = pick + 1
+            while True:
+                team = self.on_the_clock()
+                if team < 0:
+                    break
+                row = self.best_pick(team, rng.normal(0.0, scale, len(self.players)) if scale > 0 else None)
+                if row < 0:
+                    break
+                self.pick(row, team)
+                drafted[row] = len(self.picks)
+        finally:
+            self.restore(state)
+        return drafted
+
+
+_engine = None
+
+
+def _init_worker(engine: DraftEngine) -> None:
+    global _engine
+    _engine = engine
+
+
+def _mock_task(task: tuple) -> np.ndarray:
+    seed, count, noise = task
+    rng = np.random.default_rng(seed)
+    return np.stack([_engine.mock_draft(rng, noise) for _ in range(count)])
+
+
+def simulate_drafts(engine: DraftEngine, simulations: int, noise: float = 0.25, seed: int = None,
+                    workers: int = None) -> pd.DataFrame:
+    """
+    run many mock drafts in parallel and summarize where each player is taken
+    :param engine: the draft engine. Every mock draft continues from the picks already made, and the engine itself
+           is left unchanged
+    :param simulations: the number of mock drafts
+    :param noise: standard deviation of the per-pick value noise, relative to the spread of the drafted values
+    :param seed: random seed. Each chunk of drafts gets an independent stream spawned from it
+    :param workers: number of worker processes
+    :return: dataframe indexed by player name with drafted_pct, mean_pick, min_pick and max_pick, sorted by mean_pick
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = max(1, min(simulations, workers * 4))
+    counts = np.full(chunks, simulations // chunks)
+    counts[:simulations % chunks] += 1
+    seeds = np.random.SeedSequence(seed).spawn(chunks)
+    tasks = [(chunk_seed, int(count), noise) for chunk_seed, count in zip(seeds, counts)]
+    if workers <= 1:
+        _init_worker(engine)
+        results = [_mock_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(engine,)) as executor:
+            results = list(executor.map(_mock_task, tasks))
+    picks = np.concatenate(results).astype(np.float64)
+    drafted = picks > 0
+    picks[~drafted] = np.nan
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # players that are never drafted
+        df = pd.DataFrame({'position': engine.positions, 'drafted_pct': drafted.mean(axis=0) * 100.0,
+                           'mean_pick': np.nanmean(picks, axis=0), 'min_pick': np.nanmin(picks, axis=0),
+                           'max_pick': np.nanmax(picks, axis=0)}, index=pd.Index(engine.players, name='player_name'))
+    return df.sort_values(by='mean_pick')
+
+
+if __name__ == '__main__':
+    import json
+    import time
+    from functools import partial
+    from analysis.projections import batch_weighted_average_with_experience_adjustment
+    with open('config/config.json') as json_file:
+        config = json.loads(str(json_file.read()))
+    years = sorted(int(os.path.splitext(file)[0]) for file in os.listdir('data/skaters/basic'))
+    stats_engine = StatsEngine(columnar=True, cache_dir='data/.cache')
+    stats_engine.add_skaters_from_csv(years, 'data/skaters/basic/{}.csv', 'data/skaters/advanced/{}.csv')
+    stats_engine.drop_by_games_played(25)
+    season = years[-1] + 1
+    stats_engine.project_stats_batch(season, partial(batch_weighted_average_with_experience_adjustment, 82,
+                                                     [4.0, 3.0, 2.0, 1.0, 1.0, 1.0],
+                                                     [1.0, 1.10, 1.15, 1.0, 1.0, 1.0, 1.0]))
+    stats_engine.constrain_by_year(years[-1])
+    rankings = stats_engine.rank_by_year(season, config['stats_categories'], config['display_categories'],
+                                         config['fantasy_categories'], config['positional_adjustments'])
+    draft = DraftEngine(rankings, config['fantasy_categories'], config['positional_adjustments'],
+                        config['roster_slots'], config['draft_teams'])
+    print(draft.best_available(10))
+    start = time.perf_counter()
+    results = simulate_drafts(draft, 1000, seed=0)
+    print('1000 mock drafts in {:.2f}s'.format(time.perf_counter() - start))
+    pd.set_option('display.max_rows', None)
+    print(results.head(50))
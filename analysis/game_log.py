@@ -0,0 +1,327 @@
+"""
+    @file game_log.py
+    @brief game level skater stats with incremental rolling-window aggregates
+    @author Graham Riches
+    @details
+    A GameLog holds one row per player game for a season in append-only chunks of columnar arrays: a full chunk is
+    never copied or reallocated, new games always go into the last chunk. Players, teams and positions are interned
+    with a StringTable like the ColumnarStore.
+
+    Rolling aggregates are kept per player and updated as each night of games is appended:
+    - last-N game windows use a ring buffer of each player's last N games and running sums, so an append subtracts the
+      game leaving the window and adds the new one
+    - exponentially weighted averages are updated in place (pandas ewm(span=N, adjust=False) semantics)
+    Both updates are vectorized over every player in the appended batch.
+
+    Season totals are not stored. season_totals derives them from the log on demand in the BasicSkaterStats layout,
+    and to_parsed_season hands them to StatsEngine.add_parsed_season like a season file.
+"""
+import numpy as np
+import pandas as pd
+from analysis.columnar_store import StringTable
+from analysis.csv_loader import ParsedSeason
+from analysis.stats_types import BasicSkaterStats
+
+# per game stat fields: every numeric BasicSkaterStats field except games_played, which is the count of game rows
+game_fields = [field for field, field_type in zip(BasicSkaterStats.fields, BasicSkaterStats.types)
+               if field_type is not str and field != 'games_played']
+
+
+def occurrence(ids: np.ndarray) -> np.ndarray:
+    """
+    number each entry by how many times its id has already appeared in the array (0 for the first appearance)
+    :param ids: integer ids
+    :return: occurrence number of each entry
+    """
+    if len(ids) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(ids, kind='stable')
+    sorted_ids = ids[order]
+    new_id = np.ones(len(ids), dtype=bool)
+    new_id[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    starts = np.flatnonzero(new_id)
+    result = np.empty(len(ids), dtype=np.int64)
+    result[order] = np.arange(len(ids)) - starts[np.cumsum(new_id) - 1]
+    return result
+
+
+class RollingWindow:
+    """
+    Running sums over each player's last N games
+    """
+    def __init__(self, window: int, fields: int, capacity: int = 256):
+        """
+        :param window: the number of games in the window
+        :param fields: the number of stat fields
+        :param capacity: initial player capacity
+        """
+        self.window = window
+        self.buffer = np.zeros((capacity, window, fields), dtype=np.float64)
+        self.position = np.zeros(capacity, dtype=np.int64)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.sums = np.zeros((capacity, fields), dtype=np.float64)
+
+    def reserve(self, players: int) -> None:
+        capacity = len(self.count)
+        if players <= capacity:
+            return
+        extra = max(players, 2 * capacity) - capacity
+        self.buffer = np.concatenate([self.buffer, np.zeros((extra,) + self.buffer.shape[1:])])
+        self.position = np.concatenate([self.position, np.zeros(extra, dtype=np.int64)])
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+        self.sums = np.concatenate([self.sums, np.zeros((extra, self.sums.shape[1]))])
+
+    def push(self, players: np.ndarray, values: np.ndarray) -> None:
+        """
+        add one game for each of a set of distinct players
+        :param players: player ids (no duplicates)
+        :param values: (players x fields) stats of the game
+        :return: None
+        """
+        slots = self.position[players]
+        self.sums[players] += values - self.buffer[players, slots]
+        self.buffer[players, slots] = values
+        self.position[players] = (slots + 1) % self.window
+        self.count[players] = np.minimum(self.count[players] + 1, self.window)
+
+
+class ExponentialAverage:
+    """
+    Exponentially weighted average of each player's games
+    """
+    def __init__(self, span: int, fields: int, capacity: int = 256):
+        """
+        :param span: the decay in games, alpha = 2 / (span + 1)
+        :param fields: the number of stat fields
+        :param capacity: initial player capacity
+        """
+        self.span = span
+        self.alpha = 2.0 / (span + 1.0)
+        self.values = np.zeros((capacity, fields), dtype=np.float64)
+        self.count = np.zeros(capacity, dtype=np.int64)
+
+    def reserve(self, players: int) -> None:
+        capacity = len(self.count)
+        if players <= capacity:
+            return
+        extra = max(players, 2 * capacity) - capacity
+        self.values = np.concatenate([self.values, np.zeros((extra, self.values.shape[1]))])
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+
+    def push(self, players: np.ndarray, values: np.ndarray) -> None:
+        """
+        add one game for each of a set of distinct players
+        :param players: player ids (no duplicates)
+        :param values: (players x fields) stats of the game
+        :return: None
+        """
+        first = (self.count[players] == 0)[:, None]
+        current = self.values[players]
+        self.values[players] = np.where(first, values, current + self.alpha * (values - current))
+        self.count[players] += 1
+
+
+class GameLog:
+    def __init__(self, season: int, windows: tuple = (10, 20), spans: tuple = (10,), chunk_size: int = 4096):
+        """
+        create an empty game log for a season
+        :param season: the season of the games
+        :param windows: last-N game window sizes to maintain
+        :param spans: exponentially weighted average spans to maintain
+        :param chunk_size: rows per storage chunk
+        """
+        self.season = season
+        self.chunk_size = chunk_size
+        self.names = StringTable()
+        self.teams = StringTable()
+        self.positions = StringTable()
+        self.chunks = list()
+        self.size = 0
+        self.last_date = None
+        self.windows = {window: RollingWindow(window, len(game_fields)) for window in windows}
+        self.averages = {span: ExponentialAverage(span, len(game_fields)) for span in spans}
+        # most recent team and position code of each player
+        self.player_team = np.zeros(256, dtype=np.int32)
+        self.player_position = np.zeros(256, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def new_chunk(self) -> dict:
+        chunk = {'date': np.zeros(self.chunk_size, dtype=np.int64),
+                 'player_id': np.zeros(self.chunk_size, dtype=np.int32),
+                 'team': np.zeros(self.chunk_size, dtype=np.int32),
+                 'position': np.zeros(self.chunk_size, dtype=np.int32),
+                 'size': 0}
+        for field in game_fields:
+            chunk[field] = np.zeros(self.chunk_size, dtype=np.int64)
+        self.chunks.append(chunk)
+        return chunk
+
+    def append(self, dates, names, teams, positions, values: dict) -> None:
+        """
+        append a batch of games (i.e. one night) to the log and update the rolling aggregates. Games must be appended
+        in date order; games within a batch are applied in the order given
+        :param dates: game date of each row as a sortable integer, i.e. 20191005
+        :param names: player name of each row
+        :param teams: team of each row
+        :param positions: position of each row
+        :param values: dictionary of game field -> values of each row. Missing fields are zero
+        :return: None
+        """
+        dates = np.asarray(dates, dtype=np.int64)
+        count = len(dates)
+        if count == 0:
+            return
+        if np.any(np.diff(dates) < 0) or (self.last_date is not None and dates[0] < self.last_date):
+            raise ValueError('games must be appended in date order')
+        player_ids = self.names.intern_many(names)
+        team_codes = self.teams.intern_many(teams)
+        position_codes = self.positions.intern_many(positions)
+        stats = np.zeros((count, len(game_fields)), dtype=np.int64)
+        for idx, field in enumerate(game_fields):
+            if field in values:
+                stats[:, idx] = np.asarray(values[field], dtype=np.int64)
+
+        start = 0
+        while start < count:
+            chunk = self.chunks[-1] if self.chunks and self.chunks[-1]['size'] < self.chunk_size else self.new_chunk()
+            offset = chunk['size']
+            end = min(count, start + self.chunk_size - offset)
+            rows = slice(offset, offset + end - start)
+            chunk['date'][rows] = dates[start:end]
+            chunk['player_id'][rows] = player_ids[start:end]
+            chunk['team'][rows] = team_codes[start:end]
+            chunk['position'][rows] = position_codes[start:end]
+            for idx, field in enumerate(game_fields):
+                chunk[field][rows] = stats[start:end, idx]
+            chunk['size'] = offset + end - start
+            start = end
+        self.size += count
+        self.last_date = int(dates[-1])
+
+        players = len(self.names)
+        if players > len(self.player_team):
+            extra = max(players, 2 * len(self.player_team)) - len(self.player_team)
+            self.player_team = np.concatenate([self.player_team, np.zeros(extra, dtype=np.int32)])
+            self.player_position = np.concatenate([self.player_position, np.zeros(extra, dtype=np.int32)])
+        self.player_team[player_ids] = team_codes  # fancy assignment keeps the last occurrence
+        self.player_position[player_ids] = position_codes
+        for aggregate in list(self.windows.values()) + list(self.averages.values()):
+            aggregate.reserve(players)
+        # a player can appear more than once in a batch (i.e. several nights), so apply each occurrence in turn
+        occurrences = occurrence(player_ids)
+        stats = stats.astype(np.float64)
+        for repeat in range(int(occurrences.max()) + 1):
+            selected = occurrences == repeat
+            for aggregate in list(self.windows.values()) + list(self.averages.values()):
+                aggregate.push(player_ids[selected], stats[selected])
+
+    def append_frame(self, df: pd.DataFrame) -> None:
+        """
+        append a batch of games from a dataframe with date, player_name, team, position and game field columns
+        :param df: the games
+        :return: None
+        """
+        self.append(df['date'].to_numpy(), df['player_name'].to_numpy(dtype=str), df['team'].to_numpy(dtype=str),
+                    df['position'].to_numpy(dtype=str), {field: df[field].to_numpy() for field in game_fields
+                                                         if field in df.columns})
+
+    def column(self, field: str) -> np.ndarray:
+        """
+        get a whole column of the log
+        :param field: the column name (date, player_id, team, position or a game field)
+        :return: array with one entry per game row
+        """
+        if not self.chunks:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([chunk[field][:chunk['size']] for chunk in self.chunks])
+
+    def frame(self) -> pd.DataFrame:
+        """
+        :return: the whole log as a dataframe with date, player_name, team, position and game field columns
+        """
+        data = {'date': self.column('date'), 'player_name': self.names.lookup(self.column('player_id')),
+                'team': self.teams.lookup(self.column('team')),
+                'position': self.positions.lookup(self.column('position'))}
+        data.update({field: self.column(field) for field in game_fields})
+        return pd.DataFrame(data)
+
+    def aggregate_frame(self, values: np.ndarray, games: np.ndarray) -> pd.DataFrame:
+        players = np.flatnonzero(games > 0)
+        df = pd.DataFrame(values[players], columns=game_fields, index=pd.Index(self.names.lookup(players),
+                                                                                 name='player_name'))
+        df.insert(0, 'games', games[players])
+        df.insert(0, 'position', self.positions.lookup(self.player_position[players]))
+        df.insert(0, 'team', self.teams.lookup(self.player_team[players]))
+        return df
+
+    def rolling(self, window: int, per_game: bool = True) -> pd.DataFrame:
+        """
+        get every player's aggregate over their last N games
+        :param window: one of the window sizes the log was created with
+        :param per_game: return per-game averages instead of totals
+        :return: dataframe indexed by player name with team, position, games (in the window) and game field columns
+        """
+        if window not in self.windows:
+            raise KeyError('no rolling window of {} games. Available: {}'.format(window, list(self.windows)))
+        aggregate = self.windows[window]
+        players = len(self.names)
+        games = aggregate.count[:players]
+        sums = aggregate.sums[:players]
+        if per_game:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sums = sums / games[:, None]
+        return self.aggregate_frame(sums, games)
+
+    def ewm(self, span: int) -> pd.DataFrame:
+        """
+        get every player's exponentially weighted per-game averages
+        :param span: one of the spans the log was created with
+        :return: dataframe indexed by player name with team, position, games (in the season) and game field columns
+        """
+        if span not in self.averages:
+            raise KeyError('no exponential average with span {}. Available: {}'.format(span, list(self.averages)))
+        aggregate = self.averages[span]
+        players = len(self.names)
+        return self.aggregate_frame(aggregate.values[:players], aggregate.count[:players])
+
+    def season_totals(self) -> pd.DataFrame:
+        """
+        derive season totals from the log
+        :return: dataframe indexed by player name with the BasicSkaterStats fields. Team and position are the player's
+                 most recent
+        """
+        players = len(self.names)
+        player_ids = self.column('player_id')
+        df = pd.DataFrame({'team': self.teams.lookup(self.player_team[:players]),
+                           'position': self.positions.lookup(self.player_position[:players]),
+                           'games_played': np.bincount(player_ids, minlength=players)},
+                          index=pd.Index(self.names.lookup(np.arange(players)), name='player_name'))
+        for field in game_fields:
+            df[field] = np.bincount(player_ids, weights=self.column(field), minlength=players).astype(np.int64)
+        return df.loc[:, BasicSkaterStats.fields]
+
+    def season_stats(self, player: str) -> BasicSkaterStats:
+        """
+        derive one player's season totals
+        :param player: the player name
+        :return: BasicSkaterStats object
+        """
+        if player not in self.names.index:
+            raise KeyError('no games for player {}'.format(player))
+        rows = self.column('player_id') == self.names.index[player]
+        code = self.names.index[player]
+        values = [self.teams.values[self.player_team[code]], self.positions.values[self.player_position[code]],
+                  int(rows.sum())] + [int(self.column(field)[rows].sum()) for field in game_fields]
+        return BasicSkaterStats(values)
+
+    def to_parsed_season(self) -> ParsedSeason:
+        """
+        derive season totals as a parsed season, i.e. for StatsEngine.add_parsed_season('basic', season, ...)
+        :return: parsed season
+        """
+        totals = self.season_totals()
+        columns = {field: totals[field].to_numpy(dtype=str if field_type is str else None)
+                   for field, field_type in zip(BasicSkaterStats.fields, BasicSkaterStats.types)}
+        return ParsedSeason(totals.index.to_list(), columns)
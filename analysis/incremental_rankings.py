@@ -0,0 +1,185 @@
+"""
+    @file incremental_rankings.py
+    @brief streaming z-score rankings with online mean and variance
+    @author Graham Riches
+    @details
+    Keeps Welford style running moments per category and per season so rows can be inserted, updated or removed in
+    O(categories) while the season is in progress. Z-scores use the same definition as
+    StatsEngine.calculate_z_score_rankings: (value - mean) / games_played / std, with the population std.
+"""
+import numpy as np
+import pandas as pd
+
+
+class SeasonMoments:
+    """
+    Running per-category moments and row storage for a single season
+    """
+    def __init__(self, categories: int, capacity: int = 256):
+        """
+        :param categories: the number of categories
+        :param capacity: initial row capacity
+        """
+        self.count = 0
+        self.mean = np.zeros(categories, dtype=np.float64)
+        self.m2 = np.zeros(categories, dtype=np.float64)
+        self.values = np.zeros((capacity, categories), dtype=np.float64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.rows = dict()  # player name -> row index
+        self.free = list()
+
+    def add(self, values: np.ndarray) -> None:
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    def subtract(self, values: np.ndarray) -> None:
+        if self.count <= 1:
+            self.count = 0
+            self.mean[:] = 0
+            self.m2[:] = 0
+            return
+        delta = values - self.mean
+        self.count -= 1
+        self.mean -= delta / self.count
+        self.m2 -= delta * (values - self.mean)
+        np.maximum(self.m2, 0, out=self.m2)
+
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.m2 / self.count) if self.count else np.zeros_like(self.m2)
+
+    def allocate(self) -> int:
+        """
+        get a free row index, growing the row storage if required
+        :return: row index
+        """
+        if self.free:
+            return self.free.pop()
+        row = len(self.rows)
+        if row >= len(self.values):
+            self.values = np.concatenate([self.values, np.zeros_like(self.values)])
+            self.active = np.concatenate([self.active, np.zeros_like(self.active)])
+        return row
+
+
+class IncrementalZScoreRanker:
+    def __init__(self, categories: list, fantasy_categories: list = None):
+        """
+        create a new incremental ranker
+        :param categories: the stats categories to track. Must include games_played
+        :param fantasy_categories: categories summed into fantasy_points_z. Defaults to all categories
+        """
+        if 'games_played' not in categories:
+            raise ValueError('games_played must be one of the ranked categories')
+        self.categories = list(categories)
+        self.fantasy_categories = list(fantasy_categories) if fantasy_categories is not None else list(categories)
+        self.games_index = self.categories.index('games_played')
+        self.fantasy_index = [self.categories.index(category) for category in self.fantasy_categories]
+        self.seasons = dict()
+
+    def _vector(self, values) -> np.ndarray:
+        """
+        convert a row of values into a category ordered vector
+        :param values: dictionary of category -> value or a sequence in category order
+        :return: numpy vector
+        """
+        if isinstance(values, dict):
+            values = [values[category] for category in self.categories]
+        return np.asarray(values, dtype=np.float64)
+
+    def _season(self, season: int) -> SeasonMoments:
+        if season not in self.seasons:
+            self.seasons[season] = SeasonMoments(len(self.categories))
+        return self.seasons[season]
+
+    def insert(self, season: int, player: str, values) -> None:
+        """
+        add a player row to a season. If the player already exists the row is updated instead
+        :param season: the season of the data
+        :param player: the player name
+        :param values: dictionary of category -> value or a sequence in category order
+        :return: None
+        """
+        moments = self._season(season)
+        if player in moments.rows:
+            self.update(season, player, values)
+            return
+        vector = self._vector(values)
+        row = moments.allocate()
+        moments.rows[player] = row
+        moments.values[row] = vector
+        moments.active[row] = True
+        moments.add(vector)
+
+    def update(self, season: int, player: str, values) -> None:
+        """
+        replace the values of an existing player row
+        :param season: the season of the data
+        :param player: the player name
+        :param values: dictionary of category -> value or a sequence in category order
+        :return: None
+        """
+        moments = self.seasons[season]
+        row = moments.rows[player]
+        vector = self._vector(values)
+        moments.subtract(moments.values[row])
+        moments.values[row] = vector
+        moments.add(vector)
+
+    def remove(self, season: int, player: str) -> None:
+        """
+        remove a player row from a season
+        :param season: the season of the data
+        :param player: the player name
+        :return: None
+        """
+        moments = self.seasons[season]
+        row = moments.rows.pop(player)
+        moments.subtract(moments.values[row])
+        moments.active[row] = False
+        moments.free.append(row)
+
+    def insert_frame(self, season: int, df: pd.DataFrame) -> None:
+        """
+        insert every row of a stats dataframe indexed by player name
+        :param season: the season of the data
+        :param df: dataframe with a column for each category
+        :return: None
+        """
+        for player, values in zip(df.index, df.loc[:, self.categories].to_numpy(dtype=np.float64)):
+            self.insert(season, player, values)
+
+    def z_scores(self, season: int, player: str) -> dict:
+        """
+        get the current z-scores of a single player
+        :param season: the season of the data
+        :param player: the player name
+        :return: dictionary of '{category}_z' -> z-score plus fantasy_points_z
+        """
+        moments = self.seasons[season]
+        values = moments.values[moments.rows[player]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores = (values - moments.mean) / values[self.games_index] / moments.std()
+        result = {'{}_z'.format(category): z for category, z in zip(self.categories, z_scores.tolist())}
+        result['fantasy_points_z'] = float(np.sum(z_scores[self.fantasy_index]))
+        return result
+
+    def rankings(self, season: int) -> pd.DataFrame:
+        """
+        get the current rankings for a season from the running moments
+        :param season: the season of the data
+        :return: dataframe indexed by player name with the raw categories, z-scores and fantasy_points_z sorted from
+                 best to worst
+        """
+        moments = self.seasons[season]
+        players = list(moments.rows.keys())
+        rows = np.fromiter(moments.rows.values(), dtype=np.int64, count=len(players))
+        values = moments.values[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores = (values - moments.mean) / values[:, self.games_index, None] / moments.std()
+        df = pd.DataFrame(values, index=pd.Index(players, name='player_name'), columns=self.categories)
+        for idx, category in enumerate(self.categories):
+            df['{}_z'.format(category)] = z_scores[:, idx]
+        df['fantasy_points_z'] = np.sum(z_scores[:, self.fantasy_index], axis=1)
+        return df.sort_values(by='fantasy_points_z', ascending=False)
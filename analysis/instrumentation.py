@@ -0,0 +1,165 @@
+"""
+    @file instrumentation.py
+    @brief runtime switchable profiling spans for the stats engine
+    @author Graham Riches
+    @details
+    Stage level StatsEngine methods (loading, projecting, ranking and exporting) are wrapped with @instrumented. When
+    the shared profiler is disabled the wrapper is a single attribute check before calling through. Per-record code
+    (the csv line parsers and the Skater methods) is deliberately not wrapped, so it pays nothing for profiling and the
+    spans are not flooded with one entry per player. When enabled, each call records a timing span with the
+    number of rows it produced (for dataframe/array results) or processed (annotated by the method) and, optionally,
+    the traced memory delta. Spans can be summarized into a report or exported as a chrome://tracing / Perfetto
+    compatible trace file.
+"""
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+class Span:
+    """
+    A single timed call
+    """
+    __slots__ = ('name', 'start', 'duration', 'depth', 'thread', 'args')
+
+    def __init__(self, name: str, start: float, depth: int, thread: int):
+        self.name = name
+        self.start = start
+        self.duration = 0.0
+        self.depth = depth
+        self.thread = thread
+        self.args = dict()
+
+
+class Profiler:
+    def __init__(self):
+        """
+        create a new (disabled) profiler
+        """
+        self.enabled = False
+        self.trace_memory = False
+        self.spans = list()
+        self.origin = time.perf_counter()
+        self.local = threading.local()
+
+    def enable(self, trace_memory: bool = False) -> None:
+        """
+        start recording spans
+        :param trace_memory: also record traced memory deltas with tracemalloc. This has a noticeable overhead
+        :return: None
+        """
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self) -> None:
+        """
+        stop recording spans. Recorded spans are kept until reset is called
+        :return: None
+        """
+        self.enabled = False
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = False
+
+    def reset(self) -> None:
+        """
+        clear all recorded spans
+        :return: None
+        """
+        self.spans = list()
+        self.origin = time.perf_counter()
+
+    def _stack(self) -> list:
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = list()
+        return stack
+
+    def annotate(self, **kwargs) -> None:
+        """
+        attach values (i.e. rows=100) to the innermost active span. Does nothing when the profiler is disabled
+        :param kwargs: values to attach
+        :return: None
+        """
+        if not self.enabled:
+            return
+        stack = self._stack()
+        if stack:
+            stack[-1].args.update(kwargs)
+
+    def call(self, name: str, function: callable, args: tuple, kwargs: dict):
+        """
+        call a function inside a new span
+        :param name: the span name
+        :param function: the function to call
+        :param args: positional arguments
+        :param kwargs: keyword arguments
+        :return: the result of the function
+        """
+        stack = self._stack()
+        span = Span(name, time.perf_counter(), len(stack), threading.get_ident())
+        memory = tracemalloc.get_traced_memory()[0] if self.trace_memory else None
+        stack.append(span)
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            span.duration = time.perf_counter() - span.start
+            stack.pop()
+            if memory is not None:
+                span.args['memory_delta'] = tracemalloc.get_traced_memory()[0] - memory
+            self.spans.append(span)
+        if 'rows' not in span.args and hasattr(result, 'shape'):
+            span.args['rows'] = len(result)
+        return result
+
+    def report(self):
+        """
+        summarize the recorded spans by name
+        :return: dataframe with calls, total/mean/max seconds, rows and memory delta per span name, sorted by total time
+        """
+        import pandas as pd
+        records = [{'name': span.name, 'seconds': span.duration, 'rows': span.args.get('rows'),
+                    'memory_delta': span.args.get('memory_delta')} for span in self.spans]
+        columns = ['name', 'seconds', 'rows', 'memory_delta']
+        df = pd.DataFrame.from_records(records, columns=columns)
+        report = df.groupby('name').agg(calls=('seconds', 'size'), total_s=('seconds', 'sum'),
+                                        mean_s=('seconds', 'mean'), max_s=('seconds', 'max'),
+                                        rows=('rows', 'sum'), memory_delta=('memory_delta', 'sum'))
+        return report.sort_values(by='total_s', ascending=False)
+
+    def export_trace(self, filename: str) -> None:
+        """
+        write the recorded spans as a chrome trace event file (viewable in chrome://tracing or Perfetto)
+        :param filename: the output file
+        :return: None
+        """
+        events = [{'name': span.name, 'ph': 'X', 'pid': os.getpid(), 'tid': span.thread,
+                   'ts': (span.start - self.origin) * 1e6, 'dur': span.duration * 1e6, 'args': span.args}
+                  for span in self.spans]
+        with open(filename, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+
+# shared profiler used by all instrumented methods
+profiler = Profiler()
+
+
+def instrumented(function: callable) -> callable:
+    """
+    decorator that records a span for every call while the shared profiler is enabled
+    :param function: the function to wrap
+    :return: wrapped function
+    """
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not profiler.enabled:
+            return function(*args, **kwargs)
+        return profiler.call(name, function, args, kwargs)
+    return wrapper
@@ -0,0 +1,56 @@
+"""
+    @file metrics.py
+    @brief vectorized error metrics for comparing projections against actual results
+    @author Graham Riches
+    @details
+    All metrics reduce along an axis so many categories (or seasons) can be scored at once.
+"""
+import numpy as np
+
+
+def mean_absolute_error(predicted: np.ndarray, actual: np.ndarray, axis: int = 0) -> np.ndarray:
+    """
+    :param predicted: predicted values
+    :param actual: actual values
+    :param axis: the axis to reduce over
+    :return: mean absolute error
+    """
+    return np.mean(np.abs(predicted - actual), axis=axis)
+
+
+def root_mean_squared_error(predicted: np.ndarray, actual: np.ndarray, axis: int = 0) -> np.ndarray:
+    """
+    :param predicted: predicted values
+    :param actual: actual values
+    :param axis: the axis to reduce over
+    :return: root mean squared error
+    """
+    return np.sqrt(np.mean(np.square(predicted - actual), axis=axis))
+
+
+def ranks(values: np.ndarray, axis: int = 0) -> np.ndarray:
+    """
+    rank values along an axis (0 = smallest). Ties are broken by position.
+    :param values: the values to rank
+    :param axis: the axis to rank along
+    :return: array of ranks with the same shape as values
+    """
+    return np.argsort(np.argsort(values, axis=axis, kind='stable'), axis=axis, kind='stable').astype(np.float64)
+
+
+def rank_correlation(predicted: np.ndarray, actual: np.ndarray, axis: int = 0) -> np.ndarray:
+    """
+    spearman rank correlation between predicted and actual values
+    :param predicted: predicted values
+    :param actual: actual values
+    :param axis: the axis to reduce over
+    :return: rank correlation coefficient
+    """
+    predicted_ranks = ranks(predicted, axis)
+    actual_ranks = ranks(actual, axis)
+    predicted_ranks -= np.mean(predicted_ranks, axis=axis, keepdims=True)
+    actual_ranks -= np.mean(actual_ranks, axis=axis, keepdims=True)
+    covariance = np.sum(predicted_ranks * actual_ranks, axis=axis)
+    scale = np.sqrt(np.sum(np.square(predicted_ranks), axis=axis) * np.sum(np.square(actual_ranks), axis=axis))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return covariance / scale
@@ -0,0 +1,282 @@
+"""
+    @file models.py
+    @brief registry of vectorized projection models with memoized results
+    @author Graham Riches
+    @details
+    Every registered model is a kernel over the (players x seasons x fields) per-game history tensor and its
+    (players x seasons) validity mask (see ColumnarStore.history_tensor). A kernel can also declare extra per-season
+    inputs, i.e. age, which are gathered from the store for the same (player, season) entries as the tensor. Kernels
+    are registered with a decorator:
+
+        @register_model('my_model', inputs=('age',))
+        def my_model(stats, mask, inputs, games_played=82): ...
+
+    and instantiated with their parameters: create_model('experience_adjusted', games_played=82, ...). The returned
+    ProjectionModel can be passed to StatsEngine.project_stats or project_stats_batch like any batch model. The engine
+    memoizes the projections on (model, kernel source and version, parameters, input data fingerprint), in memory and,
+    when the engine has a cache directory, on disk. Rerunning an unchanged projection then skips the kernel entirely.
+    Editing a kernel changes its source hash, so its old results are no longer used; a kernel's version must be bumped
+    when code it calls (i.e. analysis.projections) changes its results. The disk cache keeps the most recently used
+    results and removes the rest.
+"""
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from analysis.columnar_store import ColumnarStore
+from analysis.projections import batch_weighted_average, batch_weighted_average_with_experience_adjustment, \
+    pad_weights
+
+models = dict()  # name -> (kernel, inputs, fingerprint)
+
+
+def kernel_fingerprint(kernel: callable, version: int) -> str:
+    """
+    identify the code of a kernel
+    :param kernel: the kernel function
+    :param version: the kernel version
+    :return: hex digest of the version and the kernel source (or byte code when the source is not available)
+    """
+    try:
+        code = inspect.getsource(kernel).encode()
+    except (OSError, TypeError):
+        code = kernel.__code__.co_code
+    return hashlib.blake2b(str(version).encode() + code, digest_size=8).hexdigest()
+
+
+def register_model(name: str, inputs: tuple = (), version: int = 1) -> callable:
+    """
+    decorator to register a projection kernel
+    :param name: the model name
+    :param inputs: raw (not per-game) store fields the kernel needs as (players x seasons) arrays
+    :param version: bump this when the kernel's results change without its own source changing
+    :return: decorator
+    """
+    def decorator(kernel: callable) -> callable:
+        if name in models:
+            raise ValueError('projection model {} is already registered'.format(name))
+        models[name] = (kernel, tuple(inputs), kernel_fingerprint(kernel, version))
+        return kernel
+    return decorator
+
+
+class ProjectionModel:
+    """
+    A registered kernel bound to a set of parameters
+    """
+    def __init__(self, name: str, params: dict):
+        """
+        :param name: the registered model name
+        :param params: keyword parameters for the kernel
+        """
+        if name not in models:
+            raise KeyError('unknown projection model {}. Registered models: {}'.format(name, ', '.join(models)))
+        self.name = name
+        self.params = dict(params)
+        self.kernel, self.inputs, self.fingerprint = models[name]
+        self.__name__ = name
+
+    def __repr__(self) -> str:
+        return 'ProjectionModel({!r}, {!r})'.format(self.name, self.params)
+
+    def __call__(self, stats, mask: np.ndarray = None, inputs: dict = None):
+        """
+        run the model. Called with a tensor and mask this is a batch model (see StatsEngine.project_stats_batch).
+        Called with a single list of per-game values sorted from newest to oldest it projects that one value, which
+        lets the per-player (Skater) projection path use models without extra inputs
+        :param stats: (players x seasons x fields) tensor, or a list of per-game values
+        :param mask: (players x seasons) mask of valid seasons
+        :param inputs: dictionary of input name -> (players x seasons) array
+        :return: (players x fields) array of projections, or a single projected value
+        """
+        inputs = dict() if inputs is None else inputs
+        missing = [name for name in self.inputs if name not in inputs]
+        if missing:
+            raise ValueError('projection model {} requires inputs {}'.format(self.name, ', '.join(missing)))
+        if mask is None:
+            values = np.asarray(stats, dtype=np.float64)
+            return self.kernel(values[None, :, None], np.ones((1, len(values)), dtype=bool), inputs,
+                               **self.params)[0, 0]
+        return self.kernel(stats, mask, inputs, **self.params)
+
+    def gather(self, store: ColumnarStore, rows: np.ndarray) -> dict:
+        """
+        gather the model's extra inputs for the entries of a history tensor
+        :param store: the store the tensor was gathered from
+        :param rows: (players x seasons) store rows of the tensor entries (-1 where invalid)
+        :return: dictionary of input name -> (players x seasons) float array with nan for missing values
+        """
+        inputs = dict()
+        for name in self.inputs:
+            kind = next((kind for kind, schema in store.schemas.items() if name in schema.fields), None)
+            if kind is None:
+                raise KeyError('no stats kind has the field {} needed by projection model {}'.format(name, self.name))
+            safe = np.maximum(rows, 0)
+            valid = (rows >= 0) & store.valid[kind][safe]
+            inputs[name] = np.where(valid, store.columns[name][safe].astype(np.float64), np.nan)
+        return inputs
+
+    def key(self, stats: np.ndarray, mask: np.ndarray, inputs: dict) -> str:
+        """
+        get the memoization key of a projection
+        :param stats: the history tensor
+        :param mask: the validity mask
+        :param inputs: the gathered inputs
+        :return: hex digest of the model, its code, its parameters and the input data
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps([self.name, self.fingerprint, self.params], sort_keys=True, default=repr).encode())
+        for array in [stats, mask] + [inputs[name] for name in sorted(inputs)]:
+            array = np.ascontiguousarray(array)
+            digest.update('{}{}'.format(array.dtype.str, array.shape).encode())
+            digest.update(array.data)
+        return digest.hexdigest()
+
+
+def create_model(name: str, **params) -> ProjectionModel:
+    """
+    bind a registered model to a set of parameters
+    :param name: the registered model name
+    :param params: keyword parameters for the kernel
+    :return: projection model
+    """
+    return ProjectionModel(name, params)
+
+
+class ProjectionCache:
+    """
+    Least recently used cache of projection results with an optional on-disk copy
+    """
+    def __init__(self, directory: str = None, size: int = 64, disk_size: int = 256):
+        """
+        :param directory: optional directory to persist results in. Created if it does not exist
+        :param size: the number of results to keep in memory
+        :param disk_size: the number of results to keep on disk. The least recently used files are removed
+        """
+        self.directory = directory
+        self.size = size
+        self.disk_size = disk_size
+        self.results = OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> np.ndarray:
+        """
+        get a cached result
+        :param key: the projection key
+        :return: the projection or None
+        """
+        if key in self.results:
+            self.results.move_to_end(key)
+            return self.results[key]
+        if self.directory is not None:
+            path = os.path.join(self.directory, '{}.npy'.format(key))
+            try:
+                result = np.load(path)
+                os.utime(path)  # the modification time orders the files for eviction
+            except (OSError, ValueError):
+                return None
+            self._remember(key, result)
+            return result
+        return None
+
+    def put(self, key: str, result: np.ndarray) -> None:
+        """
+        cache a result
+        :param key: the projection key
+        :param result: the projection
+        :return: None
+        """
+        self._remember(key, result)
+        if self.directory is not None:
+            descriptor, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(descriptor, 'wb') as file:
+                np.save(file, result)
+            os.replace(temp, os.path.join(self.directory, '{}.npy'.format(key)))
+            self._evict()
+
+    def _evict(self) -> None:
+        """
+        remove the least recently used result files beyond the disk size
+        :return: None
+        """
+        files = list()
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                path = os.path.join(self.directory, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        for _, path in sorted(files)[:max(len(files) - self.disk_size, 0)]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _remember(self, key: str, result: np.ndarray) -> None:
+        result.setflags(write=False)
+        self.results[key] = result
+        while len(self.results) > self.size:
+            self.results.popitem(last=False)
+
+
+@register_model('weighted_average')
+def weighted_average(stats: np.ndarray, mask: np.ndarray, inputs: dict, games_played: int = 82,
+                     weights: list = (4.0, 3.0, 2.0, 1.0, 1.0, 1.0)) -> np.ndarray:
+    """
+    seasonal weighted average of the per-game history (see batch_weighted_average)
+    """
+    return batch_weighted_average(games_played, list(weights), stats, mask)
+
+
+@register_model('experience_adjusted')
+def experience_adjusted(stats: np.ndarray, mask: np.ndarray, inputs: dict, games_played: int = 82,
+                        average_weights: list = (4.0, 3.0, 2.0, 1.0, 1.0, 1.0),
+                        progression_weights: list = (1.0, 1.10, 1.15, 1.0, 1.0, 1.0, 1.0)) -> np.ndarray:
+    """
+    weighted average with an experience multiplier (see batch_weighted_average_with_experience_adjustment)
+    """
+    return batch_weighted_average_with_experience_adjustment(games_played, list(average_weights),
+                                                             list(progression_weights), stats, mask)
+
+
+@register_model('regression_to_mean', inputs=('games_played',))
+def regression_to_mean(stats: np.ndarray, mask: np.ndarray, inputs: dict, games_played: int = 82,
+                       weights: list = (4.0, 3.0, 2.0, 1.0, 1.0, 1.0), prior_games: float = 82.0) -> np.ndarray:
+    """
+    games weighted per-game rates shrunk towards the league average rate. Each season counts for its seasonal weight
+    times its games played, and the league average counts for prior_games, so players with little history are pulled
+    strongly towards the league while full time veterans mostly keep their own rates
+    """
+    games = np.where(mask, np.nan_to_num(inputs['games_played']), 0.0)
+    exposure = pad_weights(list(weights), stats.shape[1])[None, :] * games
+    values = np.where(mask[..., None], stats, 0.0)
+    totals = np.einsum('ps,psf->pf', exposure, values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        league = totals.sum(axis=0) / exposure.sum()
+        rates = (totals + prior_games * league[None, :]) / (exposure.sum(axis=1)[:, None] + prior_games)
+    return rates * games_played
+
+
+@register_model('age_curve', inputs=('age',))
+def age_curve(stats: np.ndarray, mask: np.ndarray, inputs: dict, games_played: int = 82,
+              weights: list = (4.0, 3.0, 2.0, 1.0, 1.0, 1.0), peak_age: float = 27.0,
+              curvature: float = 0.004) -> np.ndarray:
+    """
+    weighted average scaled by a quadratic aging curve. The curve 1 - curvature * (age - peak_age)^2 rises until the
+    peak age and falls after it, and each player's projection is multiplied by the ratio of the curve at their age
+    next season to the curve at their age in their most recent season. Players without an age are not adjusted
+    """
+    base = batch_weighted_average(games_played, list(weights), stats, mask)
+    age = inputs['age'][:, 0] if inputs['age'].shape[1] else np.full(len(stats), np.nan)
+    age = np.where(age > 0, age, np.nan)
+
+    def curve(years: np.ndarray) -> np.ndarray:
+        return np.maximum(1.0 - curvature * (years - peak_age) ** 2, 0.25)
+
+    factor = np.nan_to_num(curve(age + 1.0) / curve(age), nan=1.0)
+    return base * factor[:, None]
@@ -0,0 +1,213 @@
+"""
+    @file player_identity.py
+    @brief fuzzy player identity index for joining stats to curated rankings
+    @author Graham Riches
+    @details
+    Player names differ between sources: accents, punctuation ("T.J. Oshie" vs "TJ Oshie"), case ("James van Riemsdyk")
+    and nicknames ("Mitch Marner" vs "Mitchell Marner"). Names are first reduced to a normalized key (accents and
+    punctuation stripped, case folded, common nicknames expanded). Exact key matches are a dictionary lookup; anything
+    else is blocked through an inverted index of character trigrams, so each lookup only scores the players sharing at
+    least one trigram instead of comparing against every name. Candidates are scored with the Dice coefficient of their
+    trigram sets in a single vectorized pass, and the best candidate must also have a similar last name so that two
+    players sharing a common first name ("Alex Steen", "Alex Stalock") do not match.
+"""
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+
+# common first name variants -> canonical first name
+nicknames = {
+    'alex': 'alexander', 'alexandre': 'alexander', 'sasha': 'alexander', 'andy': 'andrew', 'tony': 'anthony',
+    'ben': 'benjamin', 'cam': 'cameron', 'chris': 'christopher', 'dan': 'daniel', 'danny': 'daniel',
+    'dave': 'david', 'freddie': 'frederik', 'fred': 'frederik', 'greg': 'gregory', 'jake': 'jacob',
+    'jon': 'jonathan', 'josh': 'joshua', 'kris': 'kristopher', 'matt': 'matthew', 'mathew': 'matthew',
+    'mat': 'matthew', 'max': 'maxime', 'mike': 'michael', 'mitch': 'mitchell', 'nick': 'nicholas',
+    'nicolas': 'nicholas', 'nik': 'nikolai', 'pat': 'patrick', 'rob': 'robert', 'bobby': 'robert', 'sam': 'samuel',
+    'steve': 'steven', 'stephen': 'steven', 'tom': 'thomas', 'tommy': 'thomas', 'vince': 'vincent',
+    'will': 'william', 'zach': 'zachary', 'zack': 'zachary',
+}
+
+suffixes = {'jr', 'sr', 'ii', 'iii', 'iv'}
+
+punctuation = re.compile(r"[.'`’]")
+separators = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_name(name: str) -> str:
+    """
+    reduce a player name to a comparison key: accents removed, case folded, punctuation dropped, hyphens and other
+    separators collapsed to single spaces, name suffixes removed and the first name expanded from common nicknames
+    :param name: the raw player name
+    :return: normalized name key
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    ascii_name = ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    tokens = separators.sub(' ', punctuation.sub('', ascii_name)).split()
+    tokens = [token for token in tokens if token not in suffixes]
+    if len(tokens) > 1:
+        tokens[0] = nicknames.get(tokens[0], tokens[0])
+    return ' '.join(tokens)
+
+
+def last_name(key: str) -> str:
+    return key.rsplit(' ', 1)[-1]
+
+
+def dice(first: set, second: set) -> float:
+    return 2.0 * len(first & second) / (len(first) + len(second)) if first or second else 0.0
+
+
+def trigrams(key: str) -> set:
+    """
+    get the set of character trigrams of a (padded) name key
+    :param key: normalized name key
+    :return: set of trigrams
+    """
+    padded = '  {} '.format(key)
+    return {padded[idx:idx + 3] for idx in range(len(padded) - 2)}
+
+
+class PlayerIdentityIndex:
+    """
+    Approximate lookup of player names against a fixed list of known names
+    """
+    def __init__(self, names: list, aliases: dict = None, last_name_threshold: float = 0.6):
+        """
+        build the index
+        :param names: the known player names. Lookups return positions in this list
+        :param aliases: optional dictionary of alternate name -> known name for pairs that are too far apart to match
+               approximately (i.e. a different first name altogether)
+        :param last_name_threshold: minimum trigram Dice similarity of the last names for an approximate match
+        """
+        self.names = list(names)
+        self.last_name_threshold = last_name_threshold
+        self.exact = dict()
+        for idx, name in enumerate(self.names):
+            self.exact.setdefault(normalize_name(name), idx)
+        self.last_names = list()
+        self.sizes = np.zeros(len(self.names), dtype=np.int64)
+        postings = dict()
+        for idx, name in enumerate(self.names):
+            key = normalize_name(name)
+            grams = trigrams(key)
+            self.last_names.append(trigrams(last_name(key)))
+            self.sizes[idx] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, list()).append(idx)
+        self.grams = {gram: np.asarray(ids, dtype=np.int64) for gram, ids in postings.items()}  # trigram -> players
+        for alias, name in (aliases or dict()).items():
+            self.add_alias(alias, name)
+
+    def add_alias(self, alias: str, name: str) -> None:
+        """
+        add an exact alternate name for a known player
+        :param alias: the alternate name
+        :param name: the known player name
+        :return: None
+        """
+        key = normalize_name(name)
+        if key not in self.exact:
+            raise KeyError('unknown player {}'.format(name))
+        self.exact[normalize_name(alias)] = self.exact[key]
+
+    def lookup(self, name: str, threshold: float = 0.75) -> tuple:
+        """
+        find the best match for a single name
+        :param name: the name to look up
+        :param threshold: minimum trigram Dice similarity for an approximate match
+        :return: tuple of (position in the known names or -1, similarity score)
+        """
+        key = normalize_name(name)
+        if key in self.exact:
+            return self.exact[key], 1.0
+        candidates, scores = self.score(key)
+        if not len(candidates):
+            return -1, 0.0
+        order = np.argsort(-scores, kind='stable')
+        surname = trigrams(last_name(key))
+        for best in order[scores[order] >= threshold].tolist():
+            if dice(surname, self.last_names[candidates[best]]) >= self.last_name_threshold:
+                return int(candidates[best]), float(scores[best])
+        return -1, float(scores[order[0]])
+
+    def score(self, key: str) -> tuple:
+        """
+        score every known player sharing at least one trigram with a name key
+        :param key: normalized name key
+        :return: tuple of (candidate positions, trigram Dice similarity) arrays
+        """
+        grams = trigrams(key)
+        postings = [self.grams[gram] for gram in grams if gram in self.grams]
+        if not postings:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        candidates, shared = np.unique(np.concatenate(postings), return_counts=True)
+        return candidates, 2.0 * shared / (self.sizes[candidates] + len(grams))
+
+    def closest(self, name: str) -> tuple:
+        """
+        find the most similar known name regardless of any thresholds
+        :param name: the name to look up
+        :return: tuple of (position in the known names or -1, similarity score)
+        """
+        candidates, scores = self.score(normalize_name(name))
+        if not len(candidates):
+            return -1, 0.0
+        best = int(np.argmax(scores))
+        return int(candidates[best]), float(scores[best])
+
+    def match(self, names: list, threshold: float = 0.75) -> tuple:
+        """
+        find the best match for many names
+        :param names: the names to look up
+        :param threshold: minimum trigram Dice similarity for an approximate match
+        :return: tuple of (positions, scores) arrays. Unmatched names have position -1
+        """
+        positions = np.full(len(names), -1, dtype=np.int64)
+        scores = np.zeros(len(names), dtype=np.float64)
+        for idx, name in enumerate(names):
+            positions[idx], scores[idx] = self.lookup(name, threshold)
+        return positions, scores
+
+
+def join_expert_ranks(rankings: pd.DataFrame, experts: dict, threshold: float = 0.75,
+                      aliases: dict = None) -> pd.DataFrame:
+    """
+    add expert ranks to a rankings dataframe, matching players by approximate name
+    :param rankings: dataframe indexed by player name, i.e. from StatsEngine.rank_by_year
+    :param experts: dictionary of source name -> dataframe with 'Player' and 'Rank' columns
+    :param threshold: minimum trigram Dice similarity for an approximate match
+    :param aliases: optional dictionary of alternate name -> rankings name
+    :return: copy of the rankings with a '{source}_rank' column per source (NaN where the source does not rank the
+             player). If several expert rows match the same player the best rank is kept
+    """
+    index = PlayerIdentityIndex(rankings.index.to_list(), aliases)
+    result = rankings.copy()
+    for source, expert in experts.items():
+        positions, _ = index.match(expert['Player'].to_list(), threshold)
+        matched = positions >= 0
+        ranks = np.full(len(result), np.inf)
+        np.minimum.at(ranks, positions[matched], expert['Rank'].to_numpy(dtype=np.float64)[matched])
+        ranks[np.isinf(ranks)] = np.nan
+        result['{}_rank'.format(source)] = ranks
+    return result
+
+
+def unmatched_players(names: list, known: list, threshold: float = 0.75, aliases: dict = None) -> pd.DataFrame:
+    """
+    report the closest known name for every name that does not match, which is useful for building alias tables
+    :param names: the names to check
+    :param known: the known player names
+    :param threshold: minimum trigram Dice similarity for an approximate match
+    :param aliases: optional dictionary of alternate name -> known name
+    :return: dataframe with player, closest and score columns, best scores first
+    """
+    index = PlayerIdentityIndex(known, aliases)
+    records = list()
+    for name in names:
+        position, score = index.lookup(name, threshold)
+        if position < 0:
+            closest, _ = index.closest(name)
+            records.append([name, index.names[closest] if closest >= 0 else None, score])
+    df = pd.DataFrame.from_records(records, columns=['player', 'closest', 'score'])
+    return df.sort_values(by='score', ascending=False)
@@ -38,3 +38,55 @@ def weighted_average_with_experience_adjustment(games_played: int, average_weigh
     progression_multiplier = seasonal_progression_weights[len(stats) - 1]
     base_projection = np.divide(np.sum([x[0] * x[1] for x in zip(average_weights, stats)]), np.sum(average_weights[0:len(stats)]))
     return base_projection * games_played * progression_multiplier
+
+
+def pad_weights(weights: list, seasons: int) -> np.ndarray:
+    """
+    pad or truncate a list of seasonal weights to a fixed number of seasons
+    :param weights: the weights
+    :param seasons: the number of seasons
+    :return: array of weights with zeros for any seasons past the end of the weights list
+    """
+    padded = np.zeros(seasons, dtype=np.float64)
+    count = min(seasons, len(weights))
+    padded[:count] = weights[:count]
+    return padded
+
+
+def batch_weighted_average(games_played: int, weights: list, stats: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    batch version of weighted_average that projects every player and field at once
+    :param games_played: how many games to project
+    :param weights: seasonal weights
+    :param stats: (players x seasons x fields) tensor of per-game stats. Seasons are sorted from newest to oldest and
+           packed to the front of the seasons axis
+    :param mask: (players x seasons) mask of valid seasons
+    :return: (players x fields) array of projected values
+    """
+    counts = mask.sum(axis=1)
+    numerator = np.einsum('ps,psf->pf', pad_weights(weights, stats.shape[1]) * mask, np.where(mask[..., None], stats, 0))
+    # the denominator always sums the first n weights, even when a player has more seasons than there are weights
+    denominator = np.concatenate([[0], np.cumsum(weights)])[np.minimum(counts, len(weights))]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return numerator / denominator[:, None] * games_played
+
+
+def batch_weighted_average_with_experience_adjustment(games_played: int, average_weights: list,
+                                                      seasonal_progression_weights: list, stats: np.ndarray,
+                                                      mask: np.ndarray) -> np.ndarray:
+    """
+    batch version of weighted_average_with_experience_adjustment. Players with more seasons than there are progression
+    weights fall back to their most recent per-game value, matching the per-player projection path.
+    :param games_played: total number of games to project
+    :param average_weights: weighted averaging coefficients
+    :param seasonal_progression_weights: list of seasonal experience weights indexed by the number of seasons played
+    :param stats: (players x seasons x fields) tensor of per-game stats sorted from newest to oldest season
+    :param mask: (players x seasons) mask of valid seasons
+    :return: (players x fields) array of projected values
+    """
+    counts = mask.sum(axis=1)
+    in_range = (counts >= 1) & (counts <= len(seasonal_progression_weights))
+    progression = np.asarray(seasonal_progression_weights, dtype=np.float64)
+    progression = progression[np.clip(counts - 1, 0, len(progression) - 1)]
+    projection = batch_weighted_average(games_played, average_weights, stats, mask) * progression[:, None]
+    return np.where(in_range[:, None], projection, stats[:, 0, :])
@@ -0,0 +1,342 @@
+"""
+    @file query.py
+    @brief lazy query pipelines over a StatsEngine season
+    @author Graham Riches
+    @details
+    A Query records a chain of operations (select, filter, project, zscore, adjust, score, sort, top) without running
+    any of them. collect() plans the whole chain and runs it once:
+
+    - only the raw stat fields the chain actually references are read from storage (column pushdown).
+    - filters on raw fields that come before the first zscore or top step are evaluated inside the scan, on the stored
+      arrays, before any other column is gathered (predicate pushdown). Both steps depend on which rows are present,
+      so a filter after them runs after them. In columnar mode equality and membership tests on string fields compare
+      the interned codes, so nothing is decoded for rows that are dropped.
+    - a filter that repeats a predicate already applied is dropped.
+    - everything after the scan runs on plain numpy arrays, and a single dataframe is built at the end.
+
+    In legacy (Skater) mode the scan falls back to the cached get_stats_by_year frame for the referenced columns.
+
+        engine.query(2021).select('position', 'goals').filter('games_played', '>=', 36).zscore(categories) \
+              .adjust(categories, adjustments).score(categories).top(50, 'fantasy_points_z').collect()
+"""
+import operator
+import numpy as np
+import pandas as pd
+from analysis.stats_types import SkaterSerializer
+
+operators = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    'in': lambda values, options: np.isin(values, list(options)),
+    'not in': lambda values, options: ~np.isin(values, list(options)),
+}
+
+
+class QueryPlan:
+    """
+    The resolved form of a Query: what to project, which fields to scan, which predicates run inside the scan and the
+    remaining steps to run on the scanned arrays
+    """
+    def __init__(self, model: callable, scan: list, output: list, pushed: list, steps: list):
+        """
+        :param model: optional projection model run for the season before the scan
+        :param scan: raw stat fields read from storage
+        :param output: raw stat fields included in the result, in order
+        :param pushed: (column, op, value) predicates evaluated inside the scan
+        :param steps: remaining (op, args) steps
+        """
+        self.model = model
+        self.scan = scan
+        self.output = output
+        self.pushed = pushed
+        self.steps = steps
+
+    def __str__(self) -> str:
+        lines = list()
+        if self.model is not None:
+            lines.append('project {}'.format(getattr(self.model, '__name__', type(self.model).__name__)))
+        lines.append('scan [{}]'.format(', '.join(self.scan)))
+        lines.extend('  where {} {} {!r}'.format(*predicate) for predicate in self.pushed)
+        for op, args in self.steps:
+            lines.append('{} {}'.format(op, ', '.join('{}={!r}'.format(key, value) for key, value in args.items()
+                                                     if key != 'adjustments')))
+        lines.append('output [{}]'.format(', '.join(self.output)))
+        return '\n'.join(lines)
+
+
+class Query:
+    """
+    Lazy, immutable pipeline over one season of skater data. Every builder method returns a new Query
+    """
+    def __init__(self, engine, season: int, steps: tuple = ()):
+        """
+        :param engine: the StatsEngine to read from
+        :param season: the season to query
+        :param steps: recorded (op, args) steps
+        """
+        self.engine = engine
+        self.season = season
+        self.steps = steps
+
+    def _then(self, step: str, **args) -> 'Query':
+        return Query(self.engine, self.season, self.steps + ((step, args),))
+
+    def select(self, *columns: str) -> 'Query':
+        """
+        choose the raw stat fields to include in the result. Derived columns (z-scores, adjustments and scores) are
+        always included. Defaults to every raw field referenced by the query
+        :param columns: raw stat fields
+        :return: new query
+        """
+        return self._then('select', columns=list(columns))
+
+    def filter(self, column: str, op: str, value) -> 'Query':
+        """
+        keep rows where 'column op value' holds
+        :param column: raw stat field or a column derived by an earlier step
+        :param op: one of >, >=, <, <=, ==, !=, in, not in
+        :param value: the value to compare to (a collection for in and not in)
+        :return: new query
+        """
+        if op not in operators:
+            raise ValueError('unsupported filter operator {}'.format(op))
+        return self._then('filter', column=column, op=op, value=value)
+
+    def project(self, model: callable) -> 'Query':
+        """
+        project the query season from the previous seasons before it is read. This stores the projection in the
+        engine, exactly like StatsEngine.project_stats_batch (columnar) or StatsEngine.project_stats (legacy)
+        :param model: projection model for the engine's storage mode
+        :return: new query
+        """
+        return self._then('project', model=model)
+
+    def zscore(self, categories: list) -> 'Query':
+        """
+        add games played normalized '{category}_z' columns over the rows remaining at this point in the chain (see
+        StatsEngine.calculate_z_score_rankings)
+        :param categories: the categories to score
+        :return: new query
+        """
+        return self._then('zscore', categories=list(categories))
+
+    def adjust(self, categories: list, adjustments: dict) -> 'Query':
+        """
+        add positionally adjusted '{category}_adj' columns (see StatsEngine.apply_positional_adjustment)
+        :param categories: the categories to adjust
+        :param adjustments: dictionary of position -> list of category weights
+        :return: new query
+        """
+        return self._then('adjust', categories=list(categories), adjustments=adjustments)
+
+    def score(self, categories: list, z_based: bool = True) -> 'Query':
+        """
+        add fantasy_points (and optionally fantasy_points_z) columns (see StatsEngine.calculate_fantasy_score)
+        :param categories: the fantasy categories
+        :param z_based: also add the z-score based fantasy score
+        :return: new query
+        """
+        return self._then('score', categories=list(categories), z_based=z_based)
+
+    def sort(self, column: str, ascending: bool = False) -> 'Query':
+        """
+        sort the rows by a column. Missing values are always placed last
+        :param column: the column to sort by
+        :param ascending: sort direction
+        :return: new query
+        """
+        return self._then('sort', column=column, ascending=ascending)
+
+    def top(self, k: int, column: str = 'fantasy_points_z', ascending: bool = False) -> 'Query':
+        """
+        keep the best k rows by a column, sorted
+        :param k: the number of rows to keep
+        :param column: the column to rank by
+        :param ascending: keep the smallest values instead of the largest
+        :return: new query
+        """
+        return self._then('top', k=int(k), column=column, ascending=ascending)
+
+    def plan(self) -> QueryPlan:
+        """
+        resolve the recorded steps into a plan
+        :return: the query plan
+        """
+        fields = set(SkaterSerializer.get_all_stat_fields())
+        model = None
+        selected = None
+        referenced = list()
+        derived = set()
+        pushed = list()
+        steps = list()
+        applied = set()
+        barrier = False  # set once a step depends on the row set, filters after it cannot be pushed into the scan
+
+        def reference(column: str) -> None:
+            if column in derived:
+                return
+            if column not in fields:
+                raise KeyError('unknown column {}'.format(column))
+            if column not in referenced:
+                referenced.append(column)
+
+        for op, args in self.steps:
+            if op == 'project':
+                model = args['model']
+            elif op == 'select':
+                for column in args['columns']:
+                    reference(column)
+                selected = list(dict.fromkeys(args['columns']))
+            elif op == 'filter':
+                reference(args['column'])
+                try:
+                    predicate = (args['column'], args['op'], args['value'])
+                    hash(predicate)
+                except TypeError:
+                    predicate = (args['column'], args['op'], tuple(args['value']))
+                if predicate in applied:
+                    continue
+                applied.add(predicate)
+                if not barrier and args['column'] in fields:
+                    pushed.append(predicate)
+                else:
+                    steps.append((op, args))
+            elif op == 'zscore':
+                for column in ['games_played'] + args['categories']:
+                    reference(column)
+                derived.update('{}_z'.format(category) for category in args['categories'])
+                barrier = True
+                steps.append((op, args))
+            elif op == 'adjust':
+                for column in ['position'] + args['categories']:
+                    reference(column)
+                derived.update('{}_adj'.format(category) for category in args['categories'])
+                steps.append((op, args))
+            elif op == 'score':
+                required = ['{}_adj'.format(category) for category in args['categories']]
+                if args['z_based']:
+                    required += ['{}_z'.format(category) for category in args['categories']]
+                missing = [column for column in required if column not in derived]
+                if missing:
+                    raise KeyError('score requires columns {} from an earlier step'.format(', '.join(missing)))
+                derived.update(['fantasy_points', 'fantasy_points_z'] if args['z_based'] else ['fantasy_points'])
+                steps.append((op, args))
+            elif op in ('sort', 'top'):
+                reference(args['column'])
+                barrier = barrier or op == 'top'
+                steps.append((op, args))
+        return QueryPlan(model, referenced, selected if selected is not None else list(referenced), pushed, steps)
+
+    def explain(self) -> str:
+        """
+        describe the query plan
+        :return: plan text
+        """
+        return str(self.plan())
+
+    def collect(self) -> pd.DataFrame:
+        """
+        plan and run the query
+        :return: dataframe indexed by player name with the output raw fields followed by the derived columns in the
+                 order they were added
+        """
+        plan = self.plan()
+        engine = self.engine
+        if plan.model is not None:
+            if engine.store is not None:
+                engine.project_stats_batch(self.season, plan.model)
+            else:
+                engine.project_stats(self.season, plan.model)
+        names, columns = self._scan(plan)
+        derived = list()
+        for op, args in plan.steps:
+            keep = None
+            if op == 'filter':
+                keep = np.asarray(operators[args['op']](columns[args['column']], args['value']), dtype=bool)
+            elif op == 'zscore':
+                categories = args['categories']
+                games_played = columns['games_played']
+                data = np.column_stack([columns[category] for category in categories]).astype(np.float64)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    z_scores = (data - np.mean(data, axis=0)) / games_played[:, None] / np.std(data, axis=0)
+                for idx, category in enumerate(categories):
+                    derived.append(self._add(columns, '{}_z'.format(category), z_scores[:, idx]))
+            elif op == 'adjust':
+                categories = args['categories']
+                weights = engine.positional_weights(columns['position'], args['adjustments'])
+                data = np.column_stack([columns[category] for category in categories]).astype(np.float64)
+                adjusted = data * weights
+                for idx, category in enumerate(categories):
+                    derived.append(self._add(columns, '{}_adj'.format(category), adjusted[:, idx]))
+            elif op == 'score':
+                sets = {'fantasy_points': '{}_adj'}
+                if args['z_based']:
+                    sets['fantasy_points_z'] = '{}_z'
+                for field, pattern in sets.items():
+                    data = np.column_stack([columns[pattern.format(category)] for category in args['categories']])
+                    derived.append(self._add(columns, field, np.sum(data, axis=1)))
+            elif op in ('sort', 'top'):
+                keep = self._order(columns[args['column']], args['ascending'], args.get('k'))
+            if keep is not None:
+                names = names[keep]
+                columns = {column: values[keep] for column, values in columns.items()}
+        data = {column: columns[column] for column in plan.output}
+        data.update({column: columns[column] for column in derived})
+        return pd.DataFrame(data, index=pd.Index(names, name='player_name'))
+
+    def _scan(self, plan: QueryPlan) -> tuple:
+        """
+        read the planned fields for the rows that pass the pushed predicates
+        :param plan: the query plan
+        :return: tuple of (player names, dictionary of field -> values)
+        """
+        store = self.engine.store
+        if store is None:
+            df = self.engine.get_stats_by_year(self.season, plan.scan)
+            names = df['player_name'].to_numpy()
+            columns = {field: df[field].to_numpy() for field in plan.scan}
+            keep = np.ones(len(names), dtype=bool)
+            for column, op, value in plan.pushed:
+                keep &= np.asarray(operators[op](columns[column], value), dtype=bool)
+            return names[keep], {field: values[keep] for field, values in columns.items()}
+
+        rows = np.flatnonzero(store.row_mask(season=self.season))
+        for column, op, value in plan.pushed:
+            values = store.columns[column][rows]
+            if column in store.strings and op in ('==', '!=', 'in', 'not in'):
+                index = store.strings[column].index
+                value = [index.get(option, -1) for option in value] if op in ('in', 'not in') \
+                    else index.get(value, -1)
+            elif column in store.strings:
+                values = store.strings[column].lookup(values)
+            rows = rows[np.asarray(operators[op](values, value), dtype=bool)]
+        rows = rows[np.argsort(store.player_id[rows], kind='stable')]
+        return store.names.lookup(store.player_id[rows]), {field: store.decode(field, rows) for field in plan.scan}
+
+    @staticmethod
+    def _add(columns: dict, column: str, values: np.ndarray) -> str:
+        columns[column] = values
+        return column
+
+    @staticmethod
+    def _order(values: np.ndarray, ascending: bool, k: int = None) -> np.ndarray:
+        """
+        get the row order for a sort, or the sorted best k rows. Missing values sort last
+        :param values: the values to sort by
+        :param ascending: sort direction
+        :param k: optional number of rows to keep
+        :return: row indices
+        """
+        if values.dtype.kind in 'fiub':
+            keys = values.astype(np.float64) if ascending else -values.astype(np.float64)
+            if k is not None and k < len(keys):
+                candidates = np.argpartition(np.where(np.isnan(keys), np.inf, keys), k)[:k]
+                return candidates[np.argsort(keys[candidates], kind='stable')]
+            return np.argsort(keys, kind='stable')
+        order = np.argsort(values, kind='stable')
+        order = order if ascending else order[::-1]
+        return order[:k] if k is not None else order
@@ -0,0 +1,297 @@
+"""
+    @file rankings_export.py
+    @brief partitioned, append-only columnar export of rankings and projections
+    @author Graham Riches
+    @details
+    Frames are written as one numpy array file per column, partitioned by season and position, and every write adds a
+    new snapshot next to the previous ones instead of replacing them:
+
+        {root}/{dataset}/season={season}/position={position}/snapshot={snapshot}/
+            _schema.json    column names and dtypes, row count, partition values and write time
+            {column}.npy    one array per column
+        {root}/{dataset}/season={season}/_snapshots/{snapshot}.json
+                            manifest of the snapshot's position partitions, write time and input fingerprint,
+                            written last
+
+    Multi-position players are partitioned under the joined positions with '-' (i.e. position=C-LW), and a reader that
+    asks for a position reads every partition that lists it. Each partition is written to a temporary directory and
+    renamed into place, and once every position of the season is in place the manifest is atomically created. Readers
+    only see snapshots that have a manifest, so a season snapshot becomes visible all at once and a reader never sees a
+    partially written one. Existing snapshots are never modified. Snapshots are ordered by the write time in their
+    manifest rather than by identifier, so 'latest' is the most recently written snapshot whatever it is called.
+
+    Readers only open the partitions and column files they ask for, and the arrays are memory mapped. Only numpy is
+    imported at module level so the command line top query stays light; read_rankings imports pandas when it is used.
+"""
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+
+index_column = 'player_name'
+order_column = 'rank'
+partition_column = 'position'
+manifest_directory = '_snapshots'
+
+
+def snapshot_id(when: datetime.datetime = None) -> str:
+    """
+    get a sortable snapshot identifier
+    :param when: the snapshot time. Defaults to now
+    :return: UTC timestamp string with microseconds, i.e. 20211004T153000.000123Z
+    """
+    when = when or datetime.datetime.now(datetime.timezone.utc)
+    return when.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S.%fZ')
+
+
+def partition_value(value: str) -> str:
+    return str(value).replace('/', '-') or '_'
+
+
+def as_array(values: np.ndarray) -> np.ndarray:
+    """
+    convert a column to an array that can be stored without pickling. Object (string) columns become unicode arrays
+    :param values: the column values
+    :return: array
+    """
+    values = np.asarray(values)
+    return values.astype(str) if values.dtype == object else values
+
+
+def write_partitions(frame, root: str, dataset: str, season: int, snapshot: str = None, inputs: str = None) -> str:
+    """
+    append a snapshot of one season of a frame, split into position partitions
+    :param frame: dataframe indexed by player name with a position column. Rows are stored in frame order, which is
+           recorded in a rank column (1 is the first row)
+    :param root: the export root directory
+    :param dataset: the dataset name, i.e. 'rankings' or 'projections'
+    :param season: the season of the frame
+    :param snapshot: snapshot identifier. Defaults to the current time
+    :param inputs: optional fingerprint of the inputs the frame was built from, recorded in the manifest
+    :return: the snapshot identifier
+    """
+    if partition_column not in frame.columns:
+        raise ValueError('{} exports are partitioned by {}, which is not a column'.format(dataset, partition_column))
+    if snapshot == 'latest':
+        raise ValueError('latest is reserved for reading the newest snapshot')
+    snapshot = snapshot or snapshot_id()
+    columns = {index_column: as_array(frame.index.to_numpy()), order_column: np.arange(1, len(frame) + 1)}
+    columns.update({column: as_array(frame[column].to_numpy()) for column in frame.columns})
+    keys = np.asarray([partition_value(value) for value in columns[partition_column]], dtype=str)
+    season_directory = os.path.join(root, dataset, 'season={}'.format(season))
+    targets = {value: os.path.join(season_directory, '{}={}'.format(partition_column, value),
+                                   'snapshot={}'.format(snapshot)) for value in np.unique(keys).tolist()}
+    manifest = os.path.join(season_directory, manifest_directory, '{}.json'.format(snapshot))
+    existing = [target for target in list(targets.values()) + [manifest] if os.path.exists(target)]
+    if existing:
+        raise FileExistsError('snapshot {} of {} season {} already exists'.format(snapshot, dataset, season))
+    written = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    rows_by_position = dict()
+    for value, target in targets.items():
+        rows = keys == value
+        parent = os.path.dirname(target)
+        os.makedirs(parent, exist_ok=True)
+        temp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+        try:
+            schema = {'dataset': dataset, 'season': season, partition_column: value, 'snapshot': snapshot,
+                      'written': written, 'rows': int(rows.sum()), 'columns': dict()}
+            for column, values in columns.items():
+                np.save(os.path.join(temp, '{}.npy'.format(column)), values[rows])
+                schema['columns'][column] = values.dtype.str
+            with open(os.path.join(temp, '_schema.json'), 'w') as file:
+                json.dump(schema, file)
+            os.rename(temp, target)
+        except BaseException:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+        rows_by_position[value] = schema['rows']
+
+    # publish the whole season snapshot at once
+    os.makedirs(os.path.dirname(manifest), exist_ok=True)
+    descriptor, temp = tempfile.mkstemp(dir=os.path.dirname(manifest), prefix='.tmp-')
+    try:
+        with os.fdopen(descriptor, 'w') as file:
+            json.dump({'dataset': dataset, 'season': season, 'snapshot': snapshot, 'written': written,
+                       'inputs': inputs, partition_column: rows_by_position}, file)
+        os.link(temp, manifest)  # atomic, and unlike a rename it never replaces an existing manifest
+    finally:
+        os.unlink(temp)
+    return snapshot
+
+
+def partition_directories(directory: str, key: str) -> dict:
+    """
+    find the key=value subdirectories of a directory
+    :param directory: the directory to search
+    :param key: the partition key
+    :return: dictionary of value -> directory
+    """
+    if not os.path.isdir(directory):
+        return dict()
+    prefix = '{}='.format(key)
+    return {name[len(prefix):]: os.path.join(directory, name) for name in os.listdir(directory)
+            if name.startswith(prefix)}
+
+
+def manifests(season_directory: str) -> dict:
+    """
+    find the published snapshots of a season
+    :param season_directory: the season partition directory
+    :return: dictionary of snapshot identifier -> manifest path
+    """
+    directory = os.path.join(season_directory, manifest_directory)
+    if not os.path.isdir(directory):
+        return dict()
+    return {os.path.splitext(name)[0]: os.path.join(directory, name) for name in os.listdir(directory)
+            if name.endswith('.json') and not name.startswith('.')}
+
+
+def publish_time(manifest: str) -> datetime.datetime:
+    """
+    get the time a snapshot was written
+    :param manifest: path to the snapshot's manifest
+    :return: UTC datetime
+    """
+    with open(manifest) as file:
+        return datetime.datetime.fromisoformat(json.load(file)['written'])
+
+
+def publish_order(published: dict) -> list:
+    """
+    order published snapshots by the time they were written. Snapshot identifiers can be any string, so they are only
+    used to break ties
+    :param published: dictionary of snapshot identifier -> manifest path
+    :return: list of snapshot identifiers, oldest first
+    """
+    return sorted(published, key=lambda snapshot: (publish_time(published[snapshot]), snapshot))
+
+
+def snapshots(root: str, dataset: str, season: int = None) -> list:
+    """
+    list the published snapshots of a dataset
+    :param root: the export root directory
+    :param dataset: the dataset name
+    :param season: optional season to restrict to
+    :return: list of snapshot identifiers, ordered by the time they were first written
+    """
+    first = dict()
+    for value, season_directory in partition_directories(os.path.join(root, dataset), 'season').items():
+        if season is None or int(value) == season:
+            for snapshot, manifest in manifests(season_directory).items():
+                written = publish_time(manifest)
+                first[snapshot] = min(first.get(snapshot, written), written)
+    return sorted(first, key=lambda snapshot: (first[snapshot], snapshot))
+
+
+def exported_seasons(root: str, dataset: str) -> list:
+    """
+    list the seasons of a dataset that have a published snapshot
+    :param root: the export root directory
+    :param dataset: the dataset name
+    :return: sorted list of seasons
+    """
+    season_directories = partition_directories(os.path.join(root, dataset), 'season')
+    return sorted(int(value) for value, directory in season_directories.items() if manifests(directory))
+
+
+def partitions(root: str, dataset: str, seasons: list = None, positions: list = None,
+               snapshot: str = 'latest') -> list:
+    """
+    find the partition directories that match a selection
+    :param root: the export root directory
+    :param dataset: the dataset name
+    :param seasons: optional seasons to read
+    :param positions: optional positions to read. Multi-position partitions are read if they list any of them
+    :param snapshot: 'latest' for the most recently written snapshot of each season, a snapshot identifier, or None
+           for every snapshot
+    :return: list of (season, snapshot, directory) tuples
+    """
+    selected = list()
+    for value, season_directory in partition_directories(os.path.join(root, dataset), 'season').items():
+        season = int(value)
+        if seasons is not None and season not in seasons:
+            continue
+        published = manifests(season_directory)
+        wanted = snapshot
+        if snapshot == 'latest':
+            # the newest snapshot of the whole season, so a position missing from it is not read from an older one
+            wanted = publish_order(published)[-1] if published else None
+        for position, position_directory in partition_directories(season_directory, partition_column).items():
+            if positions is not None and not set(position.split('-')) & set(positions):
+                continue
+            selected.extend((season, name, directory) for name, directory in
+                            partition_directories(position_directory, 'snapshot').items()
+                            if name in published and (wanted is None or name == wanted))
+    return sorted(selected)
+
+
+def latest_manifest(root: str, dataset: str, season: int) -> dict:
+    """
+    read the manifest of the newest snapshot of a season
+    :param root: the export root directory
+    :param dataset: the dataset name
+    :param season: the season
+    :return: the manifest, or None if the season has no snapshots
+    """
+    published = manifests(os.path.join(root, dataset, 'season={}'.format(season)))
+    if not published:
+        return None
+    with open(published[publish_order(published)[-1]]) as file:
+        return json.load(file)
+
+
+def read_columns(root: str, dataset: str, seasons: list = None, positions: list = None, columns: list = None,
+                 snapshot: str = 'latest') -> dict:
+    """
+    read a selection of columns and partitions into numpy arrays
+    :param root: the export root directory
+    :param dataset: the dataset name
+    :param seasons: optional seasons to read
+    :param positions: optional positions to read
+    :param columns: optional columns to read. Defaults to every column
+    :param snapshot: see partitions
+    :return: dictionary of column -> array with player_name, season, snapshot and rank always included, sorted by
+             season, snapshot and rank
+    """
+    parts = partitions(root, dataset, seasons, positions, snapshot)
+    reserved = [index_column, 'season', 'snapshot', order_column]
+    data = {column: list() for column in reserved}
+    for season, name, directory in parts:
+        with open(os.path.join(directory, '_schema.json')) as file:
+            schema = json.load(file)
+        selected = list(schema['columns']) if columns is None else columns
+        missing = [column for column in selected if column not in schema['columns']]
+        if missing:
+            raise KeyError('unknown columns {}. Available columns: {}'.format(', '.join(missing),
+                                                                              ', '.join(schema['columns'])))
+        for column in [index_column, order_column] + [column for column in selected if column not in reserved]:
+            data.setdefault(column, list()).append(np.load(os.path.join(directory, '{}.npy'.format(column)),
+                                                           mmap_mode='r'))
+        data['season'].append(np.full(schema['rows'], season))
+        data['snapshot'].append(np.full(schema['rows'], name))
+    if not parts:
+        return {column: np.zeros(0) for column in data}
+    data = {column: np.concatenate(values) for column, values in data.items()}
+    order = np.lexsort((data[order_column], data['snapshot'], data['season']))
+    return {column: values[order] for column, values in data.items()}
+
+
+def read_rankings(root: str, dataset: str = 'rankings', seasons: list = None, positions: list = None,
+                  columns: list = None, snapshot: str = 'latest'):
+    """
+    read a selection of columns and partitions into a dataframe
+    :param root: the export root directory
+    :param dataset: the dataset name
+    :param seasons: optional seasons to read
+    :param positions: optional positions to read
+    :param columns: optional columns to read. Defaults to every column
+    :param snapshot: see partitions
+    :return: dataframe indexed by player name with season, snapshot and rank columns followed by the selected columns,
+             sorted by season, snapshot and rank
+    """
+    import pandas as pd
+    data = read_columns(root, dataset, seasons, positions, columns, snapshot)
+    names = data.pop(index_column)
+    return pd.DataFrame(data, index=pd.Index(names, name=index_column))
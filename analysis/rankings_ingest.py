@@ -0,0 +1,196 @@
+"""
+    @file rankings_ingest.py
+    @brief parse raw expert rankings and aggregate them into a single consensus ranking
+    @author Graham Riches
+    @details
+    Each ranking source has a line parser built on a precompiled pattern. Source files are streamed line by line and
+    every source is parsed concurrently into normalized (rank, player, team, positions) records. Positions use the same
+    '/' separated format as the skater stats (i.e. "C/LW"). The records of all sources are then stacked and pivoted
+    by normalized player name (see player_identity.normalize_name), so the per-source ranks line up by player rather
+    than by position in the file, and the mean/min/max/median and consensus rank are computed in one vectorized step.
+    Run from anywhere (paths default to the repository data directory):
+        python -m analysis.rankings_ingest
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from analysis.player_identity import normalize_name
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+raw_directory = os.path.join(repo_root, 'data', 'rankings')
+curated_directory = os.path.join(repo_root, 'data', 'curated_rankings')
+
+record_columns = ['Rank', 'Player', 'Team', 'Positions']
+
+# i.e. "1	Connor McDavid	3	12/20 – Projected points place him on top"
+dobber_pattern = re.compile(r'^(\d+)\t([^\t]+)')
+# i.e. "3. Leon Draisaitl, C/LW, EDM" with optional status markers ("BOS*", "DAL (DTD)")
+nhl_pattern = re.compile(r'^(\d+)\.\s+([^,]+),\s*([\w/]+),\s*([A-Z]+)')
+# i.e. "3	Leon Draisaitl (EDM - C,LW)	3	3"
+yahoo_pattern = re.compile(r'^(\d+)\t(.+?)\s+\((\w+)\s+-\s+([\w, ]+)\)')
+# i.e. "3","Leon Draisaitl","EDM","C,LW","3",...
+fantasy_pro_pattern = re.compile(r'^"(\d+)","([^"]+)","([^"]*)","([^"]*)"')
+position_separator = re.compile(r'[\s,/]+')
+quotes = str.maketrans({'\u2019': "'", '\u2018': "'"})
+
+
+def clean_positions(positions: str) -> str:
+    """
+    convert a source position list to the '/' separated stats format. The generic forward position 'F' is dropped
+    :param positions: raw positions, i.e. "C,LW", "C, LW" or "C/LW"
+    :return: cleaned positions, i.e. "C/LW"
+    """
+    positions = position_separator.split(positions.strip())
+    return '/'.join(position for position in positions if position and position != 'F')
+
+
+def clean_player(player: str) -> str:
+    return player.strip().translate(quotes)
+
+
+def parse_dobber_line(line: str) -> tuple:
+    match = dobber_pattern.match(line)
+    return (int(match.group(1)), clean_player(match.group(2)), '', '') if match else None
+
+
+def parse_nhl_line(line: str) -> tuple:
+    match = nhl_pattern.match(line)
+    if match is None:
+        return None
+    return int(match.group(1)), clean_player(match.group(2)), match.group(4), clean_positions(match.group(3))
+
+
+def parse_yahoo_line(line: str) -> tuple:
+    match = yahoo_pattern.match(line)
+    if match is None:
+        return None
+    return int(match.group(1)), clean_player(match.group(2)), match.group(3), clean_positions(match.group(4))
+
+
+def parse_fantasy_pro_line(line: str) -> tuple:
+    match = fantasy_pro_pattern.match(line)
+    if match is None:
+        return None
+    return int(match.group(1)), clean_player(match.group(2)), match.group(3), clean_positions(match.group(4))
+
+
+# source name -> line parser. Parsers return (rank, player, team, positions) or None for lines to skip (i.e. headers)
+parsers = {
+    'dobber': parse_dobber_line,
+    'fantasy_pro': parse_fantasy_pro_line,
+    'nhl': parse_nhl_line,
+    'yahoo': parse_yahoo_line,
+}
+
+
+def parse_source(source: str, filename: str) -> pd.DataFrame:
+    """
+    stream a raw rankings file through its source parser
+    :param source: the source name (a key of parsers)
+    :param filename: the raw rankings file
+    :return: dataframe with Rank, Player, Team and Positions columns
+    """
+    parser = parsers[source]
+    with open(filename, encoding='utf-8') as file:
+        records = [record for record in map(parser, file) if record is not None]
+    return pd.DataFrame.from_records(records, columns=record_columns)
+
+
+def _parse_job(job: tuple) -> pd.DataFrame:
+    return parse_source(*job)
+
+
+def parse_sources(sources: dict, workers: int = None, processes: bool = True) -> dict:
+    """
+    parse many ranking sources concurrently
+    :param sources: dictionary of source name -> raw rankings file
+    :param workers: number of workers. Defaults to one per source up to the cpu count
+    :param processes: use a process pool instead of a thread pool
+    :return: dictionary of source name -> dataframe of records, in the same order as the sources
+    """
+    jobs = list(sources.items())
+    if not jobs:
+        return dict()
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    if workers == 1:
+        return {source: parse_source(source, filename) for source, filename in jobs}
+    executor_type = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_type(max_workers=workers) as executor:
+        frames = list(executor.map(_parse_job, jobs))
+    return {source: frame for (source, _), frame in zip(jobs, frames)}
+
+
+def aggregate_rankings(rankings: dict) -> pd.DataFrame:
+    """
+    combine the records of many sources into one table, matching players by normalized name
+    :param rankings: dictionary of source name -> dataframe with Rank, Player, Team and Positions columns
+    :return: dataframe indexed by player name with a rank column per source, sources (the number of sources that
+             rank the player), average_ranking, median_ranking, highest_ranking, lowest_ranking and consensus_rank
+             columns, sorted by consensus rank. Team and positions are taken from the first source that lists them
+    """
+    stacked = pd.concat([frame.assign(source=source) for source, frame in rankings.items()], ignore_index=True)
+    stacked['key'] = [normalize_name(player) for player in stacked['Player'].to_list()]
+    # the best rank wins if a source lists the same player twice
+    ranks = stacked.pivot_table(index='key', columns='source', values='Rank', aggfunc='min', sort=False)
+    ranks = ranks.reindex(columns=list(rankings.keys())).astype(np.float64)
+    listed = stacked.replace({'Team': {'': np.nan}, 'Positions': {'': np.nan}})
+    first = listed.groupby('key', sort=False)[['Player', 'Team', 'Positions']].first()
+
+    values = ranks.to_numpy()
+    result = ranks.copy()
+    result.columns = [str(column) for column in ranks.columns]
+    result['sources'] = np.sum(~np.isnan(values), axis=1)
+    result['average_ranking'] = np.nanmean(values, axis=1)
+    result['median_ranking'] = np.nanmedian(values, axis=1)
+    result['highest_ranking'] = np.nanmin(values, axis=1)
+    result['lowest_ranking'] = np.nanmax(values, axis=1)
+    result.insert(0, 'positions', first.loc[result.index, 'Positions'].to_numpy())
+    result.insert(0, 'team', first.loc[result.index, 'Team'].to_numpy())
+    result.index = pd.Index(first.loc[result.index, 'Player'].to_numpy(), name='player_name')
+    # players ranked by more sources break ties in the average
+    result = result.sort_values(by=['average_ranking', 'sources'], ascending=[True, False], kind='stable')
+    result['consensus_rank'] = np.arange(1, len(result) + 1)
+    return result
+
+
+def ingest_rankings(raw_dir: str = raw_directory, curated_dir: str = curated_directory, sources: list = None,
+                    workers: int = None) -> pd.DataFrame:
+    """
+    parse every raw rankings file, write the normalized per-source files and the aggregate ranking
+    :param raw_dir: directory of raw '{source}.txt' files
+    :param curated_dir: output directory for '{source}_rankings.csv' and aggregate_rankings.csv
+    :param sources: the sources to ingest. Defaults to every source with a raw file
+    :param workers: number of parser processes
+    :return: the aggregate ranking dataframe
+    """
+    if sources is None:
+        sources = [source for source in parsers if os.path.exists(os.path.join(raw_dir, '{}.txt'.format(source)))]
+    rankings = parse_sources({source: os.path.join(raw_dir, '{}.txt'.format(source)) for source in sources}, workers)
+    os.makedirs(curated_dir, exist_ok=True)
+    for source, frame in rankings.items():
+        frame.to_csv(os.path.join(curated_dir, '{}_rankings.csv'.format(source)), index=False)
+    aggregate = aggregate_rankings(rankings)
+    aggregate.to_csv(os.path.join(curated_dir, 'aggregate_rankings.csv'))
+    return aggregate
+
+
+def load_curated_rankings(curated_dir: str = curated_directory, sources: list = None) -> dict:
+    """
+    read the normalized per-source files written by ingest_rankings
+    :param curated_dir: directory of '{source}_rankings.csv' files
+    :param sources: the sources to read. Defaults to every known source with a file
+    :return: dictionary of source name -> dataframe with Rank, Player, Team and Positions columns
+    """
+    if sources is None:
+        sources = [source for source in parsers
+                   if os.path.exists(os.path.join(curated_dir, '{}_rankings.csv'.format(source)))]
+    return {source: pd.read_csv(os.path.join(curated_dir, '{}_rankings.csv'.format(source)),
+                                keep_default_na=False, dtype={'Team': str, 'Positions': str})
+            for source in sources}
+
+
+if __name__ == '__main__':
+    aggregate = ingest_rankings()
+    print(aggregate.head(25))
@@ -0,0 +1,354 @@
+"""
+    @file rankings_service.py
+    @brief long-running rankings query service with a local HTTP/JSON API
+    @author Graham Riches
+    @details
+    The service runs the same load -> project -> rank pipeline as run_stats_engine.py once, and keeps the ranked
+    seasons in a RankingsIndex: rows sorted by fantasy_points_z with pre-built JSON records, per-position and per-team
+    partitions of the sorted row numbers, and a per-player list of ranked seasons. Queries only slice those arrays, so
+    they do not touch pandas or the engine.
+
+    The index is immutable. A background task polls the skater data directories and the config file and, when a
+    season file is added, removed or changed or the config changes, rebuilds the index in a worker thread and swaps it
+    in with a single assignment, so readers never block on a reload. The seasons are rediscovered on every rebuild.
+
+    Endpoints (GET only):
+        /seasons
+        /top?season=2021&n=25&position=C&team=TOR&min_games=40
+        /player?name=Connor McDavid
+    Run from the repository root:
+        python -m analysis.rankings_service --port 8080
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+import pandas as pd
+from analysis.data_files import discover_years, read_config, season_files
+from analysis.stats_engine import StatsEngine
+
+logger = logging.getLogger(__name__)
+
+
+class SeasonIndex:
+    """
+    Ranked rows of a single season in fantasy_points_z order
+    """
+    def __init__(self, season: int, rankings: pd.DataFrame):
+        """
+        :param season: the ranked season
+        :param rankings: ranked dataframe from StatsEngine.rank_by_year, sorted from best to worst
+        """
+        self.season = season
+        df = rankings.reset_index(drop=True)
+        if 'player_name' not in df.columns:
+            df.insert(0, 'player_name', rankings.index.to_numpy())
+        self.names = df['player_name'].to_numpy(dtype=str)
+        self.games = df['games_played'].to_numpy(dtype=np.float64)
+        self.records = [{key: SeasonIndex.json_value(value) for key, value in record.items()}
+                        for record in df.to_dict('records')]
+        for rank, record in enumerate(self.records):
+            record['season'] = season
+            record['rank'] = rank + 1
+        self.positions = self.partition(df['position'].to_numpy(dtype=str), split=True)
+        self.teams = self.partition(df['team'].to_numpy(dtype=str)) if 'team' in df.columns else dict()
+
+    @staticmethod
+    def json_value(value):
+        """
+        convert a numpy scalar to a JSON serializable value. Non-finite floats become None
+        """
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        return value
+
+    @staticmethod
+    def partition(values: np.ndarray, split: bool = False) -> dict:
+        """
+        group the (already sorted) row numbers by value
+        :param values: the value of each row
+        :param split: treat values as '/' separated lists (i.e. multi-position players), adding the row to each group
+        :return: dictionary of value -> ascending array of row numbers
+        """
+        groups = dict()
+        for row, value in enumerate(values.tolist()):
+            for key in (value.split('/') if split else [value]):
+                groups.setdefault(key, list()).append(row)
+        return {key: np.asarray(rows, dtype=np.int64) for key, rows in groups.items()}
+
+    def top(self, n: int, position: str = None, team: str = None, min_games: float = None) -> list:
+        """
+        get the best ranked rows matching a set of filters
+        :param n: maximum number of rows
+        :param position: only include players eligible at a position
+        :param team: only include players on a team
+        :param min_games: only include players with at least this many games played
+        :return: list of JSON records, best first
+        """
+        if n < 0:
+            raise ValueError('n must be a non-negative integer')
+        rows = None
+        if position is not None:
+            rows = self.positions.get(position, np.empty(0, dtype=np.int64))
+        if team is not None:
+            team_rows = self.teams.get(team, np.empty(0, dtype=np.int64))
+            rows = team_rows if rows is None else np.intersect1d(rows, team_rows, assume_unique=True)
+        if min_games is not None:
+            rows = np.flatnonzero(self.games >= min_games) if rows is None else rows[self.games[rows] >= min_games]
+        if rows is None:
+            return self.records[:n]
+        return [self.records[row] for row in rows[:n].tolist()]
+
+
+class RankingsIndex:
+    """
+    Immutable lookup structure over the ranked seasons
+    """
+    def __init__(self, rankings: dict):
+        """
+        :param rankings: dictionary of season -> ranked dataframe from StatsEngine.rank_by_year
+        """
+        self.seasons = {season: SeasonIndex(season, df) for season, df in rankings.items()}
+        self.players = dict()  # case folded name -> list of records, oldest season first
+        for season in sorted(self.seasons):
+            for record in self.seasons[season].records:
+                self.players.setdefault(record['player_name'].casefold(), list()).append(record)
+
+    def top(self, season: int, n: int = 25, position: str = None, team: str = None, min_games: float = None) -> list:
+        """
+        get the top ranked players of a season
+        :param season: the season
+        :param n: maximum number of players
+        :param position: only include players eligible at a position
+        :param team: only include players on a team
+        :param min_games: only include players with at least this many games played
+        :return: list of JSON records, best first
+        """
+        if season not in self.seasons:
+            raise KeyError('no rankings for season {}'.format(season))
+        return self.seasons[season].top(n, position, team, min_games)
+
+    def player(self, name: str) -> list:
+        """
+        get a player's rankings across all seasons
+        :param name: the player name (case insensitive)
+        :return: list of JSON records, oldest season first
+        """
+        key = name.casefold()
+        if key not in self.players:
+            raise KeyError('no rankings for player {}'.format(name))
+        return self.players[key]
+
+
+class RankingsService:
+    """
+    Builds a RankingsIndex from the season data files, serves it over HTTP and rebuilds it when the files change
+    """
+    def __init__(self, data_dir: str, config_path: str, projection: callable, cache_dir: str = None,
+                 poll_interval: float = 5.0):
+        """
+        :param data_dir: the data directory. Every season with both skaters/basic/{year}.csv and
+               skaters/advanced/{year}.csv is loaded
+        :param config_path: the analysis configuration file (see config/config.json)
+        :param projection: batch projection model for StatsEngine.project_stats_batch. The season after the last year
+               is projected
+        :param cache_dir: optional season cache directory
+        :param poll_interval: seconds between checks of the data directories and config for changes
+        """
+        self.data_dir = data_dir
+        self.config_path = config_path
+        self.projection = projection
+        self.cache_dir = cache_dir
+        self.poll_interval = poll_interval
+        self.index = None
+        self.stamp = None
+
+    def snapshot(self) -> tuple:
+        """
+        get the modification time and size of the config file and of every season file in the data directories
+        :return: tuple of ((mtime_ns, size) of the config or None if it is missing, sorted tuple of
+                 (kind, season, mtime_ns, size) per season file)
+        """
+        try:
+            stat = os.stat(self.config_path)
+            config = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            config = None
+        files = list()
+        for kind in ('basic', 'advanced'):
+            for season, filename in season_files(os.path.join(self.data_dir, 'skaters', kind)).items():
+                try:
+                    stat = os.stat(filename)
+                except FileNotFoundError:
+                    continue
+                files.append((kind, season, stat.st_mtime_ns, stat.st_size))
+        return config, tuple(sorted(files))
+
+    def build(self) -> RankingsIndex:
+        """
+        run the ranking pipeline for every season in the data directory and the projected season
+        :return: new rankings index
+        """
+        config = read_config(self.config_path)
+        years = discover_years(self.data_dir)
+        if not years:
+            raise ValueError('no skater data found in {}'.format(os.path.join(self.data_dir, 'skaters')))
+        engine = StatsEngine(columnar=True, cache_dir=self.cache_dir)
+        engine.add_skaters_from_csv(years, os.path.join(self.data_dir, 'skaters', 'basic', '{}.csv'),
+                                    os.path.join(self.data_dir, 'skaters', 'advanced', '{}.csv'))
+        engine.drop_by_games_played(25)
+        projected = years[-1] + 1
+        engine.project_stats_batch(projected, self.projection)
+        engine.constrain_by_year(years[-1])
+        display = list(config['display_categories'])
+        if 'team' not in display:
+            display.append('team')
+        rankings = {year: engine.rank_by_year(year, config['stats_categories'], display,
+                                              config['fantasy_categories'], config['positional_adjustments'])
+                    for year in years + [projected]}
+        return RankingsIndex(rankings)
+
+    def load(self) -> None:
+        """
+        (re)build the index synchronously
+        :return: None
+        """
+        stamp = self.snapshot()
+        self.index = self.build()
+        self.stamp = stamp
+
+    async def watch(self) -> None:
+        """
+        poll the data directories and config and rebuild the index in a worker thread whenever they change
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            stamp = self.snapshot()
+            if stamp == self.stamp:
+                continue
+            try:
+                index = await loop.run_in_executor(None, self.build)
+            except Exception:
+                # i.e. a data file or the config is mid-write; keep serving the old index and retry on the next poll
+                logger.exception('rankings reload failed, serving the previous rankings')
+                continue
+            self.index = index
+            self.stamp = stamp
+
+    def query(self, path: str, params: dict) -> tuple:
+        """
+        answer a single API request
+        :param path: the request path
+        :param params: dictionary of query parameter -> value
+        :return: tuple of (HTTP status, JSON payload)
+        """
+        index = self.index
+        required = {'/seasons': [], '/top': ['season'], '/player': ['name']}
+        if path not in required:
+            return 404, {'error': 'unknown endpoint {}'.format(path)}
+        missing = [param for param in required[path] if param not in params]
+        if missing:
+            return 400, {'error': 'missing parameter {}'.format(', '.join(missing))}
+        try:
+            if path == '/seasons':
+                return 200, {'seasons': sorted(index.seasons)}
+            if path == '/top':
+                min_games = params.get('min_games')
+                n = params.get('n', '25')
+                if not n.isdigit():
+                    return 400, {'error': 'n must be a non-negative integer'}
+                return 200, index.top(int(params['season']), int(n), params.get('position'),
+                                      params.get('team'), float(min_games) if min_games is not None else None)
+            return 200, index.player(params['name'])
+        except KeyError as error:
+            return 404, {'error': error.args[0]}
+        except ValueError as error:
+            return 400, {'error': str(error)}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        serve HTTP/1.1 requests on a single (keep-alive) connection
+        """
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                if 'content-length' in headers:
+                    await reader.readexactly(int(headers['content-length']))
+                parts = request.decode('latin-1').split()
+                if len(parts) != 3:
+                    status, payload = 400, {'error': 'malformed request'}
+                elif parts[0] != 'GET':
+                    status, payload = 405, {'error': 'only GET is supported'}
+                else:
+                    url = urlsplit(parts[1])
+                    params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                    status, payload = self.query(url.path, params)
+                keep_alive = len(parts) == 3 and parts[2] == 'HTTP/1.1' and headers.get('connection') != 'close'
+                body = json.dumps(payload).encode()
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                             'Connection: {}\r\n\r\n'.format(status, reasons[status], len(body),
+                                                             'keep-alive' if keep_alive else 'close').encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080) -> None:
+        """
+        build the index (if required) and serve the API until cancelled
+        :param host: the interface to listen on
+        :param port: the port to listen on
+        :return: None
+        """
+        if self.index is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.load)
+        server = await asyncio.start_server(self.handle, host, port)
+        watcher = asyncio.create_task(self.watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+
+reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+if __name__ == '__main__':
+    import argparse
+    from functools import partial
+    from analysis.projections import batch_weighted_average_with_experience_adjustment
+    parser = argparse.ArgumentParser(description='serve skater rankings over a local HTTP/JSON API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--poll', type=float, default=5.0, help='seconds between data file change checks')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    projection = partial(batch_weighted_average_with_experience_adjustment, 82,
+                         [4.0, 3.0, 2.0, 1.0, 1.0, 1.0],
+                         [1.0, 1.10, 1.15, 1.0, 1.0, 1.0, 1.0])
+    service = RankingsService('data', 'config/config.json', projection, cache_dir='data/.cache',
+                              poll_interval=args.poll)
+    service.load()
+    print('serving rankings for seasons {} on http://{}:{}'.format(sorted(service.index.seasons), args.host,
+                                                                   args.port))
+    asyncio.run(service.serve(args.host, args.port))
@@ -0,0 +1,136 @@
+"""
+    @file season_cache.py
+    @brief persistent binary cache of parsed season files
+    @author Graham Riches
+    @details
+    Parsed seasons are stored as a single structured .npy record array (one record field per column plus the player
+    names) which is memory mapped on load. Entries are keyed by the content hash of the source csv and a fingerprint of
+    the parser schema, so they rebuild automatically when either changes. An index of source file mtimes and sizes
+    avoids re-hashing files that have not been touched since the last run.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+from analysis.csv_loader import ParsedSeason, layouts
+
+# bump this when the csv parsing logic changes in a way that is not captured by the layouts
+SCHEMA_VERSION = 1
+
+
+def schema_fingerprint(kind: str) -> str:
+    """
+    get a fingerprint of the parser schema for a kind of season file
+    :param kind: the layout of the file (key into layouts)
+    :return: hex digest
+    """
+    layout = layouts[kind]
+    schema = [SCHEMA_VERSION, kind, layout.stats_type.fields, [t.__name__ for t in layout.stats_type.types],
+              layout.name_column, layout.field_columns, layout.name_separator, layout.header]
+    return hashlib.sha1(json.dumps(schema).encode()).hexdigest()
+
+
+def file_digest(filename: str) -> str:
+    """
+    hash the contents of a file
+    :param filename: the file to hash
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SeasonCache:
+    def __init__(self, directory: str):
+        """
+        create a new season cache
+        :param directory: the directory to store cache entries in. Created if it does not exist
+        """
+        self.directory = directory
+        self.index_file = os.path.join(directory, 'index.json')
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self.index_file, 'r') as file:
+                self.index = json.load(file)
+        except (OSError, ValueError):
+            self.index = dict()
+
+    def _save_index(self) -> None:
+        temp = self.index_file + '.tmp'
+        with open(temp, 'w') as file:
+            json.dump(self.index, file)
+        os.replace(temp, self.index_file)
+
+    def entry_path(self, filename: str, kind: str) -> str:
+        """
+        get the cache entry file for a source file. The content hash is only recomputed when the file's mtime or
+        size differ from the last time it was seen.
+        :param filename: the source csv file
+        :param kind: the layout of the file
+        :return: path of the cache entry file (which may not exist yet)
+        """
+        source = os.path.abspath(filename)
+        stat = os.stat(source)
+        known = self.index.get(source)
+        if known is not None and known['mtime_ns'] == stat.st_mtime_ns and known['size'] == stat.st_size:
+            digest = known['digest']
+        else:
+            digest = file_digest(source)
+            self.index[source] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'digest': digest}
+            self._save_index()
+            if known is not None and known['digest'] != digest:
+                self.remove_entries(known['digest'])
+        return os.path.join(self.directory, '{}_{}_{}.npy'.format(kind, digest[:24], schema_fingerprint(kind)[:12]))
+
+    def remove_entries(self, digest: str) -> None:
+        """
+        remove all cache entries built from a source file with a specific content hash, unless another indexed source
+        file still has that content
+        :param digest: the content hash
+        :return: None
+        """
+        if any(entry['digest'] == digest for entry in self.index.values()):
+            return
+        for entry in os.listdir(self.directory):
+            if '_{}_'.format(digest[:24]) in entry:
+                os.remove(os.path.join(self.directory, entry))
+
+    def lookup(self, filename: str, kind: str) -> ParsedSeason:
+        """
+        load a cached season
+        :param filename: the source csv file
+        :param kind: the layout of the file
+        :return: the parsed season with memory mapped columns, or None if it is not cached
+        """
+        path = self.entry_path(filename, kind)
+        if not os.path.isfile(path):
+            return None
+        records = np.load(path, mmap_mode='r')
+        names = records['player_name'].tolist()
+        columns = {field: records[field] for field in layouts[kind].stats_type.fields}
+        return ParsedSeason(names, columns)
+
+    def store(self, filename: str, kind: str, season: ParsedSeason) -> None:
+        """
+        write a parsed season to the cache
+        :param filename: the source csv file
+        :param kind: the layout of the file
+        :param season: the parsed season
+        :return: None
+        """
+        path = self.entry_path(filename, kind)
+        if os.path.isfile(path):
+            return
+        columns = {'player_name': np.asarray(season.names, dtype=str)}
+        columns.update({field: np.asarray(column) for field, column in season.columns.items()})
+        records = np.zeros(len(season), dtype=[(field, column.dtype) for field, column in columns.items()])
+        for field, column in columns.items():
+            records[field] = column
+        handle, temp = tempfile.mkstemp(dir=self.directory, suffix='.npy')
+        with os.fdopen(handle, 'wb') as file:
+            np.save(file, records)
+        os.replace(temp, path)
@@ -0,0 +1,177 @@
+"""
+    @file shared_store.py
+    @brief publish columnar stats stores to a shared memory mapped file and attach to them zero-copy
+    @author Graham Riches
+    @details
+    A loaded engine's skater and goalie stores are written once into a single snapshot file: a small json header that
+    describes every array (dtype, shape and offset) followed by the raw array data. By default the file is created in
+    /dev/shm (POSIX shared memory on linux) and falls back to the temporary directory elsewhere. Any number of
+    processes can then map the file read-only and wrap the arrays in place with np.frombuffer, so attaching only reads
+    the header and its cost does not depend on the size of the dataset. The pages are shared between every process
+    that maps them.
+
+    String tables are stored as fixed width unicode arrays. The python list and dictionary of an attached string table
+    are only built when something needs them (i.e. interning a new string). Decoding codes reads the unicode array
+    directly.
+
+    Snapshots are immutable: publishing again writes a new file and atomically replaces the old one. Processes that
+    are already attached keep the snapshot they mapped.
+"""
+import json
+import mmap
+import os
+import tempfile
+import numpy as np
+from analysis import stats_types
+from analysis.columnar_store import ColumnarStore, StringTable
+
+magic = b'NHLSTATS'
+version = 1
+alignment = 64
+
+
+class SharedStringTable(StringTable):
+    """
+    String table backed by a (read-only) fixed width unicode array. The values list and index dictionary are built
+    on first use
+    """
+    def __init__(self, array: np.ndarray):
+        """
+        :param array: unicode array of the values in code order
+        """
+        self.array = array
+        self._values = None
+        self._index = None
+
+    @property
+    def values(self) -> list:
+        if self._values is None:
+            self._values = self.array.tolist()
+        return self._values
+
+    @values.setter
+    def values(self, values: list) -> None:
+        self._values = values
+
+    @property
+    def index(self) -> dict:
+        if self._index is None:
+            self._index = {value: code for code, value in enumerate(self.values)}
+        return self._index
+
+    @index.setter
+    def index(self, index: dict) -> None:
+        self._index = index
+
+    def __len__(self) -> int:
+        return len(self.array) if self._values is None else len(self._values)
+
+    def lookup(self, codes: np.ndarray) -> np.ndarray:
+        """
+        decode an array of codes back into strings
+        :param codes: integer codes
+        :return: object array of strings
+        """
+        if self._values is None:
+            return self.array[codes].astype(object)
+        return super().lookup(codes)
+
+
+def default_path(name: str = 'nhl_stats') -> str:
+    """
+    get the default snapshot path for a name
+    :param name: the snapshot name
+    :return: path in /dev/shm if it exists, otherwise in the temporary directory
+    """
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, '{}.stats'.format(name))
+
+
+def string_array(table: StringTable) -> np.ndarray:
+    return np.asarray(table.values, dtype=str) if len(table) else np.zeros(0, dtype='<U1')
+
+
+def store_arrays(store: ColumnarStore) -> tuple:
+    """
+    collect the arrays and metadata of a store
+    :param store: the store to describe
+    :return: tuple of (metadata, dictionary of array key -> array)
+    """
+    arrays = {'rows/{}'.format(key): array[:store.size] for key, array in store._arrays().items()}
+    arrays['names'] = string_array(store.names)
+    arrays.update({'strings/{}'.format(field): string_array(table) for field, table in store.strings.items()})
+    metadata = {'schemas': {kind: schema.__name__ for kind, schema in store.schemas.items()}, 'size': store.size}
+    return metadata, arrays
+
+
+def publish(stores: dict, path: str) -> str:
+    """
+    write a set of columnar stores to a snapshot file
+    :param stores: dictionary of name -> ColumnarStore
+    :param path: the snapshot file. Replaced atomically if it exists
+    :return: the snapshot path
+    """
+    header = {'version': version, 'stores': dict(), 'arrays': dict()}
+    arrays = list()
+    offset = 0
+    for name, store in stores.items():
+        metadata, store_data = store_arrays(store)
+        header['stores'][name] = metadata
+        for key, array in store_data.items():
+            array = np.ascontiguousarray(array)
+            offset = -(-offset // alignment) * alignment
+            header['arrays']['{}/{}'.format(name, key)] = [array.dtype.str, list(array.shape), offset]
+            arrays.append((offset, array))
+            offset += array.nbytes
+    encoded = json.dumps(header).encode()
+    start = -(-(len(magic) + 8 + len(encoded)) // alignment) * alignment
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(magic + np.uint64(start).tobytes() + encoded)
+            for array_offset, array in arrays:
+                file.seek(start + array_offset)
+                file.write(array.tobytes())
+            file.truncate(max(start + offset, 1))
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+    return path
+
+
+def attach(path: str) -> dict:
+    """
+    map a snapshot file read-only and wrap its arrays without copying
+    :param path: the snapshot file
+    :return: dictionary of name -> ColumnarStore with read-only arrays
+    """
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(magic)] != magic:
+        raise ValueError('{} is not a stats snapshot'.format(path))
+    start = int(np.frombuffer(buffer, dtype=np.uint64, count=1, offset=len(magic))[0])
+    header = json.loads(bytes(buffer[len(magic) + 8:start]).rstrip(b'\0'))
+    if header['version'] != version:
+        raise ValueError('unsupported stats snapshot version {}'.format(header['version']))
+
+    def array(key: str) -> np.ndarray:
+        dtype, shape, offset = header['arrays'][key]
+        count = int(np.prod(shape))
+        if count == 0:
+            return np.zeros(shape, dtype=np.dtype(dtype))
+        return np.frombuffer(buffer, dtype=np.dtype(dtype), count=count, offset=start + offset).reshape(shape)
+
+    stores = dict()
+    for name, metadata in header['stores'].items():
+        schemas = {kind: getattr(stats_types, schema) for kind, schema in metadata['schemas'].items()}
+        store = ColumnarStore(schemas, capacity=0)
+        store.names = SharedStringTable(array('{}/names'.format(name)))
+        store.strings = {field: SharedStringTable(array('{}/strings/{}'.format(name, field)))
+                         for field in store.strings}
+        prefix = '{}/rows/'.format(name)
+        store._set_arrays({key[len(prefix):]: array(key) for key in header['arrays'] if key.startswith(prefix)})
+        store.size = metadata['size']
+        stores[name] = store
+    return stores
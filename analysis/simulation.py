@@ -0,0 +1,222 @@
+"""
+    @file simulation.py
+    @brief Monte Carlo projection uncertainty
+    @author Graham Riches
+    @details
+    Projections give a single value per stat. Here every player's next season is instead drawn thousands of times:
+
+    - the per-game rate of each category is centred on the batch projection model and spread by the weighted season to
+      season variation in the player's history, shrunk towards a league wide coefficient of variation for players with
+      little history. Categories that are never negative are drawn from a gamma distribution (non-negative and right
+      skewed), anything else from a normal distribution.
+    - games played are drawn from a binomial of the schedule length and the player's weighted share of games played.
+
+    Samples are generated in chunks of (samples x players x categories) arrays, and every chunk is z-scored against the
+    simulated league (the calculate_z_score_rankings definition) and summed into fantasy_points_z in a few batched
+    operations. Each chunk is reduced to per-player sums before the next one is drawn, except for the
+    fantasy_points_z samples: those are kept (float32, so 4 bytes x simulations x players) to report exact
+    percentiles. Peak memory is the chunk arrays plus that one (simulations x players) array. Chunks run in a process
+    pool, each with its own random stream spawned from one SeedSequence, so results are reproducible for a given seed
+    regardless of the number of workers.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from analysis.columnar_store import ColumnarStore
+from analysis.projections import pad_weights
+
+
+class SimulationInputs:
+    """
+    Fitted per-player distributions for one simulated season
+    """
+    def __init__(self, categories: list, mean: np.ndarray, std: np.ndarray, non_negative: np.ndarray,
+                 availability: np.ndarray, games: int, min_games: int, thresholds: dict):
+        """
+        :param categories: the simulated categories
+        :param mean: (players x categories) mean per-game rates
+        :param std: (players x categories) per-game rate standard deviations
+        :param non_negative: per-category flag to draw from a gamma distribution instead of a normal distribution
+        :param availability: per-player expected share of the schedule played
+        :param games: the schedule length
+        :param min_games: minimum simulated games for a player to be part of the z-score pool in a sample
+        :param thresholds: dictionary of category (or fantasy_points_z) -> value to count samples at or above
+        """
+        self.categories = categories
+        self.mean = mean
+        self.std = std
+        self.non_negative = non_negative
+        self.availability = availability
+        self.games = games
+        self.min_games = min_games
+        self.thresholds = thresholds
+
+
+def fit_inputs(store: ColumnarStore, season: int, model: callable, categories: list, average_weights: list,
+               games: int = 82, min_games: int = 36, thresholds: dict = None, prior_seasons: float = 2.0) -> tuple:
+    """
+    fit the per-player distributions from each player's history
+    :param store: columnar store with the historical data
+    :param season: the season to simulate. Players require data from the previous season
+    :param model: batch projection model (see StatsEngine.project_stats_batch) projecting a full schedule of games
+    :param categories: the categories to simulate
+    :param average_weights: seasonal weights used to weight the historical spread and availability
+    :param games: the schedule length the model projects
+    :param min_games: minimum games for a player to be part of the z-score pool in a sample
+    :param thresholds: dictionary of category (or fantasy_points_z) -> value to count samples at or above
+    :param prior_seasons: weight (in seasons) of the league wide spread when shrinking each player's spread
+    :return: tuple of (player_ids, rows, SimulationInputs). rows holds each player's most recent store row
+    """
+    player_ids, tensor, mask, rows = store.history_tensor('basic', categories, players_in=season - 1, before=season)
+    mean = model(tensor, mask) / games
+    mean = np.where(np.isfinite(mean), mean, 0.0)
+
+    weights = pad_weights(average_weights, tensor.shape[1])[None, :] * mask
+    total = weights.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        history_mean = np.einsum('ps,psc->pc', weights, tensor) / total[:, None]
+        deviation = np.where(mask[..., None], tensor - history_mean[:, None, :], 0.0)
+        history_var = np.einsum('ps,psc->pc', weights, deviation ** 2) / total[:, None]
+        # league wide coefficient of variation from players with more than one season
+        multi = mask.sum(axis=1) > 1
+        cv = np.nanmedian(np.sqrt(history_var[multi]) / np.abs(history_mean[multi]), axis=0) if multi.any() \
+            else np.zeros(len(categories))
+    cv = np.where(np.isfinite(cv), cv, 0.0)
+    seasons = mask.sum(axis=1)[:, None] - 1.0
+    prior_var = (cv[None, :] * mean) ** 2
+    std = np.sqrt((seasons * np.nan_to_num(history_var) + prior_seasons * prior_var) / (seasons + prior_seasons))
+    non_negative = np.all(np.where(mask[..., None], tensor, 0.0) >= 0, axis=(0, 1))
+
+    schedule = np.zeros(store.season[:store.size].max() + 1 if store.size else 1, dtype=np.float64)
+    valid = np.flatnonzero(store.valid[store.games_kind()][:store.size])
+    np.maximum.at(schedule, store.season[valid], store.columns['games_played'][valid].astype(np.float64))
+    played = np.where(rows >= 0, store.columns['games_played'][rows].astype(np.float64), 0.0)
+    share = np.where(mask, played / np.maximum(schedule[store.season[rows]], 1.0), 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        availability = np.clip(np.sum(weights * share, axis=1) / total, 0.0, 1.0)
+    inputs = SimulationInputs(list(categories), mean, std, non_negative, np.nan_to_num(availability), games, min_games,
+                              dict(thresholds or dict()))
+    return player_ids, rows[:, 0], inputs
+
+
+def sample_chunk(inputs: SimulationInputs, rng: np.random.Generator, samples: int) -> tuple:
+    """
+    draw and score one chunk of simulated seasons
+    :param inputs: the fitted distributions
+    :param rng: numpy random generator
+    :param samples: the number of simulated seasons in the chunk
+    :return: tuple of (fantasy_points_z samples (samples x players, float32), per-player sums of the simulated games,
+             of the samples the player was ranked in and of their fantasy_points_z, per-category sums and sums of
+             squares (players x categories), threshold counts (players x thresholds))
+    """
+    players, categories = inputs.mean.shape
+    size = (samples, players, categories)
+    mean = np.broadcast_to(inputs.mean, size)
+    std = np.broadcast_to(inputs.std, size)
+    rates = rng.normal(mean, std)
+    gamma = inputs.non_negative[None, None, :] & (mean > 0) & (std > 0)
+    if gamma.any():
+        shape = np.where(gamma, mean ** 2 / np.where(gamma, std, 1.0) ** 2, 1.0)
+        scale = np.where(gamma, std ** 2 / np.where(gamma, mean, 1.0), 1.0)
+        rates = np.where(gamma, rng.gamma(shape, scale), rates)
+    rates = np.where(inputs.non_negative[None, None, :], np.maximum(rates, 0.0), rates)
+    games = rng.binomial(inputs.games, inputs.availability, size=(samples, players)).astype(np.float64)
+    totals = rates * games[..., None]
+
+    # z-scores against the players in each simulated league that meet the games threshold
+    pool = (games >= inputs.min_games)[..., None]
+    count = np.maximum(pool.sum(axis=1, keepdims=True), 1)
+    pool_mean = np.sum(totals * pool, axis=1, keepdims=True) / count
+    pool_std = np.sqrt(np.sum(((totals - pool_mean) * pool) ** 2, axis=1, keepdims=True) / count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_scores = (totals - pool_mean) / games[..., None] / pool_std
+    z_scores = np.where(np.isfinite(z_scores), z_scores, 0.0)
+    fantasy_points_z = np.where(pool[..., 0], z_scores.sum(axis=2), np.nan).astype(np.float32)
+
+    counts = np.zeros((players, len(inputs.thresholds)), dtype=np.int64)
+    for idx, (category, value) in enumerate(inputs.thresholds.items()):
+        values = fantasy_points_z if category == 'fantasy_points_z' else totals[..., inputs.categories.index(category)]
+        counts[:, idx] = np.sum(values >= value, axis=0)
+    ranked = ~np.isnan(fantasy_points_z)
+    points = np.nansum(fantasy_points_z, axis=0, dtype=np.float64)
+    return fantasy_points_z, games.sum(axis=0), ranked.sum(axis=0), points, totals.sum(axis=0), \
+        (totals ** 2).sum(axis=0), counts
+
+
+_inputs = None
+
+
+def _init_worker(inputs: SimulationInputs) -> None:
+    global _inputs
+    _inputs = inputs
+
+
+def _sample_task(task: tuple) -> tuple:
+    seed, samples = task
+    return sample_chunk(_inputs, np.random.default_rng(seed), samples)
+
+
+def simulate(inputs: SimulationInputs, simulations: int, chunk_size: int = 256, seed: int = None,
+             workers: int = None) -> tuple:
+    """
+    run the simulated seasons in chunks across a process pool. Only the (simulations x players) float32
+    fantasy_points_z samples are kept in full, every other result is summed per chunk
+    :param inputs: the fitted distributions
+    :param simulations: the number of simulated seasons
+    :param chunk_size: the number of simulated seasons per chunk
+    :param seed: random seed
+    :param workers: number of worker processes
+    :return: tuple of (fantasy_points_z samples, games sums, ranked counts, fantasy_points_z sums, category sums,
+             category sums of squares, threshold counts)
+    """
+    chunks = max(1, -(-simulations // chunk_size))
+    sizes = np.full(chunks, simulations // chunks)
+    sizes[:simulations % chunks] += 1
+    tasks = [(chunk_seed, int(size)) for chunk_seed, size in zip(np.random.SeedSequence(seed).spawn(chunks), sizes)]
+    workers = workers or min(chunks, os.cpu_count() or 1)
+    if workers <= 1:
+        results = [sample_chunk(inputs, np.random.default_rng(chunk_seed), size) for chunk_seed, size in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(inputs,)) as executor:
+            results = list(executor.map(_sample_task, tasks))
+    fantasy_points_z, *totals = zip(*results)
+    return (np.concatenate(fantasy_points_z), *(np.sum(total, axis=0) for total in totals))
+
+
+def summarize(names: np.ndarray, positions: np.ndarray, inputs: SimulationInputs, results: tuple,
+              percentiles: list) -> pd.DataFrame:
+    """
+    reduce the simulated seasons to per-player summary statistics
+    :param names: player names
+    :param positions: player positions
+    :param inputs: the fitted distributions
+    :param results: the output of simulate
+    :param percentiles: fantasy_points_z percentiles to report
+    :return: dataframe indexed by player name, sorted by median fantasy_points_z (or the mean fantasy_points_z when
+             the median is not reported)
+    """
+    fantasy_points_z, games, ranked, points, sums, squares, counts = results
+    simulations = len(fantasy_points_z)
+    df = pd.DataFrame({'position': positions, 'games_played_mean': games / simulations},
+                      index=pd.Index(names, name='player_name'))
+    means = sums / simulations
+    stds = np.sqrt(np.maximum(squares / simulations - means ** 2, 0.0))
+    for idx, category in enumerate(inputs.categories):
+        df['{}_mean'.format(category)] = means[:, idx]
+        df['{}_std'.format(category)] = stds[:, idx]
+    df['ranked_pct'] = ranked / simulations * 100.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['fantasy_points_z_mean'] = np.where(ranked > 0, points / ranked, np.nan)
+    columns = ['fantasy_points_z_p{}'.format(percentile) for percentile in percentiles]
+    with np.errstate(invalid='ignore'):
+        values = np.full((len(percentiles), len(names)), np.nan)
+        has_samples = ranked > 0
+        if percentiles and has_samples.any():
+            values[:, has_samples] = np.nanpercentile(fantasy_points_z[:, has_samples], percentiles, axis=0)
+    for column, value in zip(columns, values):
+        df[column] = value
+    for idx, (category, threshold) in enumerate(inputs.thresholds.items()):
+        df['{}_ge_{}'.format(category, threshold)] = counts[:, idx] / simulations
+    sort = 'fantasy_points_z_p50' if 50 in percentiles else 'fantasy_points_z_mean'
+    return df.sort_values(by=sort, ascending=False)
@@ -5,10 +5,14 @@
     @details
    
 """
+import logging
 from analysis.stats_types import BasicSkaterStats, AdvancedSkaterStats, SkaterSerializer
-from analysis.colors import TerminalColors
+
+logger = logging.getLogger(__name__)
 
 class Skater:
+    __slots__ = ('name', 'basic_stats', 'advanced_stats')
+
     def __init__(self, player_name: str):
         """
         Create a new skater object. This contains two dictionaries which contain year index basic and advanced
@@ -45,7 +49,15 @@ class Skater:
         """
         basic_stats = self.basic_stats[year]
         advanced_stats = self.advanced_stats[year]
-        return {**basic_stats.stats, **advanced_stats.stats}
+        return {**basic_stats.to_dict(), **advanced_stats.to_dict()}
+
+    def get_values_by_year(self, year: int) -> list:
+        """
+        get all player stats combined for a specific season as a list of values
+        :param year: the year to get stats for
+        :return: list of values in SkaterSerializer.get_all_stat_fields order
+        """
+        return self.basic_stats[year].to_list() + self.advanced_stats[year].to_list()
 
     def project_basic_stats(self, project_season: int, projection: callable) -> None:
         """
@@ -61,39 +73,42 @@ class Skater:
         data = list()
         for season in seasons:
             games_played = self.basic_stats[season].stats['games_played']
-            data.append([val/games_played if type(val) is not str else val for key, val in self.basic_stats[season].stats.items()])
+            data.append([val/games_played if type(val) is not str else val
+                         for val in self.basic_stats[season].to_list()])
         new_data = list()
-        for idx in range(len(BasicSkaterStats.fields)):
-            fields = [x.pop(0) for x in data]
+        for fields in zip(*data):
+            fields = list(fields)
             try:
                 new_data.append(projection(fields))
             except Exception as ce:
                 new_data.append(fields[0])
         self.basic_stats[project_season] = BasicSkaterStats(new_data)
-        print(TerminalColors.GREEN + 'Projected basic stats for {}'.format(self.name) + TerminalColors.END)
+        logger.debug('Projected basic stats for %s', self.name)
 
     def project_advanced_stats(self, project_season: int, projection: callable) -> None:
         """
         project the next season of advanced stats based on historical data
         :param project_season: the year to project. Requires player data from the previous season
-        :param projection: callable that takes a colleciton and produces a new value
+        :param projection: callable that takes a colleciton and produces a new value. Only seasons with basic stats
+               (and therefore games played) are used
         :return:
         """
-        seasons = list(self.advanced_stats.keys())
+        seasons = [season for season in self.advanced_stats.keys() if season in self.basic_stats]
         seasons.sort(reverse=True)
         if project_season - 1 not in seasons:
             return
         data = list()
         for season in seasons:
             games_played = self.basic_stats[season].stats['games_played']
-            data.append([val/games_played if type(val) is not str else val for key, val in self.advanced_stats[season].stats.items()])
+            data.append([val/games_played if type(val) is not str else val
+                         for val in self.advanced_stats[season].to_list()])
 
         new_data = list()
-        for idx in range(len(AdvancedSkaterStats.fields)):
-            fields = [x.pop(0) for x in data]
+        for fields in zip(*data):
+            fields = list(fields)
             try:
                 new_data.append(projection(fields))
             except Exception as ce:
                 new_data.append(fields[0])
         self.advanced_stats[project_season] = AdvancedSkaterStats(new_data)
-        print(TerminalColors.GREEN + 'Projected advanced stats for {}'.format(self.name) + TerminalColors.END)
+        logger.debug('Projected advanced stats for %s', self.name)
@@ -5,19 +5,45 @@
     @details
    
 """
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 from analysis.skater import Skater
-from analysis.stats_types import SkaterSerializer
+from analysis.stats_types import BasicSkaterStats, AdvancedSkaterStats, GoalieStats, SkaterSerializer
+from analysis.columnar_store import ColumnarStore
+from analysis.csv_loader import ParsedSeason, load_seasons
+from analysis.season_cache import SeasonCache
+from analysis.simulation import fit_inputs, simulate, summarize
+from analysis.query import Query
+from analysis.shared_store import attach, default_path, publish
+from analysis.models import ProjectionCache, ProjectionModel
+from analysis.instrumentation import instrumented, profiler
 
 class StatsEngine:
-    def __init__(self):
+    profiler = profiler  # shared runtime switchable profiler, i.e. StatsEngine.profiler.enable()
+
+    def __init__(self, columnar: bool = False, cache_dir: str = None, view_cache_size: int = 32):
         """
         Create a new stats engine object. This contains all the player data over a set of years
+        :param columnar: store player seasons in a numpy backed columnar store instead of per-player Skater objects.
+               In columnar mode the skaters dictionary is left empty.
+        :param cache_dir: optional directory for a binary cache of parsed season files and registry model projections
+        :param view_cache_size: maximum number of get_stats_by_year frames to keep cached (least recently used are
+               evicted first). Set to zero to disable the view cache
         """
         self.skaters = dict()
+        self.store = ColumnarStore({'basic': BasicSkaterStats, 'advanced': AdvancedSkaterStats}) if columnar else None
+        self.goalies = ColumnarStore({'goalie': GoalieStats})  # goalies are always stored in columnar form
+        self.cache = SeasonCache(cache_dir) if cache_dir is not None else None
+        self.views = OrderedDict()  # (season, columns) -> dataframe
+        self.view_cache_size = view_cache_size
+        # memoized registry model projections (see analysis.models)
+        self.projections = ProjectionCache(os.path.join(cache_dir, 'projections') if cache_dir is not None else None)
 
     @staticmethod
+    @instrumented
     def read_from_csv(filename: str, parser: callable, year: int) -> None:
         """
         Read data from a csv and apply a parser function to each element.
@@ -60,6 +86,52 @@ class StatsEngine:
             skater.add_advanced_stats(year, stats)
             self.skaters[name] = skater
 
+    @instrumented
+    def load_seasons(self, jobs: list, workers: int = None) -> list:
+        """
+        parse a set of season files, using the season cache where possible. Any files that are not cached are parsed
+        concurrently and written back to the cache.
+        :param jobs: list of (kind, year, filename) tuples
+        :param workers: number of loader processes
+        :return: list of (kind, year, ParsedSeason) tuples in the same order as the jobs
+        """
+        if self.cache is None:
+            return load_seasons(jobs, workers)
+        seasons = [self.cache.lookup(filename, kind) for kind, year, filename in jobs]
+        missing = [job for job, season in zip(jobs, seasons) if season is None]
+        parsed = iter(load_seasons(missing, workers))
+        results = list()
+        for (kind, year, filename), season in zip(jobs, seasons):
+            if season is None:
+                season = next(parsed)[2]
+                self.cache.store(filename, kind, season)
+            results.append((kind, year, season))
+        return results
+
+    @instrumented
+    def add_parsed_season(self, kind: str, year: int, season: ParsedSeason) -> None:
+        """
+        Add a bulk parsed season of skater data to the engine
+        :param kind: the stats kind of the data ('basic' or 'advanced')
+        :param year: the year of the data
+        :param season: the parsed season columns
+        :return: None
+        """
+        profiler.annotate(rows=len(season))
+        self.invalidate_views([year])
+        if self.store is not None:
+            self.store.add_records(kind, year, season.names, season.columns)
+            return
+        stats_type = {'basic': BasicSkaterStats, 'advanced': AdvancedSkaterStats}[kind]
+        for name, stats in zip(season.names, stats_type.from_columns(season.columns)):
+            if name not in self.skaters:
+                self.skaters[name] = Skater(name)
+            if kind == 'basic':
+                self.skaters[name].add_basic_stats(year, stats)
+            else:
+                self.skaters[name].add_advanced_stats(year, stats)
+
+    @instrumented
     def add_advanced_skater_from_csv(self, filename: str, year: int) -> None:
         """
         Add advanced skater data to the stats engine from a csv file
@@ -67,8 +139,10 @@ class StatsEngine:
         :param year: the year of the data
         :return: None
         """
-        self.read_from_csv(filename, self.advanced_skater_parser, year)
+        for kind, year, season in self.load_seasons([('advanced', year, filename)], workers=1):
+            self.add_parsed_season(kind, year, season)
 
+    @instrumented
     def add_basic_skater_from_csv(self, filename: str, year: int) -> None:
         """
         Add basic skater data to the engine from a csv file
@@ -76,32 +150,103 @@ class StatsEngine:
         :param year: the year of the data
         :return: None
         """
-        self.read_from_csv(filename, self.basic_skater_parser, year)
+        for kind, year, season in self.load_seasons([('basic', year, filename)], workers=1):
+            self.add_parsed_season(kind, year, season)
+
+    @instrumented
+    def add_skaters_from_csv(self, years: list, basic_path: str, advanced_path: str, workers: int = None) -> None:
+        """
+        Load the basic and advanced skater files for many years concurrently. Seasons are added to the engine in the
+        same order as calling add_basic_skater_from_csv and add_advanced_skater_from_csv for each year.
+        :param years: list of years to load
+        :param basic_path: format string for the basic stats files, i.e. 'data/skaters/basic/{}.csv'
+        :param advanced_path: format string for the advanced stats files
+        :param workers: number of loader processes
+        :return: None
+        """
+        jobs = list()
+        for year in years:
+            jobs.append(('basic', year, basic_path.format(year)))
+            jobs.append(('advanced', year, advanced_path.format(year)))
+        for kind, year, season in self.load_seasons(jobs, workers):
+            self.add_parsed_season(kind, year, season)
+
+    @instrumented
+    def add_game_log(self, log) -> None:
+        """
+        add the season totals of a game log as a season of basic skater data
+        :param log: analysis.game_log.GameLog object
+        :return: None
+        """
+        self.add_parsed_season('basic', log.season, log.to_parsed_season())
+
+    @instrumented
+    def add_goalie_from_csv(self, filename: str, year: int) -> None:
+        """
+        Add goalie data to the engine from a csv file
+        :param filename: the csv file containing the data
+        :param year: the year of the data
+        :return: None
+        """
+        for kind, year, season in self.load_seasons([('goalie', year, filename)], workers=1):
+            self.goalies.add_records(kind, year, season.names, season.columns)
 
+    @instrumented
+    def add_goalies_from_csv(self, years: list, path: str, workers: int = None) -> None:
+        """
+        Load the goalie files for many years concurrently
+        :param years: list of years to load
+        :param path: format string for the goalie stats files, i.e. 'data/goalies/{}.csv'
+        :param workers: number of loader processes
+        :return: None
+        """
+        jobs = [('goalie', year, path.format(year)) for year in years]
+        for kind, year, season in self.load_seasons(jobs, workers):
+            self.goalies.add_records(kind, year, season.names, season.columns)
+
+    @instrumented
     def constrain_by_year(self, year: int) -> None:
         """
         drop all players that do not have data from a specific year
         :param year: the year to check
         :return: None
         """
+        if self.store is not None:
+            store = self.store
+            present = np.zeros(len(store.names), dtype=bool)
+            present[store.player_id[:store.size][store.any_valid() & (store.season[:store.size] == year)]] = True
+            drop = ~present[store.player_id[:store.size]]
+            self.invalidate_views(np.unique(store.season[:store.size][drop]).tolist())
+            store.drop_rows(drop)
+            return
         drop_list = list()
         for player, skater in self.skaters.items():
             if year not in skater.basic_stats.keys() and year not in skater.advanced_stats.keys():
                 drop_list.append(player)
         for player in drop_list:
+            self.invalidate_views(list(self.skaters[player].basic_stats) + list(self.skaters[player].advanced_stats))
             del self.skaters[player]
 
+    @instrumented
     def drop_by_games_played(self, games_played: int) -> None:
         """
         For each player, drop any seasons that they did not play at least "games_player" games
         :param games_played: threshold games played
         :return:
         """
+        if self.store is not None:
+            store = self.store
+            games = store.columns['games_played'][:store.size]
+            drop = store.valid['basic'][:store.size] & (games < games_played)
+            self.invalidate_views(np.unique(store.season[:store.size][drop]).tolist())
+            store.drop_rows(drop)
+            return
         for player, skater in self.skaters.items():
             drop_list = list()
             for season in skater.basic_stats.keys():
                 if skater.basic_stats[season].stats['games_played'] < games_played:
                     drop_list.append(season)
+            self.invalidate_views(drop_list)
             for season in drop_list:
                 try:
                     del skater.basic_stats[season]
@@ -109,37 +254,494 @@ class StatsEngine:
                 except KeyError as ke:
                     pass
 
-    def get_stats_by_year(self, year: int) -> pd.DataFrame:
+    @instrumented
+    def seasons_before(self, year: int) -> 'StatsEngine':
         """
-        get a set of player data by year with combined basic and advanced stats
+        create a new engine containing only the seasons before a specific year. This is useful for back-testing
+        projections against seasons that have already been played.
+        :param year: the first year to exclude
+        :return: new stats engine
+        """
+        engine = StatsEngine(view_cache_size=self.view_cache_size)
+        if self.store is not None:
+            engine.store = self.store.copy(self.store.season[:self.store.size] < year)
+            return engine
+        for player, skater in self.skaters.items():
+            seasons = [season for season in skater.basic_stats.keys() if season < year]
+            seasons += [season for season in skater.advanced_stats.keys() if season < year]
+            if not seasons:
+                continue
+            new_skater = Skater(player)
+            new_skater.basic_stats = {season: stats for season, stats in skater.basic_stats.items() if season < year}
+            new_skater.advanced_stats = {season: stats for season, stats in skater.advanced_stats.items()
+                                         if season < year}
+            engine.skaters[player] = new_skater
+        return engine
+
+    @instrumented
+    def publish(self, path: str = None) -> str:
+        """
+        publish the skater and goalie data to a shared snapshot file that other processes can attach to without
+        loading or copying anything (see StatsEngine.attach and analysis.shared_store)
+        :param path: the snapshot file. Defaults to a file in /dev/shm
+        :return: the snapshot path
+        """
+        if self.store is None:
+            raise ValueError('publishing requires a columnar stats engine')
+        return publish({'skaters': self.store, 'goalies': self.goalies}, path or default_path())
+
+    @staticmethod
+    @instrumented
+    def attach(path: str = None, view_cache_size: int = 32) -> 'StatsEngine':
+        """
+        create a read-only columnar engine over a published snapshot. The arrays are mapped straight from the shared
+        file, so attaching takes the same time regardless of the size of the data. The engine can still be modified:
+        the first method that writes to a store (i.e. loading a season or a projection) copies that store's arrays
+        into private memory, so the snapshot and other attached processes never see the change
+        :param path: the snapshot file. Defaults to the StatsEngine.publish default
+        :param view_cache_size: see StatsEngine
+        :return: new stats engine
+        """
+        stores = attach(path or default_path())
+        engine = StatsEngine(columnar=True, view_cache_size=view_cache_size)
+        engine.store = stores['skaters']
+        engine.goalies = stores['goalies']
+        return engine
+
+    @instrumented
+    def drop_goalies_by_games_played(self, games_played: int) -> None:
+        """
+        drop any goalie seasons with fewer than "games_played" games
+        :param games_played: threshold games played
+        :return: None
+        """
+        goalies = self.goalies
+        goalies.drop_rows(goalies.columns['games_played'][:goalies.size] < games_played)
+
+    @instrumented
+    def invalidate_views(self, seasons: list = None) -> None:
+        """
+        drop cached get_stats_by_year frames. This is called automatically by every engine method that modifies
+        player data, and only needs to be called manually after editing Skater objects or the store directly
+        :param seasons: the seasons to invalidate. Defaults to all seasons
+        :return: None
+        """
+        if seasons is None:
+            self.views.clear()
+            return
+        seasons = set(seasons)
+        for key in [key for key in self.views if key[0] in seasons]:
+            del self.views[key]
+
+    @instrumented
+    def get_stats_by_year(self, year: int, columns: list = None) -> pd.DataFrame:
+        """
+        get a set of player data by year with combined basic and advanced stats. Frames are cached per season and
+        column set, and every call returns a shallow copy of the cached frame: the data is shared, but adding or
+        replacing columns on the returned frame never modifies the cache.
         :param year: the year to get data for
-        :return:
+        :param columns: optional list of stat fields to include. Defaults to all fields
+        :return: dataframe indexed by player name with a player_name column followed by the stat fields
+        """
+        key = (year, tuple(columns) if columns is not None else None)
+        if key in self.views:
+            self.views.move_to_end(key)
+            return self.views[key].copy(deep=False)
+        record = self.build_stats_by_year(year, columns)
+        if self.view_cache_size > 0:
+            self.views[key] = record
+            while len(self.views) > self.view_cache_size:
+                self.views.popitem(last=False)
+        return record.copy(deep=False)
+
+    @instrumented
+    def build_stats_by_year(self, year: int, columns: list = None) -> pd.DataFrame:
+        """
+        build (without caching) a frame of player data by year with combined basic and advanced stats
+        :param year: the year to get data for
+        :param columns: optional list of stat fields to include. Defaults to all fields
+        :return: dataframe indexed by player name
         """
+        if self.store is not None:
+            rows = np.flatnonzero(self.store.row_mask(season=year))
+            rows = rows[np.argsort(self.store.player_id[rows], kind='stable')]
+            return self.store.frame(rows, SkaterSerializer.get_all_stat_fields() if columns is None else columns)
+        selected = columns
         columns = SkaterSerializer.get_all_stat_fields()
         header = ['player_name'] + columns
         stats = []
         for name, skater in self.skaters.items():
             try:
-                data = skater.get_stats_by_year(year)
-                stats.append([name] + [data[column] for column in columns])
+                stats.append([name] + skater.get_values_by_year(year))
             except KeyError as ce:
                 pass
         record = pd.DataFrame.from_records(stats, columns=header)
         record.index = record['player_name']
+        if selected is not None:
+            record = record.loc[:, ['player_name'] + list(selected)]
         return record
 
+    @instrumented
     def project_stats(self, season: int, model: callable) -> None:
         """
         project each players stats for a given season
         :param season: the season to project
-        :param model: projection model callable that reduces a collection of stats into a new value
+        :param model: projection model callable that reduces a collection of stats into a new value, or a registry
+               model (see analysis.models). Registry models run through the memoized batch path in columnar mode
         :return: None
         """
+        if isinstance(model, ProjectionModel) and self.store is not None:
+            self.project_stats_batch(season, model)
+            return
+        if isinstance(model, ProjectionModel) and model.inputs:
+            raise ValueError('projection model {} needs a columnar stats engine for its inputs'.format(model.name))
+        self.invalidate_views([season])
+        if self.store is not None:
+            self.project_store_stats(season, model, 'basic')
+            self.project_store_stats(season, model, 'advanced')
+            return
         for player, skater in self.skaters.items():
             skater.project_basic_stats(season, model)
             skater.project_advanced_stats(season, model)
 
+    @instrumented
+    def project_store_stats(self, season: int, model: callable, kind: str) -> None:
+        """
+        project one stats kind for every player in the columnar store. This mirrors the Skater projection methods: every
+        historical season is converted to per-game values (newest first) and the model is applied field by field.
+        :param season: the season to project. Players require data from the previous season
+        :param model: projection model callable that reduces a collection of stats into a new value
+        :param kind: the stats kind to project
+        :return: None
+        """
+        store = self.store
+        schema = store.schemas[kind]
+        rows = np.flatnonzero(store.valid[kind][:store.size] & store.valid[store.games_kind()][:store.size])
+        rows = rows[np.lexsort((-store.season[rows], store.player_id[rows]))]
+        player_ids = store.player_id[rows]
+        groups = np.split(rows, np.flatnonzero(player_ids[1:] != player_ids[:-1]) + 1)
+        games = store.columns['games_played'][:store.size].tolist()
+        columns = {field: store.decode(field, np.arange(store.size)).tolist() for field in schema.fields}
+        names = list()
+        projected = list()
+        for group in groups:
+            if len(group) == 0 or season - 1 not in store.season[group]:
+                continue
+            new_data = list()
+            for field, field_type in zip(schema.fields, schema.types):
+                values = columns[field]
+                fields = [values[row] if field_type is str else values[row] / games[row] for row in group]
+                try:
+                    new_data.append(model(fields))
+                except Exception as ce:
+                    new_data.append(fields[0])
+            names.append(store.names.values[store.player_id[group[0]]])
+            projected.append(schema(new_data))
+        values = {field: [stats.stats[field] for stats in projected] for field in schema.fields}
+        store.add_records(kind, season, names, values)
+        profiler.annotate(rows=len(names))
+
+    @instrumented
+    def project_stats_batch(self, season: int, model: callable) -> None:
+        """
+        project every player's stats for a given season in one vectorized pass over the columnar store
+        :param season: the season to project. Players require data from the previous season
+        :param model: batch projection callable that takes a (players x seasons x fields) tensor of per-game stats and a
+               (players x seasons) validity mask and returns a (players x fields) array of projections.
+               I.e. partial(batch_weighted_average_with_experience_adjustment, 82, weights, progression_weights)
+        :return: None
+        """
+        if self.store is None:
+            raise ValueError('batch projections require a columnar stats engine')
+        self.invalidate_views([season])
+        for kind in ['basic', 'advanced']:
+            self.project_store_tensor(season, model, kind)
+
+    @instrumented
+    def simulate_projections(self, season: int, model: callable, categories: list, average_weights: list,
+                             simulations: int = 1000, thresholds: dict = None, percentiles: list = (10, 50, 90),
+                             games: int = 82, min_games: int = 36, chunk_size: int = 256, seed: int = None,
+                             workers: int = None) -> pd.DataFrame:
+        """
+        simulate many possible outcomes of a season instead of a single projection. Each player's per-game rates are
+        drawn from distributions centred on the batch projection model and fitted on their history, and every sample
+        is z-scored against the simulated league. The store is not modified. See analysis/simulation.py.
+        :param season: the season to simulate. Players require data from the previous season
+        :param model: batch projection model (see project_stats_batch) projecting a full schedule of games
+        :param categories: the categories to simulate. These are summed into fantasy_points_z
+        :param average_weights: seasonal weights for the historical spread and games played share
+        :param simulations: the number of simulated seasons
+        :param thresholds: dictionary of category (or fantasy_points_z) -> value. A '{category}_ge_{value}' column
+               holds the probability of reaching each value
+        :param percentiles: fantasy_points_z percentiles to report
+        :param games: the schedule length
+        :param min_games: minimum simulated games for a player to be ranked in a sample
+        :param chunk_size: simulated seasons per batch. The batch arrays scale with chunk_size x players x categories,
+               and the kept fantasy_points_z samples with simulations x players
+        :param seed: random seed
+        :param workers: number of worker processes
+        :return: dataframe indexed by player name with per-category means and standard deviations, the fantasy_points_z
+                 mean and percentiles and threshold probabilities, sorted by median (or mean) fantasy_points_z
+        """
+        if self.store is None:
+            raise ValueError('simulated projections require a columnar stats engine')
+        player_ids, rows, inputs = fit_inputs(self.store, season, model, categories, average_weights, games, min_games,
+                                              thresholds)
+        profiler.annotate(rows=len(player_ids))
+        results = simulate(inputs, simulations, chunk_size, seed, workers)
+        return summarize(self.store.names.lookup(player_ids), self.store.decode('position', rows), inputs, results,
+                         list(percentiles))
+
+    @instrumented
+    def project_goalie_stats(self, season: int, model: callable) -> None:
+        """
+        project every goalie's stats for a given season in one vectorized pass. Counting stats are projected by the
+        model and the rate stats (GAA, SV%) are derived from the projected counting stats.
+        :param season: the season to project. Goalies require data from the previous season
+        :param model: batch projection callable (see project_stats_batch)
+        :return: None
+        """
+        self.project_store_tensor(season, model, 'goalie', self.goalies)
+
+    @instrumented
+    def project_store_tensor(self, season: int, model: callable, kind: str, store: ColumnarStore = None) -> None:
+        """
+        apply a batch projection model to one stats kind in a columnar store. String fields carry over the value from
+        each player's most recent season and integer fields are truncated like the per-player path. Rate fields declared
+        by the stats type are recalculated from the projected counting stats.
+        :param season: the season to project
+        :param model: batch projection callable
+        :param kind: the stats kind to project
+        :param store: the store to project. Defaults to the skater store
+        :return: None
+        """
+        store = self.store if store is None else store
+        schema = store.schemas[kind]
+        rate_fields = getattr(schema, 'rate_fields', list())
+        numeric = [field for field, field_type in zip(schema.fields, schema.types)
+                   if field_type is not str and field not in rate_fields]
+        player_ids, tensor, mask, rows = store.history_tensor(kind, numeric, players_in=season - 1)
+        if len(player_ids) == 0:
+            return
+        profiler.annotate(rows=len(player_ids))
+        projected = self.run_model(model, store, tensor, mask, rows)
+        columns = dict()
+        for field, field_type in zip(schema.fields, schema.types):
+            if field_type is str:
+                columns[field] = store.columns[field][rows[:, 0]]
+                continue
+            if field in rate_fields:
+                continue
+            values = projected[:, numeric.index(field)]
+            if field_type is int:
+                values = np.where(np.isfinite(values), np.trunc(values), 0)
+            columns[field] = values
+        if rate_fields:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                columns.update(schema.calculate_rates(columns))
+        store.set_rows(kind, season, player_ids, columns)
+
+    @instrumented
+    def run_model(self, model: callable, store: ColumnarStore, tensor: np.ndarray, mask: np.ndarray,
+                  rows: np.ndarray) -> np.ndarray:
+        """
+        run a batch projection model on a history tensor. Registry models get their extra inputs gathered from the
+        store and their results are memoized on the model, its parameters and a fingerprint of the input data
+        :param model: batch projection callable or registry model
+        :param store: the store the tensor was gathered from
+        :param tensor: (players x seasons x fields) tensor of per-game stats
+        :param mask: (players x seasons) mask of valid seasons
+        :param rows: (players x seasons) store rows of the tensor entries
+        :return: (players x fields) array of projections
+        """
+        if not isinstance(model, ProjectionModel):
+            return model(tensor, mask)
+        inputs = model.gather(store, rows)
+        key = model.key(tensor, mask, inputs)
+        projected = self.projections.get(key)
+        profiler.annotate(cached=projected is not None)
+        if projected is None:
+            projected = model(tensor, mask, inputs)
+            self.projections.put(key, projected)
+        return projected
+
+    @instrumented
+    def rank_by_year(self, year: int, stats_categories: list, display_categories: list, fantasy_categories: list,
+                     positional_adjustments: dict, min_games: int = 36) -> pd.DataFrame:
+        """
+        calculate skater z-score rankings, positionally adjusted fantasy points and a z-score based fantasy score
+        for a season
+        :param year: the year to rank
+        :param stats_categories: the categories to calculate z-scores for
+        :param display_categories: extra (non-ranked) categories to include, i.e. position
+        :param fantasy_categories: the categories that make up the fantasy score
+        :param positional_adjustments: dictionary of position -> list of fantasy category weights
+        :param min_games: minimum number of games played to be ranked
+        :return: dataframe with the display and stats categories, '{category}_z', '{category}_adj', fantasy_points and
+                 fantasy_points_z columns sorted from best to worst fantasy_points_z
+        """
+        return self.query(year).select(*(display_categories + stats_categories)) \
+            .filter('games_played', '>=', min_games) \
+            .zscore(stats_categories) \
+            .adjust(fantasy_categories, positional_adjustments) \
+            .score(fantasy_categories, z_based=True) \
+            .sort('fantasy_points_z') \
+            .collect()
+
+    @instrumented
+    def query(self, year: int) -> Query:
+        """
+        start a lazy query pipeline over a season of skater data. Nothing runs until collect() is called on the
+        returned query, which plans the whole chain and only reads the referenced fields and rows
+        :param year: the season to query
+        :return: new Query (see analysis.query)
+        """
+        return Query(self, year)
+
+    @instrumented
+    def rank_seasons(self, years: list, stats_categories: list, display_categories: list, fantasy_categories: list,
+                     positional_adjustments: dict, min_games: int = 36, path: str = None,
+                     workers: int = None) -> dict:
+        """
+        rank several seasons at once. This gives the same rankings as calling rank_by_year for each season, but the
+        seasons are scanned together into one stacked (season, player) array and the z-scores, adjustments, scores
+        and sort run as grouped operations over that array, so each extra season only adds rows instead of a full
+        ranking pipeline
+        :param years: the seasons to rank
+        :param stats_categories: the categories to calculate z-scores for
+        :param display_categories: extra (non-ranked) categories to include, i.e. position
+        :param fantasy_categories: the categories that make up the fantasy score
+        :param positional_adjustments: dictionary of position -> list of fantasy category weights
+        :param min_games: minimum number of games played to be ranked
+        :param path: optional output path format string, i.e. 'data/z_score_rankings/{}.csv'. Each season is written
+               to path.format(season)
+        :param workers: number of threads used to write the output files
+        :return: dictionary of season -> rankings dataframe (see rank_by_year)
+        """
+        years = sorted(set(years))
+        fields = list(dict.fromkeys(display_categories + stats_categories))
+        names, columns, seasons = self.scan_seasons(years, fields, min_games)
+        group = np.searchsorted(years, seasons)
+        counts = np.bincount(group, minlength=len(years))
+        sizes = np.maximum(counts, 1)[:, None]
+
+        # grouped calculate_z_score_rankings: every season is scored against its own player pool
+        data = np.column_stack([columns[category] for category in stats_categories]).astype(np.float64)
+        sums = np.zeros((len(years), data.shape[1]))
+        np.add.at(sums, group, data)
+        deviation = data - (sums / sizes)[group]
+        squares = np.zeros_like(sums)
+        np.add.at(squares, group, deviation ** 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores = deviation / columns['games_played'][:, None] / np.sqrt(squares / sizes)[group]
+        derived = {'{}_z'.format(category): z_scores[:, idx] for idx, category in enumerate(stats_categories)}
+
+        adjusted = np.column_stack([columns[category] for category in fantasy_categories]).astype(np.float64)
+        adjusted *= self.positional_weights(columns['position'], positional_adjustments)
+        derived.update({'{}_adj'.format(category): adjusted[:, idx] for idx, category in enumerate(fantasy_categories)})
+        derived['fantasy_points'] = np.sum(adjusted, axis=1)
+        derived['fantasy_points_z'] = np.sum(
+            np.column_stack([derived['{}_z'.format(category)] for category in fantasy_categories]), axis=1)
+
+        order = np.lexsort((-derived['fantasy_points_z'], group))
+        data = {field: columns[field][order] for field in fields}
+        data.update({column: values[order] for column, values in derived.items()})
+        stacked = pd.DataFrame(data, index=pd.Index(names[order], name='player_name'))
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        rankings = {year: stacked.iloc[start:end] for year, start, end in zip(years, bounds[:-1], bounds[1:])}
+        if path is not None:
+            self.write_rankings(rankings, path, workers)
+        return rankings
+
+    @instrumented
+    def scan_seasons(self, years: list, fields: list, min_games: int = 0) -> tuple:
+        """
+        read a set of fields for every player season in a list of seasons, ordered by season and then player
+        :param years: sorted list of seasons
+        :param fields: the stat fields to read
+        :param min_games: minimum number of games played
+        :return: tuple of (player names, dictionary of field -> values, seasons)
+        """
+        if self.store is not None:
+            store = self.store
+            rows = np.flatnonzero(store.row_mask() & np.isin(store.season[:store.size], years))
+            rows = rows[store.columns['games_played'][rows] >= min_games]
+            rows = rows[np.lexsort((store.player_id[rows], store.season[rows]))]
+            columns = {field: store.decode(field, rows) for field in fields}
+            return store.names.lookup(store.player_id[rows]), columns, store.season[rows]
+        frames = [self.get_stats_by_year(year, fields) for year in years]
+        frames = [df[df['games_played'].to_numpy() >= min_games] for df in frames]
+        names = np.concatenate([df['player_name'].to_numpy(dtype=object) for df in frames])
+        columns = {field: np.concatenate([df[field].to_numpy() for df in frames]) for field in fields}
+        return names, columns, np.repeat(years, [len(df) for df in frames])
+
     @staticmethod
+    @instrumented
+    def write_rankings(rankings: dict, path: str, workers: int = None) -> None:
+        """
+        write a set of rankings to csv files concurrently
+        :param rankings: dictionary of season -> rankings dataframe
+        :param path: output path format string. Each season is written to path.format(season)
+        :param workers: number of writer threads
+        :return: None
+        """
+        workers = workers or min(len(rankings), os.cpu_count() or 1) or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda item: item[1].to_csv(path.format(item[0])), rankings.items()))
+
+    @instrumented
+    def get_goalie_stats_by_year(self, year: int) -> pd.DataFrame:
+        """
+        get a set of goalie data by year
+        :param year: the year to get data for
+        :return: dataframe indexed by player name
+        """
+        rows = np.flatnonzero(self.goalies.row_mask(season=year))
+        rows = rows[np.argsort(self.goalies.player_id[rows], kind='stable')]
+        return self.goalies.frame(rows, GoalieStats.fields)
+
+    @instrumented
+    def rank_goalies(self, year: int, categories: list, inverted_categories: list = None,
+                     min_games: int = 0) -> pd.DataFrame:
+        """
+        calculate goalie z-score rankings and a z-score based fantasy score for a season
+        :param year: the year to rank
+        :param categories: the goalie categories to rank on
+        :param inverted_categories: categories where lower is better (i.e. goals_against_average)
+        :param min_games: minimum number of games played to be ranked
+        :return: dataframe with the goalie stats, '{category}_z' columns and fantasy_points_z sorted from best to worst
+        """
+        df = self.get_goalie_stats_by_year(year)
+        df = df[df['games_played'].to_numpy() >= min_games]
+        df = self.calculate_standard_z_scores(df, categories, inverted_categories)
+        z_columns = ['{}_z'.format(category) for category in categories]
+        df['fantasy_points_z'] = np.sum(df.loc[:, z_columns].to_numpy(), axis=1)
+        return df.sort_values(by='fantasy_points_z', ascending=False)
+
+    @staticmethod
+    @instrumented
+    def calculate_standard_z_scores(df: pd.DataFrame, categories: list,
+                                    inverted_categories: list = None) -> pd.DataFrame:
+        """
+        calculate plain (value - mean) / std z-scores for a set of categories. Unlike calculate_z_score_rankings the
+        values are not normalized by games played, which suits rate stats like save percentage.
+        :param df: the raw dataframe
+        :param categories: the categories to score
+        :param inverted_categories: categories where lower is better. Their z-scores are negated
+        :return: dataframe with '{category}_z' columns added
+        """
+        data = df.loc[:, categories].to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores = (data - np.mean(data, axis=0)) / np.std(data, axis=0)
+        signs = np.array([-1.0 if category in (inverted_categories or list()) else 1.0 for category in categories])
+        z_scores *= signs
+        df = df.copy()
+        for idx, category in enumerate(categories):
+            df['{}_z'.format(category)] = z_scores[:, idx]
+        return df
+
+    @staticmethod
+    @instrumented
     def keep_categories(df: pd.DataFrame, categories: list) -> pd.DataFrame:
         """
         keep a set of categories in a rankings dataframe
@@ -151,6 +753,7 @@ class StatsEngine:
         return new_df
 
     @staticmethod
+    @instrumented
     def filter_by_category(df: pd.DataFrame, category: str, predicate: callable) -> pd.DataFrame:
         """
         apply a filtering operation to a dataframe column
@@ -163,6 +766,7 @@ class StatsEngine:
         return df[list(map(predicate, series))]
 
     @staticmethod
+    @instrumented
     def calculate_z_score_rankings(df: pd.DataFrame, categories: list) -> pd.DataFrame:
         """
         calculate the z-score rankings on dataframe of states and return a new dataframe with the z_scores concatenated
@@ -183,29 +787,47 @@ class StatsEngine:
         return df
 
     @staticmethod
+    @instrumented
+    def positional_weights(positions: np.ndarray, adjustments: dict) -> np.ndarray:
+        """
+        map each player's position to its row of positional adjustment weights. Multi-position players (i.e. "C/LW")
+        get the element-wise mean of the weights for each listed position.
+        :param positions: array of position strings
+        :param adjustments: dictionary of position -> list of category weights
+        :return: (players x categories) array of weights
+        """
+        unique, inverse = np.unique(np.asarray(positions, dtype=str), return_inverse=True)
+        if not len(unique):
+            return np.zeros((0, len(next(iter(adjustments.values()), list()))), dtype=np.float64)
+        table = list()
+        for position in unique.tolist():
+            eligible = position.split('/')
+            missing = [pos for pos in eligible if pos not in adjustments]
+            if missing:
+                raise KeyError('no positional adjustment for position {}'.format('/'.join(missing)))
+            table.append(np.mean([adjustments[pos] for pos in eligible], axis=0))
+        return np.asarray(table, dtype=np.float64).reshape(len(unique), -1)[inverse.ravel()]
+
+    @staticmethod
+    @instrumented
     def apply_positional_adjustment(df: pd.DataFrame, categories: list, adjustments: dict) -> pd.DataFrame:
         """
         apply a multiplier correction to a category based on position.
         :param df: the raw dataframe
         :param categories: list of categories to filter the DF with
-        :param adjustments: dictionary of positional adjustments
+        :param adjustments: dictionary of positional adjustments. Multi-position players use the mean of the weights
+               of each listed position
         :return: modified dataframe
         """
         adjusted_categories = ['{}_adj'.format(category) for category in categories]
-        fantasy_df = df.loc[:, categories]
+        weights = StatsEngine.positional_weights(df['position'].to_numpy(), adjustments)
+        adjusted = df.loc[:, categories].to_numpy(dtype=np.float64) * weights
         for idx, category in enumerate(adjusted_categories):
-            fantasy_df[category] = df[categories[idx]]
-
-        for index, row in fantasy_df.iterrows():
-            player_data = df.loc[index]
-            modifiers = adjustments[player_data['position']]
-            for idx, weight in enumerate(modifiers):
-                row[adjusted_categories[idx]] = row[adjusted_categories[idx]] * weight
-        for category in adjusted_categories:
-            df[category] = fantasy_df[category]
+            df[category] = adjusted[:, idx]
         return df
 
     @staticmethod
+    @instrumented
     def calculate_fantasy_score(df: pd.DataFrame, categories: list, calculate_z_based: bool = False) -> pd.DataFrame:
         """
         calculate an overall fantasy score based on a set of categories
@@ -4,49 +4,179 @@
     @author Graham Riches
     @details
     This contains class definitions for basic and advanced player stats as well as factory methods for deserializing
-    data into these object types
+    data into these object types. Each stats type shares one class level schema (fields, types and a structured
+    dtype) and stores a record's values in a single structured numpy row, with a read-only mapping view in .stats
 """
+import csv
+from collections.abc import Mapping
+import numpy as np
 
-class BasicSkaterStats:
-    fields = ['team', 'position', 'games_played', 'goals', 'assists', 'pts', 'plus_minus',
-              'penalty_mins', 'shots_on_goal', 'game_winning_goals', 'power_play_goals',
-              'power_play_assists', 'short_handed_goals', 'short_handed_assists', 'hits', 'blocked_shots']
+
+def record_dtype(fields: list, types: list) -> np.dtype:
+    """
+    build the structured dtype of a stats record. Strings are stored as object references so they are never truncated
+    :param fields: the field names
+    :param types: the python type of each field
+    :return: structured numpy dtype
+    """
+    dtypes = {int: np.int64, float: np.float64, str: object}
+    return np.dtype([(field, dtypes[field_type]) for field, field_type in zip(fields, types)])
+
+
+class StatsView(Mapping):
+    """
+    Read-only dictionary view of a stats record, i.e. record.stats['games_played']
+    """
+    __slots__ = ('record',)
+
+    def __init__(self, record: 'StatsRecord'):
+        self.record = record
+
+    def __getitem__(self, key: str):
+        value = self.record.row[key]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __iter__(self):
+        return iter(self.record.fields)
+
+    def __len__(self) -> int:
+        return len(self.record.fields)
+
+    def __contains__(self, key) -> bool:
+        return key in self.record.dtype.fields
+
+    def __repr__(self) -> str:
+        return repr(self.record.to_dict())
+
+
+class StatsRecord:
+    """
+    Base class of the compact stats types. Subclasses declare the class level fields and types (and the matching
+    structured dtype), and every record holds its values in a single structured numpy row instead of a dictionary.
+    Records built together with from_columns share one structured array, so each record is only a row view into it
+    """
+    __slots__ = ('row',)
+    fields = list()
+    types = list()
+    dtype = record_dtype(fields, types)
 
     def __init__(self, stats: list):
         """
-        Construct a BasicSkaterStats object. This contains standard fantasy categories and converts the data types into a
-        dictionary with proper data types (int, etc.)
-        :param stats: list of strings of stats fields
+        Construct a stats record from a list of raw values. Each value is converted to the type of its field, and
+        values that can not be converted are replaced by the type's default value (0, 0.0 or '')
+        :param stats: list of stats fields
         """
-        types = [str, str]
-        types.extend([int for i in range(len(self.fields) - len(types))])
-        self.stats = dict()
-        for idx, key in enumerate(self.fields):
+        values = list()
+        for idx, field_type in enumerate(self.types):
             try:
-                self.stats[key] = types[idx](stats[idx])
+                values.append(field_type(stats[idx]))
             except Exception as ce:
-                self.stats[key] = types[idx]()
+                values.append(field_type())
+        self.row = np.array(tuple(values), dtype=self.dtype)[()]
 
+    @classmethod
+    def from_values(cls, values: list) -> 'StatsRecord':
+        """
+        construct a record from values that already have the field types, i.e. ParsedSeason.records, skipping the
+        per-field conversions
+        :param values: list of typed values in field order
+        :return: new record
+        """
+        record = cls.__new__(cls)
+        record.row = np.array(tuple(values), dtype=cls.dtype)[()]
+        return record
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> list:
+        """
+        construct the records of many rows at once, i.e. from ParsedSeason.columns. The columns are copied into one
+        structured array and every record is a row of it
+        :param columns: dictionary of field -> typed column array
+        :return: list of records in row order
+        """
+        block = np.empty(len(columns[cls.fields[0]]), dtype=cls.dtype)
+        for field in cls.fields:
+            block[field] = columns[field]
+        records = list()
+        for row in block:
+            record = cls.__new__(cls)
+            record.row = row
+            records.append(record)
+        return records
 
-class AdvancedSkaterStats:
+    @property
+    def stats(self) -> StatsView:
+        """
+        read-only mapping of field -> value
+        :return: mapping view
+        """
+        return StatsView(self)
+
+    def to_list(self) -> list:
+        """
+        get the values in field order as native python values
+        :return: list of values
+        """
+        return list(self.row.item())
+
+    def to_dict(self) -> dict:
+        """
+        get a dictionary of field -> native python value
+        :return: dictionary
+        """
+        return dict(zip(self.fields, self.row.item()))
+
+    def __repr__(self) -> str:
+        return '{}({})'.format(type(self).__name__, self.to_dict())
+
+
+class BasicSkaterStats(StatsRecord):
+    """
+    Standard fantasy categories for one skater season
+    """
+    __slots__ = ()
+    fields = ['team', 'position', 'games_played', 'goals', 'assists', 'pts', 'plus_minus',
+              'penalty_mins', 'shots_on_goal', 'game_winning_goals', 'power_play_goals',
+              'power_play_assists', 'short_handed_goals', 'short_handed_assists', 'hits', 'blocked_shots']
+    types = [str, str, int, int, int, int, int, int, int, int, int, int, int, int, int, int]
+    dtype = record_dtype(fields, types)
+
+
+class AdvancedSkaterStats(StatsRecord):
+    """
+    Advanced information like Corsi, Fenwick, PDO, etc. for one skater season
+    """
+    __slots__ = ()
     fields = ['age', 'cf', 'ca', 'c_pct', 'c_pct_rel', 'ff', 'fa', 'f_pct', 'f_pct_rel', 'sh_pct', 'sv_pct',
               'pdo', 'off_zone_starts', 'def_zone_starts', 'toi_60', 'toi_ev', 'takeaways', 'giveaways',
               'ev_plus_minus', 'shot_attempts', 'shot_through_pct']
+    types = [int, float, float, float, float, float, float, float, float, float, float,
+             float, float, float, str, str, int, int,
+             float, int, float]
+    dtype = record_dtype(fields, types)
 
-    def __init__(self, stats: list):
+
+class GoalieStats(StatsRecord):
+    """
+    Standard goalie fantasy categories like wins, GAA and SV% for one goalie season
+    """
+    __slots__ = ()
+    fields = ['team', 'games_played', 'wins', 'losses', 'ot_losses', 'goals_against_average', 'goals_against',
+              'shots_against', 'saves', 'save_pct', 'shutouts', 'minutes']
+    types = [str, int, int, int, int, float, int, int, int, float, int, int]
+    dtype = record_dtype(fields, types)
+    # rate stats that are derived from the counting stats rather than summed or projected directly
+    rate_fields = ['goals_against_average', 'save_pct']
+
+    @staticmethod
+    def calculate_rates(columns: dict) -> dict:
         """
-        Construct a new AdvancedSkaterStats object. This contains advanced information like Corsi, Fenwick, PDO, etc.
-        :param stats: list of stats
+        calculate the rate stats from the counting stats
+        :param columns: dictionary of goals_against, minutes, saves and shots_against arrays or values
+        :return: dictionary of goals_against_average and save_pct
         """
-        types = [int, float, float, float, float, float, float, float, float, float, float,
-                 float, float, float, str, str, int, int,
-                 float, int, float]
-        self.stats = dict()
-        for idx, key in enumerate(self.fields):
-            try:
-                self.stats[key] = types[idx](stats[idx])
-            except Exception as ce:
-                self.stats[key] = types[idx]()
+        return {'goals_against_average': columns['goals_against'] / columns['minutes'] * 60,
+                'save_pct': columns['saves'] / columns['shots_against']}
 
 
 class SkaterSerializer:
@@ -60,7 +190,7 @@ class SkaterSerializer:
         :param csv_line: csv data
         :return: new tuple of (player_name, BasicSkaterStats)
         """
-        tokens = csv_line.split(',')
+        tokens = next(csv.reader([csv_line]))
         player_name = tokens[0]
         return player_name, BasicSkaterStats(tokens[1:])
 
@@ -71,7 +201,7 @@ class SkaterSerializer:
         :param csv_line: the line of data
         :return: new tuple of (player_name, AdvancedSkaterStats)
         """
-        tokens = csv_line.split(',')
+        tokens = next(csv.reader([csv_line]))
         player_name = tokens[1].split('\\')[0]
         tokens_of_interest = [tokens[2]]
         tokens_of_interest.extend(tokens[6:])
@@ -0,0 +1,176 @@
+"""
+    @file sweep.py
+    @brief parallel what-if sweeps over projection weights and positional adjustments
+    @author Graham Riches
+    @details
+    Each weight configuration is scored by projecting held-out seasons from only the seasons before them and comparing
+    the positionally adjusted fantasy points per game against what actually happened. The held-out data is gathered
+    once from a columnar StatsEngine and handed to each worker process a single time through the pool initializer, so
+    individual tasks only carry their (small) configuration.
+"""
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from analysis.stats_engine import StatsEngine
+from analysis.projections import batch_weighted_average_with_experience_adjustment
+from analysis.metrics import mean_absolute_error, rank_correlation
+
+
+class HoldoutSeason:
+    """
+    Read-only inputs for scoring projections of one held-out season
+    """
+    def __init__(self, season: int, history: np.ndarray, mask: np.ndarray, positions: np.ndarray, actual: np.ndarray):
+        """
+        :param season: the held-out season
+        :param history: (players x seasons x categories) per-game stats from seasons before the held-out season
+        :param mask: (players x seasons) mask of valid history
+        :param positions: position of each player in their most recent season
+        :param actual: (players x categories) actual per-game stats in the held-out season
+        """
+        self.season = season
+        self.history = history
+        self.mask = mask
+        self.positions = positions
+        self.actual = actual
+
+
+def build_holdouts(engine: StatsEngine, seasons: list, categories: list) -> list:
+    """
+    gather the history and actual results for each held-out season. Only players that played both the held-out season
+    and the season before it are scored.
+    :param engine: a columnar stats engine with the historical data loaded
+    :param seasons: the seasons to hold out
+    :param categories: the stat categories to project
+    :return: list of HoldoutSeason objects
+    """
+    if engine.store is None:
+        raise ValueError('sweeps require a columnar stats engine')
+    store = engine.store
+    holdouts = list()
+    for season in seasons:
+        player_ids, history, mask, rows = store.history_tensor('basic', categories, players_in=season - 1,
+                                                               before=season)
+        lookup = np.full(len(store.names), -1, dtype=np.int64)
+        actual_rows = np.flatnonzero(store.row_mask(season=season, kinds=['basic']))
+        lookup[store.player_id[actual_rows]] = actual_rows
+        actual_rows = lookup[player_ids]
+        keep = actual_rows >= 0
+        actual_rows = actual_rows[keep]
+        games = store.columns['games_played'][actual_rows].astype(np.float64)
+        actual = np.stack([store.columns[category][actual_rows] / games for category in categories], axis=1)
+        positions = store.decode('position', rows[keep, 0])
+        holdouts.append(HoldoutSeason(season, history[keep], mask[keep], positions, actual))
+    return holdouts
+
+
+def score_config(config: dict, holdouts: list) -> dict:
+    """
+    score a single weight configuration against a set of held-out seasons
+    :param config: dictionary with average_weights, seasonal_progression_weights and positional_adjustments
+    :param holdouts: list of HoldoutSeason objects
+    :return: dictionary of scores averaged over the held-out seasons
+    """
+    correlations = list()
+    errors = list()
+    for holdout in holdouts:
+        projected = batch_weighted_average_with_experience_adjustment(
+            1, config['average_weights'], config['seasonal_progression_weights'], holdout.history, holdout.mask)
+        weights = StatsEngine.positional_weights(holdout.positions, config['positional_adjustments'])
+        projected_points = np.sum(projected * weights, axis=1)
+        actual_points = np.sum(holdout.actual * weights, axis=1)
+        correlations.append(rank_correlation(projected_points, actual_points))
+        errors.append(mean_absolute_error(projected_points, actual_points))
+    return {'rank_correlation': float(np.mean(correlations)), 'fantasy_points_mae': float(np.mean(errors))}
+
+
+_holdouts = None
+
+
+def _init_worker(holdouts: list) -> None:
+    global _holdouts
+    _holdouts = holdouts
+
+
+def _score_task(config: dict) -> dict:
+    return score_config(config, _holdouts)
+
+
+def grid_configs(average_weights: list, seasonal_progression_weights: list, positional_adjustments: list) -> list:
+    """
+    build every combination of a set of candidate weights
+    :param average_weights: list of candidate seasonal averaging weights
+    :param seasonal_progression_weights: list of candidate experience progression weights
+    :param positional_adjustments: list of candidate positional adjustment dictionaries
+    :return: list of configuration dictionaries
+    """
+    return [{'average_weights': list(average), 'seasonal_progression_weights': list(progression),
+             'positional_adjustments': adjustments}
+            for average, progression, adjustments in itertools.product(average_weights, seasonal_progression_weights,
+                                                                       positional_adjustments)]
+
+
+def random_configs(count: int, positional_adjustments: dict, seasons: int = 6, seed: int = None) -> list:
+    """
+    sample random weight configurations. Averaging weights decrease with season age, the first few progression weights
+    are boosted, and the positional adjustments are perturbed by up to +/- 20%.
+    :param count: the number of configurations
+    :param positional_adjustments: base positional adjustments to perturb
+    :param seasons: the number of seasonal weights
+    :param seed: random seed
+    :return: list of configuration dictionaries
+    """
+    rng = np.random.default_rng(seed)
+    configs = list()
+    for idx in range(count):
+        average = np.sort(rng.uniform(0.5, 5.0, seasons))[::-1]
+        progression = np.ones(seasons + 1)
+        progression[1:4] = rng.uniform(1.0, 1.3, 3)
+        adjustments = {position: (np.asarray(weights) * rng.uniform(0.8, 1.2, len(weights))).round(3).tolist()
+                       for position, weights in positional_adjustments.items()}
+        configs.append({'average_weights': average.round(3).tolist(),
+                        'seasonal_progression_weights': progression.round(3).tolist(),
+                        'positional_adjustments': adjustments})
+    return configs
+
+
+def run_sweep(engine: StatsEngine, configs: list, holdout_seasons: list, categories: list,
+              workers: int = None) -> pd.DataFrame:
+    """
+    score many weight configurations in parallel against held-out seasons
+    :param engine: a columnar stats engine with the historical data loaded
+    :param configs: list of configuration dictionaries (see grid_configs and random_configs)
+    :param holdout_seasons: the seasons to hold out
+    :param categories: the fantasy categories, in the same order as the positional adjustment weights
+    :param workers: number of worker processes
+    :return: dataframe with one row per configuration sorted from best to worst rank correlation
+    """
+    holdouts = build_holdouts(engine, holdout_seasons, categories)
+    workers = workers or min(len(configs), os.cpu_count() or 1)
+    if workers <= 1:
+        scores = [score_config(config, holdouts) for config in configs]
+    else:
+        chunksize = max(1, len(configs) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(holdouts,)) as executor:
+            scores = list(executor.map(_score_task, configs, chunksize=chunksize))
+    df = pd.DataFrame(scores)
+    df['average_weights'] = [config['average_weights'] for config in configs]
+    df['seasonal_progression_weights'] = [config['seasonal_progression_weights'] for config in configs]
+    df['positional_adjustments'] = [config['positional_adjustments'] for config in configs]
+    df.index.name = 'config'
+    return df.sort_values(by='rank_correlation', ascending=False)
+
+
+if __name__ == '__main__':
+    import json
+    with open('config/config.json') as json_file:
+        config = json.loads(str(json_file.read()))
+    engine = StatsEngine(columnar=True, cache_dir='data/.cache')
+    engine.add_skaters_from_csv([2015, 2016, 2017, 2018, 2019], 'data/skaters/basic/{}.csv',
+                                'data/skaters/advanced/{}.csv')
+    engine.drop_by_games_played(25)
+    configs = random_configs(200, config['positional_adjustments'], seed=0)
+    results = run_sweep(engine, configs, [2017, 2018, 2019], config['fantasy_categories'])
+    print(results.head(10))
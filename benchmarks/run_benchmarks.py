@@ -0,0 +1,219 @@
+"""
+    @file run_benchmarks.py
+    @brief benchmark suite for ingestion, projection and ranking
+    @author Graham Riches
+    @details
+    Runs the main StatsEngine pipeline stages on the shipped data and on synthetic datasets of increasing size, and
+    records wall time, the resident set size change, the process peak RSS so far and traced allocations per stage.
+    Results are saved as JSON so runs from different commits can be compared. Run from the repository root:
+        python -m benchmarks.run_benchmarks --scales 10000 100000 --compare benchmarks/results/<previous>.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+import numpy as np
+import pandas as pd
+from analysis.stats_engine import StatsEngine
+from analysis.projections import weighted_average_with_experience_adjustment, \
+    batch_weighted_average_with_experience_adjustment
+from benchmarks.synthetic import generate_seasons
+
+average_weights = [4.0, 3.0, 2.0, 1.0, 1.0, 1.0]
+progression_weights = [1.0, 1.10, 1.15, 1.0, 1.0, 1.0, 1.0]
+
+
+def current_rss_kb() -> int:
+    """
+    get the current resident set size of this process
+    :return: resident size in KB, or None where /proc/self/statm is not available
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            resident_pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+class StageRecorder:
+    """
+    Records measurements for each named stage of a pipeline run
+    """
+    def __init__(self, trace_allocations: bool = False):
+        """
+        :param trace_allocations: trace python allocations with tracemalloc. This slows the stages down, so timings
+               from a traced run should not be compared with untraced runs
+        """
+        self.trace_allocations = trace_allocations
+        self.stages = dict()
+
+    def run(self, name: str, function: callable):
+        """
+        run and measure a single stage
+        :param name: the stage name
+        :param function: callable to run
+        :return: the result of the callable
+        """
+        if self.trace_allocations:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            start_current, _ = tracemalloc.get_traced_memory()
+        start_rss = current_rss_kb()
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        end_rss = current_rss_kb()
+        # ru_maxrss is the high-water mark of the whole process so far, not of this stage
+        record = {'wall_s': elapsed, 'rss_delta_kb': None if start_rss is None else end_rss - start_rss,
+                  'process_peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+        if self.trace_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            record['alloc_peak_bytes'] = peak - start_current
+            record['alloc_net_bytes'] = current - start_current
+        self.stages[name] = record
+        return result
+
+
+def run_pipeline(years: list, basic_path: str, advanced_path: str, config: dict, columnar: bool,
+                 recorder: StageRecorder) -> int:
+    """
+    run the ranking pipeline for the final (projected) season and record each stage
+    :param years: the years of data to load
+    :param basic_path: format string for the basic stats files
+    :param advanced_path: format string for the advanced stats files
+    :param config: the analysis configuration
+    :param columnar: use the columnar storage engine
+    :param recorder: the stage recorder
+    :return: number of player seasons loaded
+    """
+    engine = StatsEngine(columnar=columnar)
+    recorder.run('add_skaters_from_csv', lambda: engine.add_skaters_from_csv(years, basic_path, advanced_path))
+    player_seasons = engine.store.size if columnar else sum(len(s.basic_stats) for s in engine.skaters.values())
+    recorder.run('drop_by_games_played', lambda: engine.drop_by_games_played(25))
+    season = years[-1] + 1
+    if columnar:
+        model = partial(batch_weighted_average_with_experience_adjustment, 82, average_weights, progression_weights)
+        recorder.run('project_stats', lambda: engine.project_stats_batch(season, model))
+    else:
+        model = partial(weighted_average_with_experience_adjustment, 82, average_weights, progression_weights)
+        recorder.run('project_stats', lambda: engine.project_stats(season, model))
+    df = recorder.run('get_stats_by_year', lambda: engine.get_stats_by_year(season))
+    display_df = engine.keep_categories(df, config['display_categories'])
+    stats_df = engine.keep_categories(df, config['stats_categories'])
+    stats_df = recorder.run('calculate_z_score_rankings',
+                            lambda: engine.calculate_z_score_rankings(stats_df, config['stats_categories']))
+    result = pd.concat([display_df, stats_df], axis=1)
+    result = recorder.run('apply_positional_adjustment',
+                          lambda: engine.apply_positional_adjustment(result, config['fantasy_categories'],
+                                                                     config['positional_adjustments']))
+    recorder.run('calculate_fantasy_score',
+                 lambda: engine.calculate_fantasy_score(result, config['fantasy_categories'], calculate_z_based=True))
+    return player_seasons
+
+
+def benchmark_dataset(name: str, years: list, basic_path: str, advanced_path: str, config: dict, columnar: bool,
+                      trace_allocations: bool) -> dict:
+    """
+    benchmark one dataset: a timed run followed by an optional allocation traced run
+    :return: dictionary of dataset results
+    """
+    recorder = StageRecorder()
+    player_seasons = run_pipeline(years, basic_path, advanced_path, config, columnar, recorder)
+    stages = recorder.stages
+    if trace_allocations:
+        traced = StageRecorder(trace_allocations=True)
+        run_pipeline(years, basic_path, advanced_path, config, columnar, traced)
+        for stage, record in traced.stages.items():
+            stages[stage]['alloc_peak_bytes'] = record['alloc_peak_bytes']
+            stages[stage]['alloc_net_bytes'] = record['alloc_net_bytes']
+    return {'name': name, 'player_seasons': player_seasons, 'seasons': len(years), 'stages': stages}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """
+    print the wall time ratio of each stage against a previous result file
+    :param results: the current results
+    :param baseline: previous results loaded from JSON
+    :return: None
+    """
+    previous = {dataset['name']: dataset for dataset in baseline['datasets']}
+    for dataset in results['datasets']:
+        if dataset['name'] not in previous:
+            continue
+        print('\n{} vs {}'.format(dataset['name'], baseline['commit']))
+        for stage, record in dataset['stages'].items():
+            old = previous[dataset['name']]['stages'].get(stage)
+            if old is None:
+                continue
+            ratio = record['wall_s'] / old['wall_s'] if old['wall_s'] else float('nan')
+            print('  {:<30} {:>10.4f}s {:>10.4f}s {:>7.2f}x'.format(stage, old['wall_s'], record['wall_s'], ratio))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='benchmark the stats engine pipeline')
+    parser.add_argument('--scales', type=int, nargs='*', default=[10000, 100000],
+                        help='synthetic dataset sizes in player seasons (i.e. 10000 100000 1000000)')
+    parser.add_argument('--seasons', type=int, default=10, help='number of synthetic seasons')
+    parser.add_argument('--storage', choices=['columnar', 'skater'], default='columnar')
+    parser.add_argument('--no-allocations', action='store_true', help='skip the allocation traced run')
+    parser.add_argument('--output', default=None, help='output JSON file')
+    parser.add_argument('--compare', default=None, help='previous results JSON file to compare against')
+    args = parser.parse_args()
+
+    with open('config/config.json') as json_file:
+        config = json.loads(str(json_file.read()))
+    columnar = args.storage == 'columnar'
+    trace = not args.no_allocations
+    results = {'commit': git_commit(), 'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+               'storage': args.storage, 'datasets': list()}
+
+    shipped = sorted(int(os.path.splitext(file)[0]) for file in os.listdir('data/skaters/basic'))
+    results['datasets'].append(benchmark_dataset('shipped', shipped, 'data/skaters/basic/{}.csv',
+                                                 'data/skaters/advanced/{}.csv', config, columnar, trace))
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scales:
+            path = os.path.join(directory, str(scale))
+            years = generate_seasons(path, scale, seasons=args.seasons)
+            results['datasets'].append(benchmark_dataset('synthetic_{}'.format(scale), years,
+                                                         os.path.join(path, 'basic', '{}.csv'),
+                                                         os.path.join(path, 'advanced', '{}.csv'),
+                                                         config, columnar, trace))
+
+    for dataset in results['datasets']:
+        print('\n{} ({} player seasons)'.format(dataset['name'], dataset['player_seasons']))
+        for stage, record in dataset['stages'].items():
+            rss = '-' if record['rss_delta_kb'] is None else '{:+.1f}'.format(record['rss_delta_kb'] / 1024)
+            print('  {:<30} {:>10.4f}s {:>10} MB rss {:>10.1f} MB process peak {:>12} alloc peak'.format(
+                stage, record['wall_s'], rss, record['process_peak_rss_kb'] / 1024,
+                record.get('alloc_peak_bytes', '-')))
+
+    output = args.output or os.path.join('benchmarks', 'results', '{}_{}.json'.format(
+        results['timestamp'].replace(':', '-'), results['commit']))
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print('\nresults written to {}'.format(output))
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+    @file synthetic.py
+    @brief synthetic season file generator for benchmarking at scale
+    @author Graham Riches
+    @details
+    Writes basic and advanced skater csv files in the same layout as the files in data/skaters so the whole pipeline,
+    including csv ingestion, can be exercised with anywhere from thousands to millions of player seasons.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+basic_header = ['Player Name', 'Team', 'Pos', 'Games', 'G', 'A', 'Pts', '+/-', 'PIM', 'SOG', 'GWG', 'G', 'A', 'G', 'A',
+                'Hits', 'BS']
+advanced_header = ['Rk', 'Player', 'Age', 'Tm', 'Pos', 'GP', 'CF', 'CA', 'CF%', 'CF% rel', 'FF', 'FA', 'FF%', 'FF% rel',
+                   'oiSH%', 'oiSV%', 'PDO', 'oZS%', 'dZS%', 'TOI/60', 'TOI(EV)', 'TK', 'GV', 'E+/-', 'SAtt.', 'Thru%']
+teams = ['ANA', 'BOS', 'BUF', 'CAR', 'CBJ', 'CGY', 'CHI', 'COL', 'DAL', 'DET', 'EDM', 'FLA', 'LA', 'MIN', 'MTL', 'NJ',
+         'NSH', 'NYI', 'NYR', 'OTT', 'PHI', 'PIT', 'SJ', 'STL', 'TB', 'TOR', 'VAN', 'VGK', 'WPG', 'WSH']
+positions = ['C', 'LW', 'RW', 'D']
+
+
+def generate_seasons(directory: str, player_seasons: int, seasons: int = 10, start_year: int = 2000,
+                     seed: int = 0) -> list:
+    """
+    generate synthetic basic and advanced season files
+    :param directory: output directory. Files are written to {directory}/basic/{year}.csv and
+           {directory}/advanced/{year}.csv
+    :param player_seasons: approximate total number of player seasons to generate
+    :param seasons: the number of seasons
+    :param start_year: the first season
+    :param seed: random seed
+    :return: list of the generated years
+    """
+    rng = np.random.default_rng(seed)
+    players = int(np.ceil(player_seasons / seasons / 0.8))
+    player_positions = rng.choice(positions, players)
+    player_teams = rng.choice(teams, players)
+    scoring = rng.gamma(2.0, 0.15, players)
+    years = list(range(start_year, start_year + seasons))
+    os.makedirs(os.path.join(directory, 'basic'), exist_ok=True)
+    os.makedirs(os.path.join(directory, 'advanced'), exist_ok=True)
+    for year in years:
+        ids = np.flatnonzero(rng.random(players) < 0.8)
+        count = len(ids)
+        names = np.char.add('Player ', ids.astype(str))
+        games = rng.integers(1, 83, count)
+        goals = rng.poisson(scoring[ids] * games * 0.4)
+        assists = rng.poisson(scoring[ids] * games * 0.6)
+        power_play_goals = rng.binomial(goals, 0.25)
+        power_play_assists = rng.binomial(assists, 0.25)
+        basic = pd.DataFrame({
+            'name': names, 'team': player_teams[ids], 'pos': player_positions[ids], 'games': games, 'g': goals,
+            'a': assists, 'pts': goals + assists, 'plus_minus': rng.integers(-30, 31, count),
+            'pim': rng.poisson(0.4 * games), 'sog': rng.poisson((scoring[ids] + 1.0) * games * 1.5),
+            'gwg': rng.binomial(goals, 0.15), 'ppg': power_play_goals, 'ppa': power_play_assists,
+            'shg': rng.binomial(goals, 0.03), 'sha': rng.binomial(assists, 0.03), 'hits': rng.poisson(1.2 * games),
+            'bs': rng.poisson(0.8 * games)})
+        basic.to_csv(os.path.join(directory, 'basic', '{}.csv'.format(year)), header=basic_header, index=False,
+                     encoding='utf-8-sig')
+        corsi_for = rng.poisson(15 * games)
+        corsi_against = rng.poisson(15 * games)
+        fenwick_for = rng.binomial(corsi_for, 0.75)
+        fenwick_against = rng.binomial(corsi_against, 0.75)
+        toi = rng.integers(480, 1500, count)
+        advanced = pd.DataFrame({
+            'rk': np.arange(1, count + 1), 'player': np.char.add(np.char.add(names, '\\'), ids.astype(str)),
+            'age': rng.integers(18, 40, count), 'tm': player_teams[ids], 'pos': player_positions[ids], 'gp': games,
+            'cf': corsi_for, 'ca': corsi_against,
+            'cf_pct': (100 * corsi_for / np.maximum(corsi_for + corsi_against, 1)).round(1),
+            'cf_rel': rng.normal(0, 4, count).round(1), 'ff': fenwick_for, 'fa': fenwick_against,
+            'ff_pct': (100 * fenwick_for / np.maximum(fenwick_for + fenwick_against, 1)).round(1),
+            'ff_rel': rng.normal(0, 4, count).round(1), 'sh_pct': rng.normal(8, 2, count).round(1),
+            'sv_pct': rng.normal(91, 2, count).round(1), 'pdo': rng.normal(99, 2, count).round(1),
+            'ozs': rng.uniform(30, 70, count).round(1), 'dzs': rng.uniform(30, 70, count).round(1),
+            'toi_60': np.char.add(np.char.add((toi // 60).astype(str), ':'), np.char.zfill((toi % 60).astype(str), 2)),
+            'toi_ev': np.char.add(np.char.add((toi // 75).astype(str), ':'), np.char.zfill((toi % 60).astype(str), 2)),
+            'tk': rng.poisson(0.3 * games), 'gv': rng.poisson(0.4 * games), 'ev_pm': rng.normal(0, 5, count).round(1),
+            'satt': rng.poisson(2.5 * games), 'thru': rng.uniform(40, 75, count).round(1)})
+        advanced.to_csv(os.path.join(directory, 'advanced', '{}.csv'.format(year)), header=advanced_header, index=False)
+    return years
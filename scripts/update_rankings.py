@@ -0,0 +1,25 @@
+"""
+    @file update_rankings.py
+    @brief parse the raw expert rankings and rebuild the curated and aggregate ranking files
+    @author Graham Riches
+    @details
+    Thin wrapper around analysis.rankings_ingest. Paths are resolved from the repository root, so the script can be
+    run from any directory:
+        python scripts/update_rankings.py [--workers N] [--sources dobber nhl ...]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis.rankings_ingest import ingest_rankings, parsers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='rebuild the curated expert rankings')
+    parser.add_argument('--sources', nargs='*', choices=list(parsers), default=None)
+    parser.add_argument('--workers', type=int, default=None, help='number of parser processes')
+    args = parser.parse_args()
+    aggregate = ingest_rankings(sources=args.sources, workers=args.workers)
+    print('aggregated {} players from {} sources'.format(len(aggregate), aggregate['sources'].max()))
@@ -0,0 +1,22 @@
+"""
+    @file conftest.py
+    @brief shared fixtures for the analysis tests
+    @author Graham Riches
+"""
+import os
+import pytest
+from analysis.stats_engine import StatsEngine
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+basic_path = os.path.join(repo_root, 'data', 'skaters', 'basic', '{}.csv')
+advanced_path = os.path.join(repo_root, 'data', 'skaters', 'advanced', '{}.csv')
+
+
+@pytest.fixture
+def engine() -> StatsEngine:
+    """
+    columnar engine with the 2018 and 2019 skater seasons loaded
+    """
+    stats_engine = StatsEngine(columnar=True)
+    stats_engine.add_skaters_from_csv([2018, 2019], basic_path, advanced_path, workers=1)
+    return stats_engine
@@ -0,0 +1,39 @@
+"""
+    @file test_backtest.py
+    @brief back-test the registered projection models on the shipped seasons
+    @author Graham Riches
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from analysis.backtest import backtest
+from analysis.models import create_model
+from analysis.stats_engine import StatsEngine
+from conftest import basic_path, advanced_path
+
+categories = ['games_played', 'goals', 'assists', 'shots_on_goal']
+seasons = [2016, 2017, 2018, 2019]
+
+
+@pytest.fixture(scope='module')
+def history() -> StatsEngine:
+    engine = StatsEngine(columnar=True)
+    engine.add_skaters_from_csv([2015] + seasons, basic_path, advanced_path, workers=1)
+    engine.drop_by_games_played(25)
+    return engine
+
+
+@pytest.mark.parametrize('name', ['weighted_average', 'experience_adjusted', 'regression_to_mean'])
+def test_backtest_errors_are_finite(history, name):
+    result = backtest(history, create_model(name), seasons, categories, batch=True)
+    assert list(result.columns) == ['mae', 'rmse', 'rank_correlation', 'count']
+    positions = result.index.get_level_values('position').unique().tolist()
+    assert positions[0] == 'all'
+    assert {'C', 'D', 'LW', 'RW'} <= set(positions)
+    assert result.index.equals(pd.MultiIndex.from_product([positions, categories], names=['position', 'category']))
+    overall = result.loc['all']
+    main = result.loc[['all', 'C', 'D', 'LW', 'RW']]
+    assert np.isfinite(main[['mae', 'rmse', 'rank_correlation']].to_numpy()).all()
+    assert (overall['rmse'] >= overall['mae']).all()
+    assert (overall['count'] > 0).all()
+    assert (result['count'] <= overall['count'].iloc[0]).all()
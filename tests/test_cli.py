@@ -0,0 +1,59 @@
+"""
+    @file test_cli.py
+    @brief tests for the command line rank and top subcommands
+    @author Graham Riches
+"""
+import os
+import shutil
+import pytest
+from analysis.cli import main
+from analysis.rankings_export import snapshots
+from conftest import repo_root
+
+
+@pytest.fixture
+def options(tmp_path) -> list:
+    return ['--export-dir', str(tmp_path / 'exports'), '--cache-dir', str(tmp_path / 'cache'), '--workers', '1']
+
+
+def test_top_filters_by_team(options, capsys):
+    assert main(['rank'] + options) == 0
+    capsys.readouterr()
+    assert main(['top', '-n', '5', '--team', 'WAS', '--columns', 'position', 'team'] + options) == 0
+    rows = capsys.readouterr().out.splitlines()[1:]
+    assert len(rows) == 5
+    assert all(row.split()[-1] == 'WAS' for row in rows)
+
+
+def test_top_of_a_position_without_rankings(options, capsys):
+    assert main(['rank'] + options) == 0
+    capsys.readouterr()
+    assert main(['top', '--position', 'X'] + options) == 0
+    assert capsys.readouterr().out.strip() == 'no X rankings for season 2020'
+
+
+def test_rank_only_exports_changed_seasons(options, tmp_path, capsys):
+    config = tmp_path / 'config.json'
+    shutil.copy(os.path.join(repo_root, 'config', 'config.json'), config)
+    options += ['--config', str(config)]
+    assert main(['rank'] + options) == 0
+    assert main(['rank'] + options) == 0
+    exports = str(tmp_path / 'exports')
+    assert len(snapshots(exports, 'rankings', 2018)) == 1
+    assert len(snapshots(exports, 'rankings', 2020)) == 2
+    config.write_text(config.read_text() + '\n')
+    assert main(['rank'] + options) == 0
+    assert len(snapshots(exports, 'rankings', 2018)) == 2
+    assert 'of rankings seasons 2015, 2016, 2017, 2018, 2019, 2020 ' in capsys.readouterr().out.splitlines()[-2]
+
+
+def test_top_goalies(options, capsys):
+    assert main(['rank'] + options) == 0
+    capsys.readouterr()
+    assert main(['top', '-n', '3', '--position', 'G', '--season', '2018'] + options) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ['player_name', 'team', 'wins', 'saves', 'shutouts', 'save_pct',
+                                'goals_against_average', 'fantasy_points_z']
+    assert len(lines) == 4
+    scores = [float(line.split()[-1]) for line in lines[1:]]
+    assert scores == sorted(scores, reverse=True)
@@ -0,0 +1,48 @@
+"""
+    @file test_draft.py
+    @brief tests for the live draft engine and mock drafts
+    @author Graham Riches
+"""
+import json
+import os
+import numpy as np
+import pytest
+from analysis.draft import DraftEngine, simulate_drafts
+from conftest import repo_root
+
+
+@pytest.fixture
+def draft(engine) -> DraftEngine:
+    with open(os.path.join(repo_root, 'config', 'config.json')) as json_file:
+        config = json.load(json_file)
+    rankings = engine.rank_by_year(2019, config['stats_categories'], config['display_categories'],
+                                   config['fantasy_categories'], config['positional_adjustments'])
+    return DraftEngine(rankings, config['fantasy_categories'], config['positional_adjustments'],
+                       {'C': 1, 'D': 1, 'BN': 1}, 4)
+
+
+def test_simulation_keeps_the_live_draft(draft):
+    first = draft.players[draft.best_pick()]
+    draft.pick(first)
+    draft.pick(draft.best_pick())
+    picks = list(draft.picks)
+    available = draft.available.copy()
+    open_slots = draft.open_slots.copy()
+    values = draft.values()
+
+    results = simulate_drafts(draft, 8, seed=0, workers=1)
+    assert draft.picks == picks
+    np.testing.assert_array_equal(draft.available, available)
+    np.testing.assert_array_equal(draft.open_slots, open_slots)
+    np.testing.assert_array_equal(draft.values(), values)
+    # picks already made are respected by every mock draft
+    assert results.loc[first, 'drafted_pct'] == 100.0
+    assert results.loc[first, 'min_pick'] == results.loc[first, 'max_pick'] == 1
+
+
+def test_pick_after_the_last_pick_raises(draft):
+    for _ in range(draft.teams * draft.rounds):
+        draft.pick(draft.best_pick())
+    assert draft.on_the_clock() == -1
+    with pytest.raises(ValueError, match='complete'):
+        draft.pick(draft.best_available(1).index[0])
@@ -0,0 +1,34 @@
+"""
+    @file test_models.py
+    @brief tests for the projection model registry and its cache
+    @author Graham Riches
+"""
+import os
+import numpy as np
+from analysis.models import ProjectionCache, create_model, kernel_fingerprint, models
+
+
+def test_key_depends_on_kernel_code_and_version():
+    kernel = models['weighted_average'][0]
+    assert kernel_fingerprint(kernel, 1) != kernel_fingerprint(kernel, 2)
+    assert kernel_fingerprint(kernel, 1) != kernel_fingerprint(models['experience_adjusted'][0], 1)
+
+    model = create_model('weighted_average')
+    stats, mask = np.ones((2, 3, 1)), np.ones((2, 3), dtype=bool)
+    key = model.key(stats, mask, dict())
+    assert key == create_model('weighted_average').key(stats, mask, dict())
+    model.fingerprint = kernel_fingerprint(kernel, 2)
+    assert model.key(stats, mask, dict()) != key
+
+
+def test_disk_cache_is_bounded(tmp_path):
+    cache = ProjectionCache(str(tmp_path), size=1, disk_size=2)
+    for idx, key in enumerate(['a', 'b']):
+        cache.put(key, np.full(3, idx, dtype=np.float64))
+        os.utime(tmp_path / '{}.npy'.format(key), (idx, idx))
+    assert cache.get('a') is not None  # reading a result marks it as recently used
+    cache.put('c', np.zeros(3))
+    assert sorted(os.listdir(tmp_path)) == ['a.npy', 'c.npy']
+    reloaded = ProjectionCache(str(tmp_path), size=1, disk_size=2)
+    assert reloaded.get('b') is None
+    np.testing.assert_array_equal(reloaded.get('a'), np.zeros(3))
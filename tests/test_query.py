@@ -0,0 +1,28 @@
+"""
+    @file test_query.py
+    @brief tests for the lazy season query planner
+    @author Graham Riches
+"""
+
+
+def test_filter_after_top_is_not_pushed_into_the_scan(engine):
+    query = engine.query(2019).select('position', 'goals').top(10, 'goals').filter('position', '==', 'D')
+    assert query.plan().pushed == []
+    top_scorers = engine.query(2019).select('position', 'goals').top(10, 'goals').collect()
+    result = query.collect()
+    assert list(result.index) == list(top_scorers.index[top_scorers['position'] == 'D'])
+    assert len(result) == 0
+
+
+def test_filter_before_top_is_pushed_into_the_scan(engine):
+    query = engine.query(2019).select('position', 'goals').filter('position', '==', 'D').top(10, 'goals')
+    assert query.plan().pushed == [('position', '==', 'D')]
+    result = query.collect()
+    assert len(result) == 10
+    assert (result['position'] == 'D').all()
+
+
+def test_filter_after_sort_is_pushed_into_the_scan(engine):
+    query = engine.query(2019).select('position', 'goals').sort('goals').filter('position', '==', 'D')
+    assert query.plan().pushed == [('position', '==', 'D')]
+    assert (query.collect()['position'] == 'D').all()
@@ -0,0 +1,66 @@
+"""
+    @file test_rankings_export.py
+    @brief tests for the partitioned rankings export
+    @author Graham Riches
+"""
+import os
+import pandas as pd
+import pytest
+from analysis.rankings_export import latest_manifest, read_rankings, snapshot_id, snapshots, write_partitions
+
+
+@pytest.fixture
+def ranking() -> pd.DataFrame:
+    return pd.DataFrame({'position': ['C', 'D', 'C/LW', 'RW'], 'goals': [40, 10, 30, 20],
+                         'fantasy_points_z': [0.4, 0.3, 0.2, 0.1]},
+                        index=pd.Index(['A', 'B', 'C', 'D'], name='player_name'))
+
+
+def test_round_trip_with_partition_and_column_selection(ranking, tmp_path):
+    write_partitions(ranking, str(tmp_path), 'rankings', 2020, 'first')
+    result = read_rankings(str(tmp_path), seasons=[2020])
+    assert list(result.index) == ['A', 'B', 'C', 'D']
+    assert list(result['position']) == ['C', 'D', 'C/LW', 'RW']
+    centres = read_rankings(str(tmp_path), positions=['C'], columns=['goals'])
+    assert list(centres.index) == ['A', 'C']
+    assert list(centres.columns) == ['season', 'snapshot', 'rank', 'goals']
+
+
+def test_snapshots_are_appended(ranking, tmp_path):
+    write_partitions(ranking, str(tmp_path), 'rankings', 2020, 'first')
+    write_partitions(ranking.iloc[:2], str(tmp_path), 'rankings', 2020, 'second')
+    assert snapshots(str(tmp_path), 'rankings') == ['first', 'second']
+    assert list(read_rankings(str(tmp_path)).index) == ['A', 'B']
+    assert len(read_rankings(str(tmp_path), snapshot='first')) == 4
+    with pytest.raises(FileExistsError):
+        write_partitions(ranking, str(tmp_path), 'rankings', 2020, 'first')
+
+
+def test_snapshot_without_manifest_is_not_read(ranking, tmp_path):
+    write_partitions(ranking, str(tmp_path), 'rankings', 2020, 'first')
+    write_partitions(ranking.iloc[:2], str(tmp_path), 'rankings', 2020, 'second')
+    # a writer that has placed its position partitions but not yet published the manifest
+    os.remove(tmp_path / 'rankings' / 'season=2020' / '_snapshots' / 'second.json')
+    assert snapshots(str(tmp_path), 'rankings') == ['first']
+    result = read_rankings(str(tmp_path))
+    assert list(result.index) == ['A', 'B', 'C', 'D']
+    assert set(result['snapshot']) == {'first'}
+
+
+def test_default_snapshot_ids_are_unique(ranking, tmp_path):
+    first = write_partitions(ranking, str(tmp_path), 'rankings', 2020)
+    second = write_partitions(ranking, str(tmp_path), 'rankings', 2020)
+    assert first != second
+    assert snapshots(str(tmp_path), 'rankings') == sorted([first, second])
+    assert snapshot_id() > second
+
+
+def test_latest_is_the_most_recently_written_snapshot(ranking, tmp_path):
+    write_partitions(ranking, str(tmp_path), 'rankings', 2020, 'zzz')
+    write_partitions(ranking.iloc[:2], str(tmp_path), 'rankings', 2020, 'aaa', inputs='digest')
+    assert snapshots(str(tmp_path), 'rankings') == ['zzz', 'aaa']
+    assert set(read_rankings(str(tmp_path))['snapshot']) == {'aaa'}
+    assert latest_manifest(str(tmp_path), 'rankings', 2020)['inputs'] == 'digest'
+    assert latest_manifest(str(tmp_path), 'rankings', 2019) is None
+    with pytest.raises(ValueError):
+        write_partitions(ranking, str(tmp_path), 'rankings', 2020, 'latest')
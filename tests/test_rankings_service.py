@@ -0,0 +1,83 @@
+"""
+    @file test_rankings_service.py
+    @brief tests for the rankings query service
+    @author Graham Riches
+"""
+import asyncio
+import logging
+import os
+import shutil
+import pytest
+from analysis.models import create_model
+from analysis.rankings_service import RankingsService
+from conftest import repo_root
+
+
+@pytest.fixture
+def service(tmp_path) -> RankingsService:
+    for kind in ('basic', 'advanced'):
+        os.makedirs(tmp_path / 'data' / 'skaters' / kind)
+        for year in (2018, 2019):
+            shutil.copy(os.path.join(repo_root, 'data', 'skaters', kind, '{}.csv'.format(year)),
+                        tmp_path / 'data' / 'skaters' / kind)
+    shutil.copy(os.path.join(repo_root, 'config', 'config.json'), tmp_path / 'config.json')
+    rankings = RankingsService(str(tmp_path / 'data'), str(tmp_path / 'config.json'), create_model('weighted_average'))
+    rankings.load()
+    return rankings
+
+
+@pytest.mark.parametrize('n', ['-5', 'abc', '2.5', ''])
+def test_top_rejects_invalid_n(service, n):
+    status, payload = service.query('/top', {'season': '2020', 'n': n})
+    assert status == 400
+    assert 'n must be' in payload['error']
+
+
+def test_top_limits_rows(service):
+    status, payload = service.query('/top', {'season': '2020', 'n': '5'})
+    assert status == 200
+    assert [record['rank'] for record in payload] == [1, 2, 3, 4, 5]
+
+
+def test_new_season_and_config_changes_are_detected(service, tmp_path):
+    assert sorted(service.index.seasons) == [2018, 2019, 2020]
+    stamp = service.snapshot()
+    assert stamp == service.stamp
+    for kind in ('basic', 'advanced'):
+        shutil.copy(os.path.join(repo_root, 'data', 'skaters', kind, '2017.csv'), tmp_path / 'data' / 'skaters' / kind)
+    assert service.snapshot() != stamp
+    service.load()
+    assert sorted(service.index.seasons) == [2017, 2018, 2019, 2020]
+
+    stamp = service.snapshot()
+    os.utime(tmp_path / 'config.json', ns=(0, os.stat(tmp_path / 'config.json').st_mtime_ns + 10 ** 9))
+    assert service.snapshot() != stamp
+
+
+def test_watcher_survives_a_failed_reload(service, tmp_path, caplog):
+    service.poll_interval = 0.01
+    config = (tmp_path / 'config.json').read_text()
+    seasons = service.index.seasons
+
+    async def run() -> None:
+        watcher = asyncio.create_task(service.watch())
+        (tmp_path / 'config.json').write_text('{}')  # valid json, missing every key
+        for _ in range(500):
+            await asyncio.sleep(0.01)
+            if 'rankings reload failed' in caplog.text:
+                break
+        assert not watcher.done()
+        assert service.index.seasons is seasons
+        (tmp_path / 'config.json').write_text(config)
+        os.utime(tmp_path / 'config.json', ns=(0, os.stat(tmp_path / 'config.json').st_mtime_ns + 10 ** 9))
+        for _ in range(500):
+            await asyncio.sleep(0.01)
+            if service.index.seasons is not seasons:
+                break
+        watcher.cancel()
+
+    with caplog.at_level(logging.ERROR, logger='analysis.rankings_service'):
+        asyncio.run(run())
+    assert 'KeyError' in caplog.text
+    assert service.index.seasons is not seasons
+    assert sorted(service.index.seasons) == [2018, 2019, 2020]
@@ -0,0 +1,33 @@
+"""
+    @file test_shared_store.py
+    @brief tests for publishing and attaching shared engine snapshots
+    @author Graham Riches
+"""
+import numpy as np
+import pandas as pd
+from analysis.models import create_model
+from analysis.stats_engine import StatsEngine
+from conftest import basic_path
+
+
+def test_attached_engine_copies_on_write(engine, tmp_path):
+    path = str(tmp_path / 'engine.stats')
+    engine.publish(path)
+    attached = StatsEngine.attach(path)
+    before = attached.get_stats_by_year(2019).copy()
+
+    # reloading a season only updates existing rows, so the arrays are not grown
+    attached.add_basic_skater_from_csv(basic_path.format(2019), 2019)
+    pd.testing.assert_frame_equal(attached.get_stats_by_year(2019), before)
+    assert all(array.flags.writeable for array in attached.store._arrays().values())
+
+    # projecting a season twice rewrites the same rows
+    model = create_model('weighted_average')
+    attached.project_stats_batch(2020, model)
+    attached.project_stats_batch(2020, model)
+    assert len(attached.get_stats_by_year(2020))
+
+    fresh = StatsEngine.attach(path)
+    assert 2020 not in fresh.store.seasons()
+    assert not any(array.flags.writeable for array in fresh.store._arrays().values() if len(array))
+    np.testing.assert_array_equal(fresh.store.season[:fresh.store.size], engine.store.season[:engine.store.size])
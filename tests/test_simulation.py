@@ -0,0 +1,29 @@
+"""
+    @file test_simulation.py
+    @brief tests for the Monte Carlo projection simulation
+    @author Graham Riches
+"""
+import numpy as np
+import pandas as pd
+from analysis.models import create_model
+
+categories = ['goals', 'assists', 'shots_on_goal']
+
+
+def test_simulation_is_reproducible_and_sorted_by_median(engine):
+    model = create_model('weighted_average')
+    first = engine.simulate_projections(2020, model, categories, [4.0, 3.0], simulations=64, chunk_size=16, seed=7)
+    second = engine.simulate_projections(2020, model, categories, [4.0, 3.0], simulations=64, chunk_size=16, seed=7,
+                                         workers=1)
+    pd.testing.assert_frame_equal(first, second)
+    median = first['fantasy_points_z_p50'].dropna().to_numpy()
+    assert np.all(median[:-1] >= median[1:])
+    assert ((first['ranked_pct'] >= 0) & (first['ranked_pct'] <= 100)).all()
+
+
+def test_simulation_without_percentiles_sorts_by_mean(engine):
+    model = create_model('weighted_average')
+    result = engine.simulate_projections(2020, model, categories, [4.0, 3.0], simulations=32, percentiles=[], seed=1)
+    assert not [column for column in result.columns if column.startswith('fantasy_points_z_p')]
+    mean = result['fantasy_points_z_mean'].dropna().to_numpy()
+    assert len(mean) and np.all(mean[:-1] >= mean[1:])